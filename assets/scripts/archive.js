@@ -10,6 +10,8 @@ Array.prototype.containsBS = function (target) {
     return false;
 };
 
+decodeColumnarData();
+
 function openTab(tile, tab) {
     document.querySelectorAll('.navigation-tile, .content-container').forEach(e => e.classList.remove('selected'));
     tile.classList.add('selected');
@@ -27,6 +29,10 @@ function makeAddress(address) {
 }
 
 function selectStop(stopPreview, ctrl) {
+    Promise.all(['stops', 'lines'].map(name => loadShards(name))).then(() => showStop(stopPreview, ctrl));
+}
+
+function showStop(stopPreview, ctrl) {
     ctrl.stopDetails.classList.remove('hidden');
     const stopId = stopPreview.getAttribute('data-stop-id');
     const stop = stops[stopId];
@@ -50,6 +56,10 @@ function selectStop(stopPreview, ctrl) {
 }
 
 function selectLine(linePreview, ctrl) {
+    Promise.all(['lines', 'stops'].map(name => loadShards(name))).then(() => showLine(linePreview, ctrl));
+}
+
+function showLine(linePreview, ctrl) {
     ctrl.lineDetails.classList.remove('hidden');
     ctrl.lineNumberLabel.parentElement.classList.remove('hidden');
     const lineNumber = linePreview.getAttribute('data-line-number');
@@ -100,6 +110,10 @@ function selectLine(linePreview, ctrl) {
 }
 
 function selectVehicle(vehiclePreview, ctrl) {
+    Promise.all(['vehicles'].map(name => loadShards(name))).then(() => showVehicle(vehiclePreview, ctrl));
+}
+
+function showVehicle(vehiclePreview, ctrl) {
     ctrl.vehicleDetails.classList.remove('hidden');
     const vehicleId = vehiclePreview.getAttribute('data-vehicle-id');
     const vehicle = vehicles[vehicleId];
@@ -8,4 +8,76 @@ function cropSVG(svgImage, margin) {
     svgImage.setAttribute("viewBox", `${bbox.x - margin} ${bbox.y - margin} ${bbox.width + 2 * margin} ${bbox.height + 2 * margin}`);
     svgImage.setAttribute("width", bbox.width + 2 * margin);
     svgImage.setAttribute("height", bbox.height + 2 * margin);
-}
\ No newline at end of file
+}
+function decodePolyline(encoded, precision = 6) {
+    const factor = 10 ** precision;
+    const points = [];
+    const coordinates = [0, 0];
+    let index = 0;
+    while (index < encoded.length) {
+        for (let axis = 0; axis < 2; axis++) {
+            let value = 0, shift = 0, chunk;
+            do {
+                chunk = encoded.charCodeAt(index++) - 63;
+                value |= (chunk & 0x1f) << shift;
+                shift += 5;
+            } while (chunk >= 0x20);
+            coordinates[axis] += value & 1 ? ~(value >> 1) : value >> 1;
+        }
+        points.push([coordinates[0] / factor, coordinates[1] / factor]);
+    }
+    return points;
+}
+
+function decodeColumnarData() {
+    // data files compiled with --columnar-data push parallel columns, whose interned columns refer to a string table
+    // and whose dictionary columns refer to a table of distinct values
+    if (typeof columnarData === 'undefined') return;
+    columnarData.splice(0).forEach(([targets, {s: strings, d: datasets}]) => {
+        const resolve = value => {
+            if (typeof value === 'number') return strings[value];
+            for (let i = 0; i < value.length; i++) value[i] = resolve(value[i]);
+            return value;
+        };
+        datasets.forEach(({k: keys, c: columns, i: interned, t: dictionaries}, index) => {
+            const target = targets[index];
+            const fields = Object.keys(columns);
+            const values = fields.map(field => columns[field]);
+            const references = fields.map(field => interned.includes(field) && !(field in dictionaries));
+            const tables = fields.map(field => field in dictionaries
+                ? (interned.includes(field) ? dictionaries[field].map(resolve) : dictionaries[field]) : null);
+            for (let row = 0; row < keys.length; row++) {
+                const entry = {};
+                for (let f = 0; f < fields.length; f++) {
+                    const value = values[f][row];
+                    if (value == null) continue;
+                    entry[fields[f]] = tables[f] ? tables[f][value] : references[f] ? resolve(value) : value;
+                }
+                target[typeof keys[row] === 'number' ? strings[keys[row]] : keys[row]] = entry;
+            }
+        });
+    });
+}
+
+const loadedShards = {};
+
+function loadShards(name, shards = null) {
+    // data files compiled with --shard-data only declare their objects, and the pages load the shard scripts which
+    // fill them in once they need the entries, either all of them or the named shards only
+    const manifest = (typeof dataShards === 'undefined' ? {} : dataShards)[name] || {};
+    const paths = (shards ? shards.map(shard => manifest[shard.replace(/[^\w-]/g, '_')]) : Object.values(manifest))
+        .filter(path => path);
+    return Promise.all(paths.map(path => loadedShards[path] ||= new Promise((resolve, reject) => {
+        const script = document.createElement('script');
+        script.src = path;
+        script.onload = () => {
+            decodeColumnarData();
+            resolve();
+        };
+        script.onerror = () => {
+            delete loadedShards[path];
+            reject(new Error(`could not load ${path}`));
+        };
+        document.head.appendChild(script);
+    })));
+}
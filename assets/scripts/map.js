@@ -11,8 +11,97 @@ const lightModeIcon = 'assets/images/light_mode.png';
 const darkModeIcon = 'assets/images/dark_mode.png';
 
 const compiledRearchResultTemplate = nunjucks.compile(searchResultTemplate);
+const compiledStopPopupTemplate = nunjucks.compile(stopPopupTemplate);
 let searchAbortController = null;
 
+decodeColumnarData();
+
+function stopIcon(stop, marker, regions) {
+    const visits = stop.v || [];
+    const classes = ['marker'].concat(
+        visits.map(([player]) => `v-${player.toLowerCase()}`),
+        visits.filter(([, date]) => !date).map(([player]) => `ev-${player.toLowerCase()}`),
+        regions ? regions.split(' ').map(region => `r-${region}`) : [],
+        (stop.tp || []).map(([, player]) => `tp-${player.toLowerCase()}`));
+    return `<div class="${classes.join(' ')}">${marker}</div>`;
+}
+
+function pathPane(map, className) {
+    // line paths of each kind get their own pane, so that the draw order does not depend on the loading order
+    const kind = ['compl', 'disc', 'undiscovered'].find(k => className.split(' ').includes(k));
+    if (!kind) return 'overlayPane';
+    if (!map.getPane(`paths-${kind}`)) {
+        map.createPane(`paths-${kind}`).style.zIndex = {undiscovered: 401, disc: 402, compl: 403}[kind];
+    }
+    return `paths-${kind}`;
+}
+
+let detailedPaths = null;
+
+function updatePathDetail(map, path) {
+    // a point of rank r is only drawn above the zoom of the r-th simplification band
+    const rank = path.detail.filter(zoom => map.getZoom() > zoom).length;
+    const points = path.points.filter((_, i) => Number(path.ranks[i]) <= rank);
+    if (points.length !== path.layer.getLatLngs().length) path.layer.setLatLngs(points);
+}
+
+function loadMapData(map, data) {
+    if (!detailedPaths) {
+        detailedPaths = [];
+        map.on('zoomend', () => detailedPaths.forEach(path => updatePathDetail(map, path)));
+    }
+    if (data.stops && data.stops.length > 0) {
+        // stops are sharded by their first region, so only the shards of the regions placed here are loaded
+        const regionShards = new Set(data.stops.map(([, , regions]) => regions ? regions.split(' ')[0] : 'other'));
+        loadShards('stops', [...regionShards]).then(() => {
+            data.stops.forEach(([id, marker, regions]) => {
+                const stop = stops[id];
+                L.marker([stop.lt, stop.ln], {icon: L.divIcon({className: 'empty', html: stopIcon(stop, marker, regions), iconAnchor: [12, 16]})})
+                    .bindPopup(() => `<div>${compiledStopPopupTemplate.render({key: id, stop: stop})}</div>`, {maxWidth: '100%'})
+                    .addTo(map);
+            });
+            if (document.readyState !== 'loading') refreshMap();
+        });
+    }
+    data.markers.forEach(([lat, lon, icon, popup, anchor]) => {
+        L.marker([lat, lon], {icon: L.divIcon({className: 'empty', html: icon, iconAnchor: [anchor, 16]})})
+            .bindPopup(L.popup({maxWidth: '100%'}).setContent(`<div>${popup}</div>`))
+            .addTo(map);
+    });
+    data.paths.forEach(([className, weight, encoded, ranks]) => {
+        const points = decodePolyline(encoded);
+        const layer = L.polyline(points, {className: className, weight: weight, fill: false, fillOpacity: 0,
+                                          bubblingMouseEvents: false, pane: pathPane(map, className)});
+        if (ranks && data.detail) {
+            const path = {layer: layer, points: points, ranks: ranks, detail: data.detail};
+            detailedPaths.push(path);
+            updatePathDetail(map, path);
+        }
+        layer.addTo(map);
+    });
+}
+
+function loadMapTiles(map, index) {
+    const requested = new Set();
+    const loadVisibleTiles = () => {
+        const view = map.getBounds().pad(0.25);
+        index.tiles
+            .filter(([id, south, west, north, east]) => !requested.has(id) && view.intersects([[south, west], [north, east]]))
+            .forEach(([id]) => {
+                requested.add(id);
+                fetch(`${index.path}/${id}.json`)
+                    .then(response => response.json())
+                    .then(data => {
+                        loadMapData(map, {...data, detail: index.detail});
+                        if (document.readyState !== 'loading') refreshMap();
+                    })
+                    .catch(() => requested.delete(id));
+            });
+    };
+    map.on('moveend', loadVisibleTiles);
+    loadVisibleTiles();
+}
+
 function injectThemeSwitcher() {
     let zoomControl = document.querySelector('.leaflet-control-zoom');
     let icon = document.createElement('img');
@@ -257,6 +346,8 @@ async function searchObject() {
         if (playerDiscovery.length === 0) return 'locked';
         return playerDiscovery[0][1].length > 0 ? 'unlocked' : 'partial';
     }
+    await Promise.all(['stops', 'lines', 'vehicles'].map(name => loadShards(name)));
+    if (signal.aborted) return;
     searchDictionary(stops, 'stop', (key) => getDiscoveryState(stops[key].v),
         (key) => [key, stops[key].n]);
     searchDictionary(lines, 'line', (key) => getDiscoveryState(lines[key].d),
@@ -1,7 +1,9 @@
 from __future__ import annotations
+import events
 from abc import abstractmethod
 from bs4 import BeautifulSoup
 from concurrent.futures import as_completed, Future, ThreadPoolExecutor
+from contextvars import copy_context
 from data import __read_collection__
 from data import *
 from date import DateAndOrder
@@ -233,10 +235,15 @@ class ZTMArticleScraper(ArticleScraper):
         return ArticleScraper.postprocess_html(content_container.get_attribute('innerHTML'))
 
 
+def __advance__(pbar: tqdm, n: float) -> None:
+    pbar.update(n)
+    events.progress('fetch_announcements', pbar.n, pbar.total)
+
+
 def __fetch_article__(url: str, scrapper: type, announcements: list[Announcement], pbar: tqdm, mutex: Lock) -> None:
     browser: ArticleScraper = scrapper()
     with mutex:
-        pbar.update(0.5)
+        __advance__(pbar, 0.5)
     browser.open(url)
     try:
         announcement_id: str = browser.get_announcement_id()
@@ -253,7 +260,7 @@ def __fetch_article__(url: str, scrapper: type, announcements: list[Announcement
         error(f'Error while processing announcement at {url}: {type(e).__name__} - {e}')
     finally:
         with mutex:
-            pbar.update(0.5)
+            __advance__(pbar, 0.5)
 
 
 def fetch_announcements(db: Database) -> None:
@@ -267,25 +274,26 @@ def fetch_announcements(db: Database) -> None:
     mutex: Lock = Lock()
 
     browser: WebDriver = ArticleScraper.create_driver()
-    pbar.update(1)
+    __advance__(pbar, 1)
     mpk_article_urls: list[str] = MPKArticleScraper.get_articles(browser, ref.url_announcements_mpk)
-    pbar.update(0.5)
+    __advance__(pbar, 0.5)
     ztm_article_urls: list[str] = ZTMArticleScraper.get_articles(browser, ref.url_announcements_ztm_1)
-    pbar.update(0.5)
+    __advance__(pbar, 0.5)
     ztm_article_urls += ZTMArticleScraper.get_articles(browser, ref.url_announcements_ztm_2)
-    pbar.update(0.5)
+    __advance__(pbar, 0.5)
     ztm_article_urls += ZTMArticleScraper.get_articles(browser, ref.url_announcements_ztm_3)
-    pbar.update(0.5)
+    __advance__(pbar, 0.5)
     browser.quit()
 
     pbar.total = len(mpk_article_urls) + len(ztm_article_urls) + 3
     pbar.refresh()
     announcements: list[Announcement] = []
     with ThreadPoolExecutor(max_workers=cpu_count()) as executor:
-        mpk_jobs: list[Future[None]] = [executor.submit(__fetch_article__, url, MPKArticleScraper, announcements, pbar, mutex)
-                                        for url in mpk_article_urls]
-        ztm_jobs: list[Future[None]] = [executor.submit(__fetch_article__, url, ZTMArticleScraper, announcements, pbar, mutex)
-                                        for url in ztm_article_urls]
+        # each job runs in a copy of the current context, so the errors it logs go to the error log of the pipeline run
+        mpk_jobs: list[Future[None]] = [executor.submit(copy_context().run, __fetch_article__, url, MPKArticleScraper,
+                                                        announcements, pbar, mutex) for url in mpk_article_urls]
+        ztm_jobs: list[Future[None]] = [executor.submit(copy_context().run, __fetch_article__, url, ZTMArticleScraper,
+                                                        announcements, pbar, mutex) for url in ztm_article_urls]
         for future in as_completed(mpk_jobs + ztm_jobs):
             future.result()
     announcements.sort(key=lambda a: (coalesce(a.date_from, a.date_published),
@@ -0,0 +1,244 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+from bisect import bisect_right
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable, Iterable, Iterator, MutableMapping
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library encoder is used as a fallback
+    orjson = None
+try:
+    import brotli
+except ImportError:  # brotli is optional, br is not offered without it
+    brotli = None
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, zstd is not offered without it
+    zstandard = None
+
+compression_threshold: int = 1024
+compressors: dict[str, Callable[[bytes], bytes]] = {
+    **({'zstd': lambda data: zstandard.ZstdCompressor(level=10).compress(data)} if zstandard is not None else {}),
+    **({'br': lambda data: brotli.compress(data, quality=9)} if brotli is not None else {}),
+    'gzip': lambda data: gzip.compress(data, compresslevel=6, mtime=0),
+}
+
+
+def encode_json(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def negotiate_encoding(accept_encoding: str | None, size: int) -> str | None:
+    if not accept_encoding or size < compression_threshold:
+        return None
+    accepted: dict[str, float] = {}
+    for entry in accept_encoding.split(','):
+        coding, _, params = entry.strip().partition(';')
+        quality: float = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    candidates: list[str] = [coding for coding in compressors
+                             if accepted.get(coding, accepted.get('*', 0.0)) > 0]
+    return max(candidates, key=lambda c: accepted.get(c, accepted.get('*', 0.0)), default=None)
+
+
+compressed_extensions: tuple[tuple[str, str], ...] = (('gzip', 'gz'), ('br', 'br'), ('zstd', 'zst'))
+
+
+def compression_outdated(path: str) -> bool:
+    modified: float = os.path.getmtime(path)
+    return any(not os.path.exists(f'{path}.{extension}') or os.path.getmtime(f'{path}.{extension}') < modified
+               for coding, extension in compressed_extensions if coding in compressors)
+
+
+def remove_compressed(path: str) -> list[str]:
+    removed: list[str] = [f'{path}.{extension}' for _, extension in compressed_extensions
+                          if os.path.exists(f'{path}.{extension}')]
+    for compressed in removed:
+        os.remove(compressed)
+    return removed
+
+
+def compress_file(path: str) -> list[str]:
+    with open(path, 'rb') as file:
+        data: bytes = file.read()
+    written: list[str] = []
+    for coding, extension in compressed_extensions:
+        if coding in compressors:
+            with open(f'{path}.{extension}', 'wb') as file:
+                file.write(compressors[coding](data))
+            written.append(f'{path}.{extension}')
+    return written
+
+
+class CachedResponse:
+    def __init__(self, version: int, body: bytes):
+        self.version: int = version
+        self.body: bytes = body
+        self.etag: str = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.__encoded__: dict[str, bytes] = {}
+        self.__mutex__: Lock = Lock()
+
+    def encoded(self, encoding: str | None) -> bytes:
+        if encoding is None:
+            return self.body
+        with self.__mutex__:
+            if encoding not in self.__encoded__:
+                self.__encoded__[encoding] = compressors[encoding](self.body)
+            return self.__encoded__[encoding]
+
+    def etag_for(self, encoding: str | None) -> str:
+        return f'{self.etag}-{encoding}' if encoding else self.etag
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.__entries__: OrderedDict[Hashable, CachedResponse] = OrderedDict()
+        self.__mutex__: Lock = Lock()
+        self.max_entries: int = max_entries
+        self.max_bytes: int = max_bytes
+        self.size: int = 0
+
+    def get(self, key: Hashable, version: int, producer: Callable[[], bytes]) -> CachedResponse:
+        with self.__mutex__:
+            cached: CachedResponse | None = self.__entries__.get(key)
+            if cached is not None and cached.version == version:
+                self.__entries__.move_to_end(key)
+                return cached
+        cached = CachedResponse(version, producer())
+        with self.__mutex__:
+            replaced: CachedResponse | None = self.__entries__.pop(key, None)
+            self.size += len(cached.body) - (len(replaced.body) if replaced is not None else 0)
+            self.__entries__[key] = cached
+            # query arguments are part of the key, so the least recently used responses are evicted to bound the cache
+            while len(self.__entries__) > self.max_entries or self.size > self.max_bytes:
+                self.size -= len(self.__entries__.popitem(last=False)[1].body)
+        return cached
+
+    def invalidate(self) -> None:
+        with self.__mutex__:
+            self.__entries__.clear()
+            self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries__)
+
+
+class Collection:
+    def __init__(self, data: Callable[[], Any], mapper: Callable[[Any], dict[str, Any]],
+                 key: Callable[[Any], str] | None = None):
+        self.data: Callable[[], Any] = data
+        self.mapper: Callable[[Any], dict[str, Any]] = mapper
+        self.key: Callable[[Any], str] | None = key
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        data: Any = self.data()
+        if isinstance(data, MutableMapping):
+            return {key: self.mapper(item) for key, item in data.items()}
+        return {self.key(item): self.mapper(item) for item in data}
+
+
+class EntryIndex:
+    def __init__(self, entries: Iterable[tuple[str, Any]], ordered: bool):
+        # mappings are paged in key order, lists keep their own order, e.g. a player's discoveries stay chronological
+        self.ordered: bool = ordered
+        self.entries: list[tuple[str, Any]] = sorted(entries, key=lambda entry: entry[0]) if ordered else list(entries)
+        self.positions: dict[str, int] = {} if ordered else {key: i for i, (key, _) in enumerate(self.entries)}
+
+    def after(self, key: str, position: int) -> int:
+        if self.ordered:
+            return bisect_right(self.entries, key, key=lambda entry: entry[0])
+        # the entries following a removed one have moved up by one, so the next of them is now at its position
+        return self.positions[key] + 1 if key in self.positions else min(position, len(self.entries))
+
+
+class EntryIndexes:
+    def __init__(self):
+        self.__indexes__: dict[Hashable, tuple[int, EntryIndex]] = {}
+        self.__mutex__: Lock = Lock()
+
+    def get(self, key: Hashable, version: int, index: Callable[[], EntryIndex]) -> EntryIndex:
+        with self.__mutex__:
+            cached: tuple[int, EntryIndex] | None = self.__indexes__.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        created: EntryIndex = index()
+        with self.__mutex__:
+            self.__indexes__[key] = (version, created)
+        return created
+
+    def invalidate(self) -> None:
+        with self.__mutex__:
+            self.__indexes__.clear()
+
+
+def entries_of(data: Any, key: Callable[[Any], str] | None = None) -> Iterable[tuple[str, Any]]:
+    if isinstance(data, MutableMapping):
+        return data.items()
+    if key is not None:
+        return ((key(item), item) for item in data)
+    return ((str(index), item) for index, item in enumerate(data))
+
+
+def select_fields(mapper: Callable[[Any], dict[str, Any]], fields: str | None) -> Callable[[Any], dict[str, Any]]:
+    if not fields:
+        return mapper
+    selected: set[str] = set(fields.split(','))
+    return lambda item: {field: value for field, value in mapper(item).items() if field in selected}
+
+
+def encode_cursor(key: str, position: int) -> str:
+    return base64.urlsafe_b64encode(f'{position}:{key}'.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    position, _, key = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8').partition(':')
+    return key, int(position)
+
+
+class Page:
+    def __init__(self, entries: list[tuple[str, Any]], next_cursor: str | None):
+        self.entries: list[tuple[str, Any]] = entries
+        self.next_cursor: str | None = next_cursor
+
+    def to_json(self, keyed: bool, mapper: Callable[[Any], dict[str, Any]]) -> dict[str, Any]:
+        items: dict[str, Any] | list[Any] = {key: mapper(item) for key, item in self.entries} if keyed \
+            else [mapper(item) for _, item in self.entries]
+        return {'items': items, 'next_cursor': self.next_cursor}
+
+
+def paginate(index: EntryIndex, cursor: str | None, limit: int) -> Page:
+    # a page resumes after the entry of its cursor, or where that entry was if it has been removed since
+    start: int = index.after(*decode_cursor(cursor)) if cursor else 0
+    page: list[tuple[str, Any]] = index.entries[start:start + limit]
+    return Page(page, encode_cursor(page[-1][0], start + limit - 1) if start + limit < len(index.entries) else None)
+
+
+def stream_json(entries: Iterable[tuple[str, Any]], keyed: bool, mapper: Callable[[Any], dict[str, Any]]) -> Iterator[bytes]:
+    yield b'{' if keyed else b'['
+    separator: bytes = b''
+    for key, item in entries:
+        yield separator
+        if keyed:
+            yield encode_json(key)
+            yield b':'
+        yield encode_json(mapper(item))
+        separator = b','
+    yield b'}' if keyed else b']'
+
+
+def stream_ndjson(entries: Iterable[tuple[str, Any]], mapper: Callable[[Any], dict[str, Any]]) -> Iterator[bytes]:
+    for _, item in entries:
+        yield encode_json(mapper(item))
+        yield b'\n'
@@ -0,0 +1,328 @@
+import json
+import os
+import ref
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracing
+import util
+from contextlib import contextmanager
+from datetime import datetime
+from log import enable_logging, log
+from typing import Any, Callable, Iterator
+
+__suites__: dict[str, Callable[[], dict[str, Any]]] = {}
+
+
+def suite(name: str) -> Callable[[Callable[[], dict[str, Any]]], Callable[[], dict[str, Any]]]:
+    def register(function: Callable[[], dict[str, Any]]) -> Callable[[], dict[str, Any]]:
+        __suites__[name] = function
+        return function
+
+    return register
+
+
+def measure(function: Callable[[], Any], repeat: int = 5, setup: Callable[[], Any] | None = None) -> dict[str, float]:
+    timings: list[float] = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start: float = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {'min_s': min(timings), 'mean_s': sum(timings) / len(timings), 'max_s': max(timings)}
+
+
+def scales(default: tuple[float, ...]) -> tuple[float, ...]:
+    value: str | None = os.environ.get('POKESTOPS_BENCHMARK_SCALES')
+    return tuple(map(float, value.split(','))) if value else default
+
+
+@contextmanager
+def isolated_directory(*shared: str) -> Iterator[str]:
+    origin: str = os.getcwd()
+    directory: str = tempfile.mkdtemp(prefix='pokestops-benchmark-')
+    try:
+        for path in shared:
+            os.makedirs(os.path.dirname(os.path.join(directory, path)) or directory, exist_ok=True)
+            os.symlink(os.path.abspath(path), os.path.join(directory, path))
+        os.chdir(directory)
+        yield directory
+    finally:
+        os.chdir(origin)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.check_output(('git', 'rev-parse', '--short', 'HEAD'), text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save_results(name: str, results: dict[str, Any]) -> str:
+    commit: str = current_commit()
+    output_path: str = f'{ref.report_benchmarks}/{name}-{commit}.json'
+    with open(util.prepare_path(output_path), 'w') as file:
+        json.dump({'suite': name, 'commit': commit, 'date': datetime.now().isoformat(timespec='seconds'),
+                   'results': results}, file, indent=2)
+    return output_path
+
+
+@suite('compression')
+def benchmark_compression() -> dict[str, Any]:
+    import api
+    from server import Server
+    server: Server = Server()
+    client = server.app.test_client()
+    endpoints: list[str] = ['/domain/stops', '/domain/vehicles', '/domain/lines', '/domain/carriers',
+                            *(f'/playerdata/stops?player={p.nickname}' for p in server.database.players)]
+    results: dict[str, Any] = {'endpoints': {}, 'artifacts': {}}
+    for endpoint in endpoints:
+        results['endpoints'][endpoint] = {}
+        for coding in (None, *api.compressors):
+            headers: dict[str, str] = {'Accept-Encoding': coding} if coding else {}
+
+            def cold() -> None:
+                server.response_cache.invalidate()
+                client.get(endpoint, headers=headers)
+
+            response = client.get(endpoint, headers=headers)
+            results['endpoints'][endpoint][coding or 'identity'] = {
+                'bytes_on_wire': len(response.get_data()),
+                'cold_request': measure(cold),
+                'warm_request': measure(lambda: client.get(endpoint, headers=headers), repeat=50),
+            }
+    for artifact in Server.artifacts:
+        if not os.path.exists(artifact):
+            continue
+        with open(artifact, 'rb') as file:
+            data: bytes = file.read()
+        results['artifacts'][artifact] = {'identity': {'bytes_on_wire': len(data)}}
+        for coding, compress in api.compressors.items():
+            results['artifacts'][artifact][coding] = {'bytes_on_wire': len(compress(data)),
+                                                      'compression': measure(lambda: compress(data), repeat=3)}
+    return results
+
+
+@suite('gtfs')
+def benchmark_gtfs() -> dict[str, Any]:
+    import gtfs
+    import synthetic
+    from data import Line, Route
+    results: dict[str, Any] = {}
+    for factor in scales((1, 10, 100)):
+        scale: synthetic.GtfsScale = synthetic.poznan_network.scaled(factor)
+        with isolated_directory():
+            counts: dict[str, int] = synthetic.generate_gtfs(scale)
+            pristine: dict[str, str] = {path: f'{path}.pristine' for path in (ref.rawdata_stops, ref.rawdata_lines)}
+            [shutil.copyfile(path, copy) for path, copy in pristine.items()]
+
+            def restore() -> None:
+                [shutil.copyfile(copy, path) for path, copy in pristine.items()]
+
+            repeat: int = 3 if factor <= 1 else 1
+            gtfs_db = gtfs.create_gtfs_database()
+            timings: dict[str, Any] = {
+                'create_gtfs_database': measure(lambda: gtfs.create_gtfs_database().close(), repeat, restore),
+                'attach_stop_lines': measure(lambda: gtfs.attach_stop_lines(gtfs_db), repeat, restore),
+                'attach_line_routes': measure(lambda: gtfs.attach_line_routes(gtfs_db), repeat, restore),
+                'attach_line_stops': measure(lambda: gtfs.attach_line_stops(gtfs_db), repeat, restore),
+            }
+            restore()
+            gtfs.attach_line_routes(gtfs_db)
+            gtfs.attach_line_stops(gtfs_db)
+            gtfs_db.close()
+            timings['Route.read_dict'] = measure(lambda: Route.read_dict(ref.rawdata_routes), repeat)
+            timings['Line.read_dict'] = measure(lambda: Line.read_dict(ref.rawdata_lines), repeat)
+        results[f'{factor:g}x'] = {'scale': scale.to_json(), 'rows': counts, 'timings': timings}
+    return results
+
+
+@suite('templates')
+def benchmark_templates() -> dict[str, Any]:
+    from jinja2 import Environment, FileSystemBytecodeCache
+    from uibuilder import JinjaLoader
+    with isolated_directory('templates'):
+        template_ids: list[str] = JinjaLoader().template_ids()
+
+        def environment(loader: JinjaLoader, bytecode_cache: FileSystemBytecodeCache | None = None) -> Environment:
+            created: Environment = Environment(loader=loader, bytecode_cache=bytecode_cache)
+            created.filters['lexicographic_sort'] = sorted  # compilation only checks that the filter exists
+            return created
+
+        def load_all(loader: JinjaLoader, bytecode_cache: FileSystemBytecodeCache | None = None) -> None:
+            loading: Environment = environment(loader, bytecode_cache)
+            [loading.get_template(template_id) for template_id in template_ids]
+
+        bytecode_cache: FileSystemBytecodeCache = FileSystemBytecodeCache(
+            util.prepare_path(ref.cache_templates_bytecode, path_is_directory=True))
+        load_all(JinjaLoader(), bytecode_cache)
+        precompiled: JinjaLoader = JinjaLoader(ref.cache_templates_precompiled)
+        precompiled.precompile(environment(precompiled))
+        timings: dict[str, dict[str, float]] = {
+            'parse': measure(lambda: load_all(JinjaLoader())),
+            'bytecode_cache': measure(lambda: load_all(JinjaLoader(), bytecode_cache)),
+            'precompiled': measure(lambda: load_all(JinjaLoader(ref.cache_templates_precompiled))),
+        }
+    return {'templates': len(template_ids), 'timings': timings,
+            'saved_per_run_s': {name: timings['parse']['mean_s'] - timing['mean_s']
+                                for name, timing in timings.items() if name != 'parse'}}
+
+
+def stage_timings(trace: tracing.Trace) -> dict[str, float]:
+    timings: dict[str, float] = {}
+    for span in trace.spans():
+        timings[span.name] = timings.get(span.name, 0) + span.duration
+    return timings
+
+
+def compare_with_baseline(name: str, results: dict[str, Any], key: Callable[[dict[str, Any]], dict[str, float]]) \
+        -> dict[str, Any]:
+    baseline_path: str = f'{ref.report_benchmarks}/{name}-baseline.json'
+    if os.environ.get('POKESTOPS_BENCHMARK_UPDATE_BASELINE') or not os.path.exists(baseline_path):
+        with open(util.prepare_path(baseline_path), 'w') as file:
+            json.dump({'commit': current_commit(), 'results': results}, file, indent=2)
+        return {'baseline': current_commit(), 'ratios': {}}
+    with open(baseline_path, 'r') as file:
+        baseline: dict[str, Any] = json.load(file)
+    ratios: dict[str, dict[str, float]] = {}
+    for variant, result in results.items():
+        if variant in baseline['results']:
+            previous: dict[str, float] = key(baseline['results'][variant])
+            ratios[variant] = {stage: duration / previous[stage] for stage, duration in key(result).items()
+                               if previous.get(stage)}
+    return {'baseline': baseline['commit'], 'ratios': ratios}
+
+
+# the Polish lexicographic map lives under assets, which is shared as a whole, the map template needs at least one raid
+__dataset_shared_files__: tuple[str, ...] = ('templates', 'assets', ref.rawdata_regions, ref.rawdata_carriers,
+                                              ref.rawdata_vehicles, ref.rawdata_vehicle_models, ref.rawdata_raids,
+                                              ref.raiddata_path)
+
+
+# the stops, lines and shapes of the real network, as written by the update_gtfs pipeline
+__network_files__: tuple[str, ...] = (ref.rawdata_stops, ref.rawdata_lines, ref.rawdata_routes, ref.rawdata_terminals,
+                                      ref.rawdata_scheduled_changes)
+
+
+def raw_network() -> bool:
+    value: str = os.environ.get('POKESTOPS_BENCHMARK_DATA', 'synthetic')
+    if value not in ('synthetic', 'raw'):
+        raise ValueError(f'Unknown benchmark data: {value}, available data: synthetic, raw')
+    if value == 'raw' and (missing := [path for path in __network_files__ if not os.path.exists(path)]):
+        raise FileNotFoundError(f'Missing network files: {", ".join(missing)}, run the update_gtfs pipeline first')
+    return value == 'raw'
+
+
+def generate_players(player_count: int) -> dict[str, int]:
+    import synthetic
+    vehicles: list[str] = synthetic.read_column(ref.rawdata_vehicles, 0, predicate=3)
+    return synthetic.generate_players(player_count, synthetic.read_line_variants(), vehicles)
+
+
+def generate_dataset(player_count: int) -> dict[str, int]:
+    import gtfs
+    import synthetic
+    synthetic.generate_gtfs()
+    gtfs_db = gtfs.create_gtfs_database()
+    gtfs.attach_stop_lines(gtfs_db)
+    gtfs.attach_line_routes(gtfs_db)
+    gtfs.attach_line_stops(gtfs_db)
+    gtfs_db.close()
+    for path, header in ((ref.rawdata_terminals, 'code,name,lat,lon,arrival,departure'),
+                         (ref.rawdata_scheduled_changes,
+                          'date_of_change,old_stop_id,old_stop_name,new_stop_id,new_stop_name')):
+        util.prepare_file(path, f'{header}\n', True)
+    return generate_players(player_count)
+
+
+@suite('end_to_end')
+def benchmark_end_to_end() -> dict[str, Any]:
+    from server import Server
+    results: dict[str, Any] = {}
+    for factor in scales((10, 100, 1000)):
+        player_count: int = int(factor)
+        with isolated_directory(*__dataset_shared_files__):
+            counts: dict[str, int] = generate_dataset(player_count)
+            with tracing.trace('load') as load_trace:
+                server: Server = Server()
+            with tracing.trace('compile_all') as compile_trace:
+                server.run_named_pipeline('compile_all')
+        results[f'{player_count}_players'] = {'rows': counts, 'load': stage_timings(load_trace),
+                                              'compile_all': stage_timings(compile_trace)}
+    return {'results': results, 'comparison': compare_with_baseline(
+        'end_to_end', results, lambda result: {**result['load'], **result['compile_all']})}
+
+
+def rendered_paths(database: Any, merge: bool) -> dict[str, int]:
+    from folium import Map, PolyLine
+    from segments import SegmentClassifier
+    fmap: Map = Map()
+    count: int = 0
+    for points, class_name in SegmentClassifier(database.players).classify(database.lines.values(), database.routes,
+                                                                          merge):
+        PolyLine(locations=[points], class_name=class_name, fill_opacity=0, bubbling_mouse_events=False).add_to(fmap)
+        count += 1
+    return {'polylines': count, 'rendered_bytes': len(fmap.get_root().render().encode())}
+
+
+def path_detail(ui_builder: Any) -> dict[str, int]:
+    import geo
+    ranks: list[str] = [record[3] for layer, record, _ in ui_builder.map_features() if layer == 'paths']
+    return {f'zoom_{zoom}': sum(rank <= str(band) for path in ranks for rank in path)
+            for band, zoom in enumerate((0, *(zoom for zoom, _ in geo.simplification_bands)))}
+
+
+def path_payload(ui_builder: Any) -> dict[str, int]:
+    import geo
+    encoded: list[str] = [record[2] for layer, record, _ in ui_builder.map_features() if layer == 'paths']
+    return {'encoded_bytes': sum(map(len, encoded)),
+            'array_bytes': sum(len(json.dumps([[round(lat, 6), round(lon, 6)] for lat, lon in geo.decode_polyline(path)],
+                                              separators=(',', ':'))) for path in encoded)}
+
+
+@suite('line_paths')
+def benchmark_line_paths() -> dict[str, Any]:
+    from database import Database, load_database
+    from segments import SegmentClassifier
+    from uibuilder import UIBuilder
+    results: dict[str, Any] = {}
+    # with POKESTOPS_BENCHMARK_DATA=raw the players are generated on the real network instead of a synthetic one
+    raw: bool = raw_network()
+    for factor in scales((12, 24, 48)):
+        player_count: int = int(factor)
+        with isolated_directory(*__dataset_shared_files__, *(__network_files__ if raw else ())):
+            counts: dict[str, int] = generate_players(player_count) if raw else generate_dataset(player_count)
+            database: Database = load_database()
+            ui_builder: UIBuilder = UIBuilder(database=database, lexmap_file=ref.lexmap_polish)
+            results[f'{player_count}_players{"_raw" if raw else ""}'] = {
+                'rows': {**counts, 'routes': len(database.routes),
+                         'route_points': sum(len(route.points) for route in database.routes.values())},
+                'layers': {name: rendered_paths(database, merge) for name, merge in (('segments', False), ('merged', True))},
+                'classify_segments': measure(lambda: list(SegmentClassifier(database.players).classify(
+                    database.lines.values(), database.routes))),
+                'make_line_paths': measure(ui_builder.make_line_paths, repeat=3),
+                'path_vertices': path_detail(ui_builder),
+                'path_payload': path_payload(ui_builder),
+            }
+    return {'results': results, 'comparison': compare_with_baseline(
+        'line_paths', results, lambda result: {'classify_segments': result['classify_segments']['mean_s'],
+                                               'make_line_paths': result['make_line_paths']['mean_s']})}
+
+
+def run(*names: str) -> None:
+    for name in names or __suites__.keys():
+        if name not in __suites__:
+            raise ValueError(f'Unknown benchmark suite: {name}, available suites: {", ".join(__suites__)}')
+        log(f'Running benchmark suite {name}...')
+        enable_logging(False)
+        results: dict[str, Any] = __suites__[name]()
+        enable_logging(True)
+        log(f'Results stored in {save_results(name, results)}')
+
+
+if __name__ == '__main__':
+    run(*sys.argv[1:])
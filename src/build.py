@@ -0,0 +1,153 @@
+import glob
+import hashlib
+import json
+import os
+import util
+from contextlib import contextmanager
+from log import log
+from threading import Lock, RLock
+from typing import Callable, Iterator
+
+__digests__: dict[str, tuple[int, int, str]] = {}
+__reports__: list[dict[str, list[str]]] = []
+__reports_mutex__: Lock = Lock()
+
+
+def file_digest(path: str) -> str:
+    status: os.stat_result = os.stat(path)
+    cached: tuple[int, int, str] | None = __digests__.get(path)
+    if cached is not None and cached[0] == status.st_mtime_ns and cached[1] == status.st_size:
+        return cached[2]
+    with open(path, 'rb') as file:
+        digest: str = hashlib.file_digest(file, 'blake2b').hexdigest()[:32]
+    __digests__[path] = (status.st_mtime_ns, status.st_size, digest)
+    return digest
+
+
+def expand(patterns: list[str]) -> list[str]:
+    return sorted({path for pattern in patterns for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)})
+
+
+def fingerprint(patterns: list[str], extra: dict[str, str] | None = None) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for path in expand(patterns):
+        digest.update(f'{path}\0{file_digest(path)}\n'.encode())
+    for key, value in sorted((extra or {}).items()):
+        digest.update(f'{key}\0{value}\n'.encode())
+    return digest.hexdigest()
+
+
+class Node:
+    def __init__(self, name: str, inputs: list[str], outputs: list[str], action: Callable[[], None],
+                 dependencies: list[str] | None = None, parameters: dict[str, str] | None = None,
+                 state: Callable[[], str] | None = None):
+        self.name: str = name
+        self.inputs: list[str] = inputs
+        self.outputs: list[str] = outputs
+        self.action: Callable[[], None] = action
+        self.dependencies: list[str] = dependencies or []
+        self.parameters: dict[str, str] = parameters or {}
+        # the in-memory data the action builds from, which can differ from the inputs on disk until it is reloaded
+        self.state: Callable[[], str] | None = state
+
+
+class BuildGraph:
+    def __init__(self, state_file: str, nodes: list[Node]):
+        self.state_file: str = state_file
+        self.nodes: dict[str, Node] = {node.name: node for node in nodes}
+        self.__mutex__: RLock = RLock()
+        self.__state__: dict[str, dict[str, str]] = {}
+        if os.path.exists(state_file):
+            with open(state_file, 'r') as file:
+                self.__state__ = json.load(file)
+
+    def __order__(self, names: tuple[str, ...]) -> list[str]:
+        ordered: list[str] = []
+
+        def visit(name: str, path: tuple[str, ...]) -> None:
+            if name in path:
+                raise ValueError(f'Build graph cycle: {" -> ".join((*path, name))}')
+            if name not in ordered:
+                for dependency in self.nodes[name].dependencies:
+                    visit(dependency, (*path, name))
+                ordered.append(name)
+
+        for node_name in names:
+            visit(node_name, ())
+        return ordered
+
+    def __input_fingerprint__(self, node: Node) -> str:
+        return fingerprint(node.inputs, {**{dependency: self.__state__.get(dependency, {}).get('outputs', '')
+                                            for dependency in node.dependencies}, **node.parameters,
+                                         **({'state': node.state()} if node.state is not None else {})})
+
+    def __output_fingerprint__(self, node: Node) -> str | None:
+        if not all(os.path.exists(output) for output in node.outputs if not glob.has_magic(output)):
+            return None
+        return fingerprint(node.outputs)
+
+    @staticmethod
+    def run_sequentially(nodes: list[Node]) -> dict[str, Exception | None]:
+        results: dict[str, Exception | None] = {}
+        for node in nodes:
+            try:
+                node.action()
+                results[node.name] = None
+            except Exception as e:
+                results[node.name] = e
+        return results
+
+    def __waves__(self, names: tuple[str, ...]) -> list[list[Node]]:
+        levels: dict[str, int] = {}
+        for name in self.__order__(names):
+            levels[name] = 1 + max((levels[d] for d in self.nodes[name].dependencies), default=-1)
+        return [[self.nodes[name] for name, level in levels.items() if level == wave]
+                for wave in range(max(levels.values(), default=-1) + 1)]
+
+    def build(self, *names: str, runner: Callable[[list[Node]], dict[str, Exception | None]] | None = None) \
+            -> dict[str, list[str]]:
+        report: dict[str, list[str]] = {'rebuilt': [], 'skipped': []}
+        failure: Exception | None = None
+        with self.__mutex__:
+            for wave in self.__waves__(names):
+                stale: list[Node] = []
+                fingerprints: dict[str, str] = {}
+                for node in wave:
+                    fingerprints[node.name] = self.__input_fingerprint__(node)
+                    state: dict[str, str] = self.__state__.get(node.name, {})
+                    if state.get('inputs') == fingerprints[node.name] \
+                            and state.get('outputs') == self.__output_fingerprint__(node):
+                        log(f'  {node.name} is up to date')
+                        report['skipped'].append(node.name)
+                    else:
+                        stale.append(node)
+                results: dict[str, Exception | None] = (runner or BuildGraph.run_sequentially)(stale) if stale else {}
+                for node in stale:
+                    if results[node.name] is None:
+                        self.__state__[node.name] = {'inputs': fingerprints[node.name],
+                                                     'outputs': self.__output_fingerprint__(node) or ''}
+                        report['rebuilt'].append(node.name)
+                    failure = failure or results[node.name]
+                with open(util.prepare_path(self.state_file), 'w') as file:
+                    json.dump(self.__state__, file, indent=2)
+                if failure is not None:
+                    break
+        with __reports_mutex__:
+            for collector in __reports__:
+                collector['rebuilt'] += report['rebuilt']
+                collector['skipped'] += report['skipped']
+        if failure is not None:
+            raise failure
+        return report
+
+
+@contextmanager
+def collect() -> Iterator[dict[str, list[str]]]:
+    report: dict[str, list[str]] = {'rebuilt': [], 'skipped': []}
+    with __reports_mutex__:
+        __reports__.append(report)
+    try:
+        yield report
+    finally:
+        with __reports_mutex__:
+            __reports__.remove(report)
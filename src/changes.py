@@ -0,0 +1,96 @@
+from api import Collection
+from collections import deque
+from log import error
+from threading import Lock
+from typing import Any, Callable
+
+
+class Change:
+    def __init__(self, version: int, collection: str, key: str, entity: dict[str, Any] | None, existed_before: bool):
+        self.version: int = version
+        self.collection: str = collection
+        self.key: str = key
+        self.entity: dict[str, Any] | None = entity
+        self.existed_before: bool = existed_before
+
+
+def take_snapshots(collections: dict[str, Collection],
+                   fallback: dict[str, dict[str, dict[str, Any]]]) -> dict[str, dict[str, dict[str, Any]]]:
+    snapshots: dict[str, dict[str, dict[str, Any]]] = {}
+    for name, collection in collections.items():
+        try:
+            snapshots[name] = collection.snapshot()
+        except Exception as e:
+            # a collection that cannot be mapped keeps its last snapshot instead of failing the whole feed
+            error(f'Error while taking a snapshot of collection {name}: {type(e).__name__} - {e}')
+            if name in fallback:
+                snapshots[name] = fallback[name]
+    return snapshots
+
+
+class ChangeFeed:
+    def __init__(self, collections: dict[str, Collection], version: int, capacity: int = 100000):
+        self.__snapshots__: dict[str, dict[str, dict[str, Any]]] = take_snapshots(collections, {})
+        self.__changes__: deque[Change] = deque()
+        self.__capacity__: int = capacity
+        self.__mutex__: Lock = Lock()
+        self.origin: int = version
+        self.version: int = version
+        self.versions: dict[str, int] = {name: version for name in self.__snapshots__}
+
+    def record(self, collections: dict[str, Collection], next_version: Callable[[], int],
+               complete: bool = True) -> None:
+        # the snapshot and its version are taken under the same lock, so concurrent records commit in version order
+        with self.__mutex__:
+            version: int = next_version()
+            snapshots: dict[str, dict[str, dict[str, Any]]] = take_snapshots(collections, self.__snapshots__)
+            if not complete:
+                snapshots = {**self.__snapshots__, **snapshots}
+            for name in self.__snapshots__.keys() | snapshots.keys():
+                previous: dict[str, dict[str, Any]] = self.__snapshots__.get(name, {})
+                current: dict[str, dict[str, Any]] = snapshots.get(name, {})
+                changes: list[Change] = [Change(version, name, key, entity, key in previous)
+                                         for key, entity in current.items() if previous.get(key) != entity]
+                changes += [Change(version, name, key, None, True) for key in previous.keys() - current.keys()]
+                if changes or name not in self.versions:
+                    self.versions[name] = version
+                self.__changes__.extend(changes)
+            self.__snapshots__ = snapshots
+            self.versions = {name: v for name, v in self.versions.items() if name in snapshots}
+            while len(self.__changes__) > self.__capacity__:
+                self.origin = self.__changes__.popleft().version
+            self.version = version
+
+    def snapshot(self, names: set[str] | None = None) -> dict[str, Any]:
+        with self.__mutex__:
+            return self.__snapshot__(names)
+
+    def since(self, version: int | None, names: set[str] | None = None) -> dict[str, Any]:
+        with self.__mutex__:
+            if version is None or version < self.origin or version > self.version:
+                return self.__snapshot__(names)
+            first: dict[tuple[str, str], Change] = {}
+            last: dict[tuple[str, str], Change] = {}
+            for change in reversed(self.__changes__):
+                if change.version <= version:
+                    break
+                if names is None or change.collection in names:
+                    first[(change.collection, change.key)] = change
+                    last.setdefault((change.collection, change.key), change)
+            collections: dict[str, dict[str, Any]] = {}
+            for (name, key), change in last.items():
+                delta: dict[str, Any] = collections.setdefault(name, {'version': self.versions.get(name, change.version),
+                                                                       'added': {}, 'changed': {}, 'removed': []})
+                existed_before: bool = first[(name, key)].existed_before
+                if change.entity is None:
+                    if existed_before:
+                        delta['removed'].append(key)
+                else:
+                    delta['changed' if existed_before else 'added'][key] = change.entity
+            return {'version': self.version, 'full': False, 'collections': collections}
+
+    def __snapshot__(self, names: set[str] | None) -> dict[str, Any]:
+        return {'version': self.version, 'full': True, 'collections': {
+            name: {'version': self.versions[name], 'entities': entities}
+            for name, entities in self.__snapshots__.items() if names is None or name in names
+        }}
@@ -7,7 +7,7 @@ from abc import ABC
 from collections import defaultdict
 from date import DateAndOrder
 from functools import cached_property
-from geo import geopoint
+from geo import decode_polyline, geopoint
 from log import log
 from quantity import Duration
 from typing import Final, Literal, Self, TYPE_CHECKING
@@ -39,10 +39,10 @@ def __read_collection__(source: str, identity: C, mapper: Callable[..., T], comb
 
 
 class JsonSerializable(ABC):
-    def __json_entry__(self) -> str: ...
+    def __json_entry__(self) -> tuple[str, dict[str, Any]]: ...
 
     @staticmethod
-    def json_entry(obj: JsonSerializable) -> str:
+    def json_entry(obj: JsonSerializable) -> tuple[str, dict[str, Any]]:
         return obj.__json_entry__()
 
 
@@ -152,15 +152,15 @@ class Stop(JsonSerializable):
         log('Done!')
         return stops, stop_groups
 
-    def __json_entry__(self) -> str:
-        return (f'"{self.short_name}":{{'
-                f'n:"{self.full_name}",'
-                f'lt:{self.location.latitude},'
-                f'ln:{self.location.longitude},'
-                f'l:[{','.join(f'["{line}","{destination}"]' for line, destination in self.lines)}],'
-                f'{f'v:[{','.join(f'["{visit.item.nickname}","{visit.date:y-m-d|}"]'
-                                  for visit in sorted(self.visits))}],' if self.visits else ''}'
-                f'}},')
+    def __json_entry__(self) -> tuple[str, dict[str, Any]]:
+        entry: dict[str, Any] = {'n': self.full_name, 'lt': round(self.location.latitude, 6),
+                                 'ln': round(self.location.longitude, 6),
+                                 'l': [[line, destination] for line, destination in self.lines]}
+        if self.visits:
+            entry['v'] = [[visit.item.nickname, format(visit.date, 'y-m-d|')] for visit in sorted(self.visits)]
+        if self.terminals_progress:
+            entry['tp'] = [[kind, player.nickname, terminal.name] for kind, player, terminal in self.terminals_progress]
+        return self.short_name, entry
 
 
 class TerminalProgress:
@@ -225,12 +225,8 @@ class Terminal(JsonSerializable):
         # noinspection PyTypeChecker
         return __read_collection__(source, [], constructor, list.append)
 
-    def __json_entry__(self) -> str:
-        return (f'"{self.id}":{{'
-                f'n:"{self.name}",'
-                f'lt:{self.latitude},'
-                f'ln:{self.longitude}'
-                f'}},')
+    def __json_entry__(self) -> tuple[str, dict[str, Any]]:
+        return self.id, {'n': self.name, 'lt': round(self.latitude, 6), 'ln': round(self.longitude, 6)}
 
 
 class StopChange:
@@ -292,10 +288,8 @@ class Carrier(JsonSerializable):
         constructor = lambda *row: Carrier(row[0], row[1], row[2], (row[3], row[4], row[5]))
         return __read_collection__(source, {}, constructor, lambda c, v: c.update({v.symbol: v}))
 
-    def __json_entry__(self) -> str:
-        return (f'"{self.symbol}":{{'
-                f'n:"{self.full_name}",'
-                f'}},')
+    def __json_entry__(self) -> tuple[str, dict[str, Any]]:
+        return self.symbol, {'n': self.full_name}
 
 
 class VehicleModel(JsonSerializable):
@@ -319,14 +313,9 @@ class VehicleModel(JsonSerializable):
         log(f'  Reading vehicle models data from {source}... ', end='')
         return __read_collection__(source, {}, VehicleModel, lambda c, v: c.update({v.model_id: v}))
 
-    def __json_entry__(self) -> str:
-        return (f'"{self.model_id}":{{'
-                f'k:"{self.kind_detailed}",'
-                f'b:"{self.brand}",'
-                f'm:"{self.model}",'
-                f'{f's:{self.seats},' if self.seats else ''}'
-                f'l:"{self.lore}",'
-                f'}},')
+    def __json_entry__(self) -> tuple[str, dict[str, Any]]:
+        return self.model_id, {'k': self.kind_detailed, 'b': self.brand, 'm': self.model,
+                               **({'s': self.seats} if self.seats else {}), 'l': self.lore}
 
 
 class Vehicle(JsonSerializable):
@@ -378,16 +367,19 @@ class Vehicle(JsonSerializable):
         constructor = lambda *row: Vehicle(row[0], row[1], carriers.get(row[2]), models.get(row[3]), row[4], row[5])
         return __read_collection__(source, {}, constructor, lambda c, v: c.update({v.vehicle_id: v}))
 
-    def __json_entry__(self) -> str:
-        return (f'"{self.vehicle_id}":{{'
-                f'{f'p:"{self.license_plate}", ' if self.license_plate else ''}'
-                f'{f'm:"{self.model.model_id}", ' if self.model else ''}'
-                f'c:"{self.carrier.symbol}",'
-                f'{f'i:{f'"{self.image_url}"'},' if self.image_url else ''}'
-                f'l:"{self.lore}",'
-                f'{f'd:[{','.join(f'["{visit.item.nickname}","{visit.date:y-m-d}"]'
-                                  for visit in sorted(self.discoveries))}],' if self.discoveries else ''}'
-                f'}},')
+    def __json_entry__(self) -> tuple[str, dict[str, Any]]:
+        entry: dict[str, Any] = {}
+        if self.license_plate:
+            entry['p'] = self.license_plate
+        if self.model:
+            entry['m'] = self.model.model_id
+        entry['c'] = self.carrier.symbol
+        if self.image_url:
+            entry['i'] = self.image_url
+        entry['l'] = self.lore
+        if self.discoveries:
+            entry['d'] = [[visit.item.nickname, format(visit.date, 'y-m-d')] for visit in sorted(self.discoveries)]
+        return self.vehicle_id, entry
 
 
 class Route:
@@ -402,7 +394,8 @@ class Route:
         # noinspection PyTypeChecker
         points: dict[str, list[tuple[geopoint, int]]] = __read_collection__(
             source, defaultdict(list),
-            lambda r_id, lat, lon, seq: (r_id, (geopoint(lat, lon), int(seq))), lambda c, v: c[v[0]].append(v[1])
+            lambda r_id, lat, lon, seq: (r_id, (geopoint(float(lat), float(lon)), int(seq))),
+            lambda c, v: c[v[0]].append(v[1])
         )
         return {route_id: Route(route_id, [point for point, _ in sorted(points, key=lambda p: p[1])])
                 for route_id, points in points.items()}
@@ -494,17 +487,13 @@ class Line(JsonSerializable):
                                         row[8].split('&'), list(map(lambda seq: seq.split('&'), row[9].split('|'))))
         return __read_collection__(source, {}, constructor, lambda c, v: c.update({v.number: v}))
 
-    def __json_entry__(self) -> str:
-        return (f'"{self.number}":{{'
-                f'bc:"{self.background_color}",'
-                f'tc:"{self.text_color}",'
-                f'k:"{self.kind()}",'
-                f't:"{self.terminals}",'
-                f'rd:"{self.description}",'
-                f'r:[{','.join(f'[{",".join(f"\"{stop}\"" for stop in seq)}]' for seq in self.variants)}],'
-                f'{f'd:[{','.join(f'["{visit.item.nickname}","{visit.date:y-m-d}"]'
-                                  for visit in sorted(self.discoveries))}],' if self.discoveries else ''}'
-                f'}},')
+    def __json_entry__(self) -> tuple[str, dict[str, Any]]:
+        entry: dict[str, Any] = {'bc': self.background_color, 'tc': self.text_color, 'k': self.kind(),
+                                 't': self.terminals, 'rd': self.description,
+                                 'r': [list(sequence) for sequence in self.variants]}
+        if self.discoveries:
+            entry['d'] = [[visit.item.nickname, format(visit.date, 'y-m-d')] for visit in sorted(self.discoveries)]
+        return self.number, entry
 
 
 class Region:
@@ -660,7 +649,8 @@ class RouteRaidElement(RaidElement):
     def from_dict(data: dict[str, Any]) -> RouteRaidElement:
         return RouteRaidElement(datetime.fromisoformat(data['departure']) if 'departure' in data else None,
                                 datetime.fromisoformat(data['arrival']) if 'arrival' in data else None,
-                                data['transport_method'], [geopoint.parse(point) for point in data['shape'].split('&')],
+                                data['transport_method'], decode_polyline(data['polyline']) if 'polyline' in data
+                                else [geopoint.parse(point) for point in data['shape'].split('&')],
                                 data.get('line'), data.get('comment'))
 
 
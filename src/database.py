@@ -1,8 +1,11 @@
 from __future__ import annotations
 from announcements import Announcement
 from data import *
+from itertools import count as counter
+from pipeline import stage
 from player import Player
-from typing import get_args
+from time import time_ns
+from typing import Iterable, Iterator, get_args
 
 
 class Database:
@@ -10,6 +13,7 @@ class Database:
         'players', 'progress', 'stops', 'stop_groups', 'terminals', 'carriers', 'regions',
         'vehicles', 'models', 'lines', 'routes', 'raids', 'scheduled_changes', 'announcements']
     __stars__: dict[tuple[int, int], int] = {(1, 1): 1, (2, 2): 2, (3, 4): 3, (5, 7): 4, (8, 100): 5}
+    __versions__: Iterator[int] = counter(time_ns() // 1_000_000)  # versions keep increasing across server restarts
 
     def __init__(self, players: list[Player], progress: dict[str, dict[str, float]],
                  stops: dict[str, Stop], stop_groups: dict[str, SortedSet[Stop]], terminals: list[Terminal],
@@ -21,6 +25,7 @@ class Database:
                  *, is_old_data: bool = False):
         self.__old_data__: Database | None = Database.partial(is_old_data=True) if is_old_data else None
         self.__reported_collections__: set[Database.CollectionName] = set()
+        self.version: int = next(Database.__versions__)
         self.players: list[Player] = players
         self.progress: dict[str, dict[str, float]] = progress
         self.stops: dict[str, Stop] = stops
@@ -40,6 +45,10 @@ class Database:
     def __contains__(self, name: CollectionName) -> bool:
         return bool(getattr(self, name))
 
+    def bump_version(self) -> int:
+        self.version = next(Database.__versions__)
+        return self.version
+
     @staticmethod
     def partial(players: list[Player] | None = None, progress: dict[str, dict[str, float]] | None = None,
                 stops: dict[str, Stop] | None = None, stop_groups: dict[str, SortedSet[Stop]] | None = None,
@@ -94,6 +103,29 @@ class Database:
         return geopoint(sum(s.location.latitude for s in stops) / len(stops),
                         sum(s.location.longitude for s in stops) / len(stops))
 
+    def region_progress(self, region: Region, player: Player, include_ev: bool) -> float:
+        region_stops: list[Stop] = [s for s in self.stops.values() if s in region]
+        return round(count(s for s in region_stops if s.is_visited_by(player, include_ev)) / max(len(region_stops), 1) * 100, 1)
+
+    def lines_progress(self, player: Player) -> float:
+        return round(sum(1 if ln.discovered_by(player) else 0 for ln in self.lines.values()) / max(len(self.lines), 1) * 100, 1)
+
+    def terminals_progress(self, player: Player) -> float:
+        return round(sum(1 if t.completed_by(player) else 0.5 if t.reached_by(player) else 0
+                         for t in self.terminals) / max(len(self.terminals), 1) * 100, 1)
+
+    def update_progress(self, player: Player, regions: Iterable[Region] | None = None,
+                        *, lines: bool = True, terminals: bool = True) -> None:
+        for region in self.regions.values() if regions is None else regions:
+            self.progress.setdefault(region.short_name, {}).update({
+                player.nickname: self.region_progress(region, player, False),
+                f'ev-{player.nickname}': self.region_progress(region, player, True),
+            })
+        if lines:
+            self.progress.setdefault('LN', {})[player.nickname] = self.lines_progress(player)
+        if terminals:
+            self.progress.setdefault('SV', {})[player.nickname] = self.terminals_progress(player)
+
     def get_effective_changes(self):
         return [change for change in self.scheduled_changes if change.is_effective()]
 
@@ -166,28 +198,32 @@ class Database:
         return ['Pokestops', 'Pokelines', 'Stellar Voyage', 'City Raiders']
 
 
+@stage('load_database')
 def load_database() -> Database:
     log('Loading database...')
-    district, regions = Region.read_regions(ref.rawdata_regions)
-    players: list[Player] = Player.read_list(ref.rawdata_players)
-    carriers: dict[str, Carrier] = Carrier.read_dict(ref.rawdata_carriers)
-    scheduled_changes: list[StopChange] = StopChange.read_list(ref.rawdata_scheduled_changes)
-    models: dict[str, VehicleModel] = VehicleModel.read_dict(ref.rawdata_vehicle_models)
-    vehicles: dict[str, Vehicle] = Vehicle.read_dict(ref.rawdata_vehicles, carriers, models)
-    raids: list[Raid] = Raid.read_list(ref.rawdata_raids, players)
+    with stage('read_static_data'):
+        district, regions = Region.read_regions(ref.rawdata_regions)
+        players: list[Player] = Player.read_list(ref.rawdata_players)
+        carriers: dict[str, Carrier] = Carrier.read_dict(ref.rawdata_carriers)
+        scheduled_changes: list[StopChange] = StopChange.read_list(ref.rawdata_scheduled_changes)
+        models: dict[str, VehicleModel] = VehicleModel.read_dict(ref.rawdata_vehicle_models)
+        vehicles: dict[str, Vehicle] = Vehicle.read_dict(ref.rawdata_vehicles, carriers, models)
+        raids: list[Raid] = Raid.read_list(ref.rawdata_raids, players)
     initial_db: Database = Database.partial(regions=regions, district=district, players=players,
                                             scheduled_changes=scheduled_changes, carriers=carriers,
                                             models=models, vehicles=vehicles, raids=raids)
     if not os.path.exists(ref.rawdata_stops) or not os.path.exists(ref.rawdata_routes) or not os.path.exists(ref.rawdata_lines):
         return initial_db
-    initial_db.stops = (stops_and_groups := Stop.read_stops(ref.rawdata_stops, initial_db))[0]
-    initial_db.stop_groups = stops_and_groups[1]
-    initial_db.routes = Route.read_dict(ref.rawdata_routes)
-    initial_db.lines = Line.read_dict(ref.rawdata_lines)
+    with stage('read_gtfs_data'):
+        initial_db.stops = (stops_and_groups := Stop.read_stops(ref.rawdata_stops, initial_db))[0]
+        initial_db.stop_groups = stops_and_groups[1]
+        initial_db.routes = Route.read_dict(ref.rawdata_routes)
+        initial_db.lines = Line.read_dict(ref.rawdata_lines)
     stops: dict[str, Stop] = initial_db.stops
-    terminals: list[Terminal] = Terminal.read_list(ref.rawdata_terminals, stops)
-    announcements: list[Announcement] = Announcement.read_list(ref.rawdata_announcements, initial_db.lines) \
-        if os.path.exists(ref.rawdata_announcements) else []
+    with stage('read_terminals_and_announcements'):
+        terminals: list[Terminal] = Terminal.read_list(ref.rawdata_terminals, stops)
+        announcements: list[Announcement] = Announcement.read_list(ref.rawdata_announcements, initial_db.lines) \
+            if os.path.exists(ref.rawdata_announcements) else []
 
     initial_db.terminals = terminals
     initial_db.vehicles = vehicles
@@ -200,27 +236,10 @@ def load_database() -> Database:
         if vehicle.is_discovered() and vehicle.model is None:
             error('Vehicle without specified model marked as found:', vehicle.vehicle_id)
 
-    ever_visited_stops: list[Stop] = list(filter(lambda s: s.is_visited(), stops.values()))
-    progress: dict[str, dict[str, float]] = {
-        **{r.short_name: {
-            **{
-                p.nickname: round(len(list(filter(lambda s: s in r and s.is_visited_by(p, False), ever_visited_stops))) /
-                                  max(len(list(filter(lambda s: s in r, stops.values()))), 1) * 100, 1) for p in players
-            },
-            **{
-                f'ev-{p.nickname}': round(len(list(filter(lambda s: s in r and s.is_visited_by(p), ever_visited_stops))) /
-                                          max(len(list(filter(lambda s: s in r, stops.values()))), 1) * 100, 1) for p in players
-            },
-        } for r in regions.values()},
-        'LN': {
-            f'{p.nickname}': round(sum(1 if ln.discovered_by(p) else 0 for ln in initial_db.lines.values()) /
-                                   max(len(initial_db.lines), 1) * 100, 1) for p in players
-        },
-        'SV': {
-            f'{p.nickname}': round(sum(1 if t.completed_by(p) else 0.5 if t.reached_by(p) else 0
-                                       for t in terminals) / max(len(terminals), 1) * 100, 1) for p in players
-        }
-    }
-
-    return Database(players, progress, stops, initial_db.stop_groups, terminals, carriers, regions, initial_db.district,
-                    vehicles, models, initial_db.routes, initial_db.lines, raids, initial_db.scheduled_changes, announcements)
+    database: Database = Database(players, {}, stops, initial_db.stop_groups, terminals, carriers, regions,
+                                  initial_db.district, vehicles, models, initial_db.routes, initial_db.lines, raids,
+                                  initial_db.scheduled_changes, announcements)
+    with stage('update_progress'):
+        for player in players:
+            database.update_progress(player)
+    return database
@@ -0,0 +1,72 @@
+import json
+import os
+import time
+from queue import Empty, Full, Queue
+from threading import Lock
+from typing import Any, Iterator
+
+__subscribers__: list[Queue] = []
+__subscribers_mutex__: Lock = Lock()
+__queue_size__: int = 1024
+
+
+def __reset_after_fork__() -> None:
+    global __subscribers_mutex__
+    # subscribers are connections of the parent process, a forked worker has nobody to publish to
+    __subscribers_mutex__ = Lock()
+    __subscribers__.clear()
+
+
+os.register_at_fork(after_in_child=__reset_after_fork__)
+
+
+def subscribe(limit: int | None = None) -> Queue | None:
+    subscription: Queue = Queue(maxsize=__queue_size__)
+    with __subscribers_mutex__:
+        if limit is not None and len(__subscribers__) >= limit:
+            return None
+        __subscribers__.append(subscription)
+    return subscription
+
+
+def unsubscribe(subscription: Queue) -> None:
+    with __subscribers_mutex__:
+        if subscription in __subscribers__:
+            __subscribers__.remove(subscription)
+
+
+def publish(event: str, **data: Any) -> None:
+    if not __subscribers__:
+        return
+    message: dict[str, Any] = {'event': event, 'time': time.time(), **data}
+    with __subscribers_mutex__:
+        subscribers: list[Queue] = list(__subscribers__)
+    for subscription in subscribers:
+        while True:
+            try:
+                subscription.put_nowait(message)
+                break
+            except Full:  # slow subscribers lose their oldest events instead of blocking the publisher
+                try:
+                    subscription.get_nowait()
+                except Empty:
+                    pass
+
+
+def progress(stage: str, done: float, total: float) -> None:
+    publish('progress', stage=stage, done=done, total=total)
+
+
+def stream(subscription: Queue, keep_alive: float = 15) -> Iterator[str]:
+    try:
+        yield ': connected\n\n'
+        while True:
+            try:
+                message: dict[str, Any] = subscription.get(timeout=keep_alive)
+            except Empty:
+                yield ': keep-alive\n\n'
+                continue
+            event: str = message['event']
+            yield f'event: {event}\ndata: {json.dumps(message)}\n\n'
+    finally:
+        unsubscribe(subscription)
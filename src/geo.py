@@ -1,5 +1,5 @@
 from __future__ import annotations
-from math import atan2, pi
+from math import atan2, cos, hypot, inf, pi, radians
 from pyproj import Geod
 from quantity import *
 from typing import Any, Generic, Protocol, Sequence, TypeVar
@@ -163,6 +163,75 @@ class MapMetrics:
                         12 + (self.lat_max - point.latitude) * self.scale_factor)
 
 
+# shapes are simplified for zoom levels up to each of these zooms with the paired tolerance in meters
+simplification_bands: tuple[tuple[int, float], ...] = ((11, 40.0), (13, 10.0), (15, 2.5))
+
+
+def __segment_distance__(point: tuple[float, float], a: tuple[float, float], b: tuple[float, float]) -> float:
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length: float = dx * dx + dy * dy
+    t: float = 0 if length == 0 else max(0.0, min(1.0, ((point[0] - a[0]) * dx + (point[1] - a[1]) * dy) / length))
+    return hypot(point[0] - a[0] - t * dx, point[1] - a[1] - t * dy)
+
+
+def simplification_ranks(points: Sequence[Sequence[float]],
+                         bands: Sequence[tuple[int, float]] = simplification_bands) -> str:
+    if len(points) < 3:
+        return '0' * len(points)
+    # Douglas-Peucker keeps a superset of the coarser result at every finer tolerance, so a single pass
+    # assigns each point the coarsest band it survives in: rank r is drawn above the zoom of band r - 1
+    scale: float = 111_320 * cos(radians(sum(point[0] for point in points) / len(points)))
+    xy: list[tuple[float, float]] = [(point[1] * scale, point[0] * 110_574) for point in points]
+    significance: list[float] = [0.0] * len(points)
+    significance[0] = significance[-1] = inf
+    pending: list[tuple[int, int, float]] = [(0, len(points) - 1, inf)]
+    while pending:
+        first, last, limit = pending.pop()
+        if last - first < 2:
+            continue
+        distance, index = max((__segment_distance__(xy[i], xy[first], xy[last]), i) for i in range(first + 1, last))
+        significance[index] = min(distance, limit)
+        pending += [(first, index, significance[index]), (index, last, significance[index])]
+    return ''.join(str(sum(tolerance >= s for _, tolerance in bands)) for s in significance)
+
+
+def encode_polyline(points: Sequence[Sequence[float]], precision: int = 6) -> str:
+    # the encoded polyline algorithm, with coordinates stored as deltas of integer multiples of 10^-precision degrees
+    factor: int = 10 ** precision
+    chunks: list[str] = []
+    previous: tuple[int, int] = (0, 0)
+    for point in points:
+        current: tuple[int, int] = (round(point[0] * factor), round(point[1] * factor))
+        for delta in (current[0] - previous[0], current[1] - previous[1]):
+            value: int = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | value & 0x1f) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous = current
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded: str, precision: int = 6) -> list[geopoint]:
+    factor: int = 10 ** precision
+    points: list[geopoint] = []
+    coordinates: list[int] = [0, 0]
+    index: int = 0
+    while index < len(encoded):
+        for axis in (0, 1):
+            value, shift = 0, 0
+            while True:
+                chunk: int = ord(encoded[index]) - 63
+                index += 1
+                value |= (chunk & 0x1f) << shift
+                shift += 5
+                if chunk < 0x20:
+                    break
+            coordinates[axis] += ~(value >> 1) if value & 1 else value >> 1
+        points.append(geopoint(coordinates[0] / factor, coordinates[1] / factor))
+    return points
+
+
 def next_midpoint(previous_dir: vector2f, current_point: vector2f, next_point: vector2f,
                   alternative_direction: bool) -> tuple[vector2f, vector2f, vector2f]:
     delta: vector2f = next_point - current_point
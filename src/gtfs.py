@@ -1,15 +1,17 @@
 import sqlite3
 from data import *
 from database import Database
+from pipeline import stage
 from util import *
 
 
 # noinspection SqlNoDataSourceInspection,DuplicatedCode,SqlInsertValues
+@stage('create_gtfs_database')
 def create_gtfs_database() -> sqlite3.Connection:
     log('    Creating temporary SQL database... ')
     db: sqlite3.Connection = sqlite3.connect(':memory:')
 
-    with open(ref.rawdata_stops, 'r') as file:
+    with stage('read_stops_txt'), open(ref.rawdata_stops, 'r') as file:
         log(f'      Reading stops data from {ref.rawdata_stops}... ', end='')
         reader = csv.reader(file)
         header_row = next(reader)
@@ -17,7 +19,7 @@ def create_gtfs_database() -> sqlite3.Connection:
         db.executemany(f'INSERT INTO stops VALUES ({','.join('?' * len(header_row))})', reader)
         log('Done!')
 
-    with open(ref.rawdata_stop_times, 'r') as file:
+    with stage('read_stop_times_txt'), open(ref.rawdata_stop_times, 'r') as file:
         log(f'      Reading stop times data from {ref.rawdata_stop_times}... ', end='')
         reader = csv.reader(file)
         header_row = next(reader)
@@ -25,7 +27,7 @@ def create_gtfs_database() -> sqlite3.Connection:
         db.executemany(f'INSERT INTO stop_times VALUES ({','.join('?' * len(header_row))})', reader)
         log('Done!')
 
-    with open(ref.rawdata_trips, 'r') as file:
+    with stage('read_trips_txt'), open(ref.rawdata_trips, 'r') as file:
         log(f'      Reading trips data from {ref.rawdata_trips}... ', end='')
         reader = csv.reader(file)
         header_row = next(reader)
@@ -37,6 +39,7 @@ def create_gtfs_database() -> sqlite3.Connection:
 
 
 # noinspection SqlNoDataSourceInspection
+@stage('attach_stop_lines')
 def attach_stop_lines(gtfs_db: sqlite3.Connection) -> None:
     log('    Attaching line nubmers to stops... ', end='')
     cursor: sqlite3.Cursor = gtfs_db.cursor()
@@ -66,6 +69,7 @@ def attach_stop_lines(gtfs_db: sqlite3.Connection) -> None:
     log('Done!')
 
 
+@stage('attach_line_routes')
 def attach_line_routes(gtfs_db: sqlite3.Connection) -> None:
     log('    Attaching route ids to lines... ', end='')
     cursor: sqlite3.Cursor = gtfs_db.cursor()
@@ -97,6 +101,7 @@ def attach_line_routes(gtfs_db: sqlite3.Connection) -> None:
     log('Done!')
 
 
+@stage('attach_line_stops')
 def attach_line_stops(gtfs_db: sqlite3.Connection) -> None:
     log('    Attaching stop codes to lines... ', end='')
     cursor: sqlite3.Cursor = gtfs_db.cursor()
@@ -142,6 +147,7 @@ def attach_line_stops(gtfs_db: sqlite3.Connection) -> None:
     log('Done!')
 
 
+@stage('update_gtfs_data')
 def update_gtfs_data(db: Database) -> None:
     first_update: bool = get_last_update_time() == 'never'
     old_db: Database = Database.partial()
@@ -151,11 +157,12 @@ def update_gtfs_data(db: Database) -> None:
         if os.path.exists(ref.rawdata_lines):
             old_db.lines = Line.read_dict(ref.rawdata_lines)
     log(f'  Downloading latest GTFS data from {ref.url_ztm_gtfs}... ', end='')
-    os.system('wget --header="Accept: application/octet-stream" '
-              f'"{ref.url_ztm_gtfs}" -O "{ref.tmpdata_gtfs}" > /dev/null 2>&1')
+    with stage('download_gtfs'):
+        os.system('wget --header="Accept: application/octet-stream" '
+                  f'"{ref.url_ztm_gtfs}" -O "{ref.tmpdata_gtfs}" > /dev/null 2>&1')
     log('Done!')
     log('  Extracting GTFS data... ', end='')
-    with zip_file(ref.tmpdata_gtfs, 'r') as gtfs_zip:
+    with stage('extract_gtfs'), zip_file(ref.tmpdata_gtfs, 'r') as gtfs_zip:
         gtfs_zip.extract_as('stops.txt', ref.rawdata_stops)
         gtfs_zip.extract_as('stop_times.txt', ref.rawdata_stop_times)
         gtfs_zip.extract_as('trips.txt', ref.rawdata_trips)
@@ -171,12 +178,14 @@ def update_gtfs_data(db: Database) -> None:
     os.remove(ref.rawdata_stop_times)
     os.remove(ref.rawdata_trips)
 
-    db.stops, db.stop_groups = Stop.read_stops(ref.rawdata_stops, db)
-    db.routes = Route.read_dict(ref.rawdata_routes)
-    db.lines = Line.read_dict(ref.rawdata_lines)
+    with stage('read_gtfs_data'):
+        db.stops, db.stop_groups = Stop.read_stops(ref.rawdata_stops, db)
+        db.routes = Route.read_dict(ref.rawdata_routes)
+        db.lines = Line.read_dict(ref.rawdata_lines)
 
     if not first_update:
-        db.report_old_data(old_db)
+        with stage('report_old_data'):
+            db.report_old_data(old_db)
 
 
 def get_last_update_time() -> str:
@@ -0,0 +1,173 @@
+import json
+import os
+import re
+import util
+from data import JsonSerializable
+from typing import Any, Callable, Iterable, Self, TextIO
+
+
+def shard_directory(path: str) -> str:
+    return re.sub(r'(\.min)?\.js$', '', path)
+
+
+def __literal__(value: Any) -> str:
+    # U+2028 and U+2029 are valid inside JSON strings, but end string literals in pre-ES2019 JavaScript engines
+    return (json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+            .replace('\u2028', '\\u2028').replace('\u2029', '\\u2029'))
+
+
+def __entry__(key: str, record: dict[str, Any]) -> str:
+    fields: str = ','.join(f'{field}:{__literal__(value)}' for field, value in record.items())
+    return f'{__literal__(key)}:{{{fields}}},\n'
+
+
+def __string_literal__(text: str) -> str:
+    escaped: str = text.replace('\\', '\\\\').replace("'", "\\'")
+    return "'" + escaped.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029') + "'"
+
+
+def __strings__(value: Any, strings: list[str]) -> bool:
+    if isinstance(value, str):
+        strings.append(value)
+    elif isinstance(value, list | tuple):
+        return all(__strings__(item, strings) for item in value)
+    return value is None or isinstance(value, str)
+
+
+class ColumnarTable:
+    def __init__(self):
+        self.datasets: dict[str, tuple[list[str], dict[str, list[Any]]]] = {}
+        self.strings: list[str] = []
+        self.__indices__: dict[str, int] = {}
+
+    def add(self, name: str, key: str, record: dict[str, Any]) -> None:
+        keys, columns = self.datasets.setdefault(name, ([], {}))
+        for field, value in record.items():
+            columns.setdefault(field, [None] * len(keys)).append(value)
+        keys.append(key)
+        for column in columns.values():
+            if len(column) < len(keys):
+                column.append(None)
+
+    def intern(self, value: Any) -> Any:
+        if isinstance(value, str):
+            index: int | None = self.__indices__.get(value)
+            if index is None:
+                index = self.__indices__[value] = len(self.strings)
+                self.strings.append(value)
+            return index
+        return [self.intern(item) for item in value] if isinstance(value, list | tuple) else value
+
+    def __worth_interning__(self, column: list[Any]) -> bool:
+        # only columns of strings are interned, and only where the references take less space than the repeats
+        strings: list[str] = []
+        if not __strings__(column, strings) or not strings:
+            return False
+        new: set[str] = {string for string in set(strings) if string not in self.__indices__}
+        reference_width: int = len(str(len(self.strings) + len(new)))
+        return len(strings) * reference_width + sum(len(string) + 3 for string in new) \
+            < sum(len(string) + 2 for string in strings)
+
+    def script(self) -> str:
+        datasets: list[dict[str, Any]] = []
+        for keys, columns in self.datasets.values():
+            interned: list[str] = [field for field, column in columns.items() if self.__worth_interning__(column)]
+            encoded: dict[str, list[Any]] = {}
+            dictionaries: dict[str, list[Any]] = {}
+            for field, column in columns.items():
+                # repeated lists, like the line and destination pairs shared by neighbouring stops, are stored once
+                distinct: dict[str, int] = {}
+                rows: list[int | None] = [distinct.setdefault(__literal__(value), len(distinct))
+                                          if value is not None else None for value in column]
+                if any(isinstance(value, list | tuple) for value in column) and 2 * len(distinct) <= len(column):
+                    dictionary: list[Any] = [None] * len(distinct)
+                    for value, row in zip(column, rows):
+                        if row is not None:
+                            dictionary[row] = value
+                    column, dictionaries[field] = rows, self.intern(dictionary) if field in interned else dictionary
+                elif field in interned:
+                    column = self.intern(column)
+                encoded[field] = column
+            datasets.append({'k': self.intern(keys) if self.__worth_interning__(keys) else keys,
+                             'c': encoded, 'i': interned, 't': dictionaries})
+        # V8 and SpiderMonkey parse a JSON string noticeably faster than the equivalent object literal
+        payload: str = json.dumps({'s': self.strings, 'd': datasets}, ensure_ascii=False, separators=(',', ':'))
+        return f'columnarData.push([[{','.join(self.datasets)}],JSON.parse({__string_literal__(payload)})]);\n'
+
+
+class DataWriter:
+    def __init__(self, path: str, columnar: bool = False):
+        self.path: str = path
+        self.directory: str = shard_directory(path)
+        self.columnar: bool = columnar
+        self.manifest: dict[str, dict[str, str]] = {}
+        self.__file__: TextIO | None = None
+        self.__tables__: dict[str, ColumnarTable] = {}
+
+    def __enter__(self) -> Self:
+        if os.path.isdir(self.directory):
+            util.clear_directory(self.directory)
+        self.__file__ = open(util.prepare_path(self.path), 'w')
+        if self.columnar:
+            self.__file__.write('var columnarData = columnarData || [];\n')
+        return self
+
+    def __exit__(self, *_) -> None:
+        for path, table in self.__tables__.items():
+            if path == self.path:
+                self.__file__.write(table.script())
+            else:
+                with open(path, 'w') as file:
+                    file.write(f'var columnarData = columnarData || [];\n{table.script()}')
+        self.__file__.close()
+        if self.manifest:
+            with open(f'{self.directory}/manifest.json', 'w') as file:
+                json.dump(self.manifest, file, ensure_ascii=False, indent=2)
+
+    def __shard_path__(self, name: str, shard: str) -> str:
+        shard_name: str = re.sub(r'[^\w-]', '_', shard) or '_'
+        shards: dict[str, str] = self.manifest.setdefault(name, {})
+        if shard_name not in shards:
+            shards[shard_name] = util.prepare_path(f'{self.directory}/{name}-{shard_name}.min.js')
+        return shards[shard_name]
+
+    def write(self, name: str, objects: Iterable[JsonSerializable],
+              shard: Callable[[JsonSerializable], str] | None = None) -> None:
+        if self.columnar:
+            # columns can only be written once all entries are known, so the tables are flushed when the writer closes
+            self.__file__.write(f'const {name} = {{}};\n')
+            for obj in objects:
+                path: str = self.path if shard is None else self.__shard_path__(name, shard(obj))
+                self.__tables__.setdefault(path, ColumnarTable()).add(name, *obj.__json_entry__())
+            return
+        if shard is None:
+            self.__file__.write(f'const {name} = {{\n')
+            for obj in objects:
+                self.__file__.write(__entry__(*obj.__json_entry__()))
+            self.__file__.write('};\n')
+            return
+        # the main file only declares the object, which each shard script then extends with its part of the entries
+        self.__file__.write(f'const {name} = {{}};\n')
+        shards: dict[str, TextIO] = {}
+        try:
+            for obj in objects:
+                shard_path: str = self.__shard_path__(name, shard(obj))
+                file: TextIO | None = shards.get(shard_path)
+                if file is None:
+                    file = shards[shard_path] = open(shard_path, 'w')
+                    file.write(f'Object.assign({name}, {{\n')
+                file.write(__entry__(*obj.__json_entry__()))
+        finally:
+            for file in shards.values():
+                file.write('});\n')
+                file.close()
+
+
+def manifest(*paths: str) -> dict[str, dict[str, str]]:
+    shards: dict[str, dict[str, str]] = {}
+    for path in paths:
+        manifest_path: str = f'{shard_directory(path)}/manifest.json'
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as file:
+                shards.update(json.load(file))
+    return shards
@@ -5,16 +5,29 @@ from data import Raid
 from database import Database
 from log import *
 
+__environment__: jinja2.Environment | None = None
+
+
+def __get_environment__() -> jinja2.Environment:
+    # created on first use, like the environment of UIBuilder, so importing the module creates no directories
+    global __environment__
+    if __environment__ is None:
+        __environment__ = jinja2.Environment(loader=jinja2.FileSystemLoader('.'),
+                                             bytecode_cache=jinja2.FileSystemBytecodeCache(
+                                                 util.prepare_path(ref.cache_templates_bytecode,
+                                                                   path_is_directory=True)))
+    return __environment__
+
 
 def make_raid_kml(raid: Raid, output_path: str) -> None:
     log(f'Exporting raid {raid.raid_id} to {output_path}... ', end='')
     with open(util.prepare_file(output_path), 'w') as f:
-        f.write(jinja2.Template(util.file_to_string(ref.codegen_template_kml_raid)).render(raid=raid))
+        f.write(__get_environment__().get_template(ref.codegen_template_kml_raid).render(raid=raid))
     log('Done!')
 
 
 def make_gtfs_kml(db: Database, output_path: str) -> None:
     log(f'Exporting GTFS data to {output_path}... ', end='')
     with open(util.prepare_file(output_path), 'w') as f:
-        f.write(jinja2.Template(util.file_to_string(ref.codegen_template_kml_gtfs)).render(db=db))
+        f.write(__get_environment__().get_template(ref.codegen_template_kml_gtfs).render(db=db))
     log('Done!')
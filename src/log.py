@@ -1,7 +1,9 @@
 import sys
-from typing import Any
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Iterator
 
-__error_log__: list[str] = []
+__error_log__: ContextVar[list[str]] = ContextVar('error_log', default=[])
 __logging_enabled__: bool = True
 
 
@@ -10,24 +12,39 @@ def enable_logging(enabled: bool) -> None:
     __logging_enabled__ = enabled
 
 
+def logging_enabled() -> bool:
+    return __logging_enabled__
+
+
 def log(*args: Any, **kwargs: Any) -> None:
     if __logging_enabled__:
         print(*args, **kwargs)
 
 
 def error(*args: Any) -> None:
-    __error_log__.append(' '.join(map(str, args)))
+    __error_log__.get().append(' '.join(map(str, args)))
 
 
 def errors_present() -> bool:
-    return len(__error_log__) > 0
+    return len(__error_log__.get()) > 0
 
 
 def flush_errors() -> list[str]:
-    errors: list[str] = list(__error_log__)
-    __error_log__.clear()
+    errors: list[str] = list(__error_log__.get())
+    __error_log__.get().clear()
     return errors
 
 
+@contextmanager
+def error_log() -> Iterator[list[str]]:
+    # errors logged in this context, including threads started with a copy of it, go to a separate log
+    errors: list[str] = []
+    token: Token[list[str]] = __error_log__.set(errors)
+    try:
+        yield errors
+    finally:
+        __error_log__.reset(token)
+
+
 def print_errors() -> None:
     [print(message, file=sys.stderr) for message in flush_errors()]
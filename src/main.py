@@ -1,3 +1,12 @@
 if __name__ == '__main__':
+    import args
     from server import Server
-    Server().run()
+    Server(precompress=args.option_present('precompress'), debug=args.option_present('debug'),
+           memory_report=args.option_present('memory-report'),
+           precompiled_templates=args.option_present('precompile-templates'),
+           direct_map=args.option_present('direct-map'),
+           lazy_stop_popups=args.option_present('lazy-stop-popups'),
+           map_tiles=args.option_present('map-tiles'),
+           shard_data=args.option_present('shard-data'),
+           columnar_data=args.option_present('columnar-data'),
+           traces=args.option_present('traces')).run()
@@ -0,0 +1,162 @@
+import json
+import os
+import ref
+import sys
+import tracemalloc
+import util
+from contextlib import contextmanager
+from datetime import datetime
+from threading import local, Lock
+from types import BuiltinFunctionType, FunctionType, MethodType, ModuleType
+from typing import Any, Iterator
+
+__enabled__: bool = False
+__frames__: local = local()
+__mutex__: Lock = Lock()
+__stage_stats__: dict[str, dict[str, int]] = {}
+__runs__: list[list[dict[str, Any]]] = []
+__last_report__: dict[str, Any] | None = None
+
+database_collections: tuple[str, ...] = ('players', 'stops', 'stop_groups', 'terminals', 'carriers', 'regions',
+                                         'vehicles', 'models', 'routes', 'lines', 'raids', 'scheduled_changes',
+                                         'announcements')
+__opaque_types__: tuple[type, ...] = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType)
+
+
+def __reset_after_fork__() -> None:
+    global __mutex__
+    __mutex__ = Lock()
+    __runs__.clear()
+
+
+os.register_at_fork(after_in_child=__reset_after_fork__)
+
+
+def enable(frames: int = 1) -> None:
+    global __enabled__
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    __enabled__ = True
+
+
+def enabled() -> bool:
+    return __enabled__
+
+
+def __stack__() -> list[list[int]]:
+    if not hasattr(__frames__, 'stack'):
+        __frames__.stack = []
+    return __frames__.stack
+
+
+def stage_started() -> list[int] | None:
+    if not __enabled__:
+        return None
+    stack: list[list[int]] = __stack__()
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:  # reset_peak() is global, so the enclosing stage keeps the peak it has reached so far
+        stack[-1][1] = max(stack[-1][1], peak)
+    tracemalloc.reset_peak()
+    frame: list[int] = [current, current]
+    stack.append(frame)
+    return frame
+
+
+def stage_finished(name: str, frame: list[int] | None) -> None:
+    if frame is None:
+        return
+    stack: list[list[int]] = __stack__()
+    stack.pop()
+    current, peak = tracemalloc.get_traced_memory()
+    peak = max(peak, frame[1])
+    if stack:
+        stack[-1][1] = max(stack[-1][1], peak)
+    measurement: dict[str, int] = {'peak_bytes': peak - frame[0], 'retained_bytes': current - frame[0]}
+    with __mutex__:
+        stats: dict[str, int] = __stage_stats__.setdefault(name, {'runs': 0, 'max_peak_bytes': 0,
+                                                                  'total_retained_bytes': 0})
+        stats['runs'] += 1
+        stats['max_peak_bytes'] = max(stats['max_peak_bytes'], measurement['peak_bytes'])
+        stats['total_retained_bytes'] += measurement['retained_bytes']
+        stats.update({f'last_{key}': value for key, value in measurement.items()})
+        for run in __runs__:
+            run.append({'stage': name, **measurement})
+
+
+def approximate_size(root: Any, excluded: set[int]) -> int:
+    size: int = 0
+    seen: set[int] = set(excluded)
+    pending: list[Any] = [root]
+    while pending:
+        item: Any = pending.pop()
+        if id(item) in seen or isinstance(item, __opaque_types__):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend(item)
+        elif not isinstance(item, (str, bytes, int, float, bool)) and item is not None:
+            if hasattr(item, '__dict__'):
+                pending.append(vars(item))
+            for slot in getattr(type(item), '__slots__', ()):
+                if hasattr(item, slot):
+                    pending.append(getattr(item, slot))
+    return size
+
+
+def collection_sizes(db: Any) -> dict[str, int]:
+    collections: dict[str, Any] = {name: getattr(db, name) for name in database_collections}
+    roots: dict[str, set[int]] = {name: {id(e) for e in (c.values() if isinstance(c, dict) else c)}
+                                  for name, c in collections.items()}
+    sizes: dict[str, int] = {}
+    for name, collection in collections.items():
+        # entities owned by other collections are not counted here, so shared references are attributed only once
+        excluded: set[int] = {id(db)}.union(*(ids for other, ids in roots.items() if other != name))
+        sizes[name] = approximate_size(collection, excluded - roots[name])
+    return dict(sorted(sizes.items(), key=lambda entry: entry[1], reverse=True))
+
+
+def stage_statistics() -> dict[str, dict[str, int]]:
+    with __mutex__:
+        return {name: dict(stats) for name, stats in __stage_stats__.items()}
+
+
+def last_report() -> dict[str, Any] | None:
+    return __last_report__
+
+
+@contextmanager
+def report(name: str, database: Any = None, limit: int = 20, directory: str | None = ref.report_memory) -> Iterator[None]:
+    global __last_report__
+    if not __enabled__:
+        yield
+        return
+    run: list[dict[str, Any]] = []
+    with __mutex__:
+        __runs__.append(run)
+    before: tracemalloc.Snapshot = tracemalloc.take_snapshot()
+    try:
+        yield
+    finally:
+        after: tracemalloc.Snapshot = tracemalloc.take_snapshot()
+        with __mutex__:
+            __runs__.remove(run)
+        __last_report__ = {
+            'pipeline': name,
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'traced_bytes': tracemalloc.get_traced_memory()[0],
+            'stages': run,
+            'largest_retained_allocations': [{'location': str(stat.traceback), 'size_diff_bytes': stat.size_diff,
+                                              'count_diff': stat.count_diff}
+                                             for stat in after.compare_to(before, 'lineno')[:limit]],
+            'database_collections': collection_sizes(database() if callable(database) else database)
+            if database is not None else {},
+        }
+        if directory is not None:
+            file_name: str = ''.join(c if c.isalnum() or c in '-_' else '_' for c in name)
+            output_path: str = f'{directory}/{datetime.now().strftime("%Y%m%d-%H%M%S")}-{file_name}.json'
+            with open(util.prepare_path(output_path), 'w') as file:
+                json.dump(__last_report__, file, indent=2)
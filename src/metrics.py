@@ -0,0 +1,153 @@
+import os
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from threading import Lock
+from typing import Callable, Iterator
+
+__metrics__: list['Metric'] = []
+__registry_mutex__: Lock = Lock()
+
+request_buckets: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+stage_buckets: tuple[float, ...] = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def __format_value__(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def __format_labels__(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ''
+    escaped: list[str] = [str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for v in values]
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, escaped)) + '}'
+
+
+class Metric(ABC):
+    kind: str = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labels: tuple[str, ...] = labels
+        self.__mutex__: Lock = Lock()
+        with __registry_mutex__:
+            __metrics__.append(self)
+
+    @abstractmethod
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        pass
+
+    def render(self) -> str:
+        lines: list[str] = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines += [f'{name}{__format_labels__(names, values)} {__format_value__(value)}'
+                  for name, names, values, value in self.samples()]
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind: str = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.__values__: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self.__mutex__:
+            self.__values__[labels] = self.__values__.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        with self.__mutex__:
+            values: list[tuple[tuple[str, ...], float]] = list(self.__values__.items())
+        for labels, value in values:
+            yield self.name, self.labels, labels, value
+
+
+class Gauge(Metric):
+    kind: str = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 function: Callable[[], dict[tuple[str, ...], float]] | None = None):
+        super().__init__(name, documentation, labels)
+        self.__values__: dict[tuple[str, ...], float] = {}
+        self.function: Callable[[], dict[tuple[str, ...], float]] | None = function
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self.__mutex__:
+            self.__values__[labels] = self.__values__.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self.__mutex__:
+            self.__values__[labels] = value
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        with self.__mutex__:
+            values: dict[tuple[str, ...], float] = dict(self.__values__)
+        if self.function is not None:
+            values.update(self.function())
+        for labels, value in values.items():
+            yield self.name, self.labels, labels, value
+
+
+class Histogram(Metric):
+    kind: str = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = request_buckets):
+        super().__init__(name, documentation, labels)
+        self.buckets: tuple[float, ...] = (*sorted(buckets), float('inf'))
+        self.__counts__: dict[tuple[str, ...], list[int]] = {}
+        self.__sums__: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index: int = bisect_left(self.buckets, value)
+        with self.__mutex__:
+            counts: list[int] | None = self.__counts__.get(labels)
+            if counts is None:
+                counts = self.__counts__[labels] = [0] * len(self.buckets)
+                self.__sums__[labels] = 0
+            counts[index] += 1
+            self.__sums__[labels] += value
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        with self.__mutex__:
+            snapshot: list[tuple[tuple[str, ...], list[int], float]] = [(labels, list(counts), self.__sums__[labels])
+                                                                        for labels, counts in self.__counts__.items()]
+        for labels, counts, total in snapshot:
+            cumulative: int = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', (*self.labels, 'le'), (*labels, __format_value__(bound)), cumulative
+            yield f'{self.name}_sum', self.labels, labels, total
+            yield f'{self.name}_count', self.labels, labels, cumulative
+
+
+def __reset_after_fork__() -> None:
+    global __registry_mutex__
+    # a lock held by another parent thread at fork time would never be released in the child
+    __registry_mutex__ = Lock()
+    for metric in __metrics__:
+        metric.__mutex__ = Lock()
+
+
+os.register_at_fork(after_in_child=__reset_after_fork__)
+
+
+def render() -> str:
+    with __registry_mutex__:
+        metrics: list[Metric] = list(__metrics__)
+    return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+requests_total: Counter = Counter('pokestops_http_requests_total', 'HTTP requests handled.',
+                                  ('method', 'route', 'status'))
+request_duration: Histogram = Histogram('pokestops_http_request_duration_seconds', 'HTTP request latency.',
+                                        ('method', 'route'))
+requests_in_flight: Gauge = Gauge('pokestops_http_requests_in_flight', 'HTTP requests currently being handled.')
+stage_duration: Histogram = Histogram('pokestops_stage_duration_seconds', 'Pipeline stage duration.',
+                                      ('stage', 'success'), stage_buckets)
+requests_in_flight.set(0)
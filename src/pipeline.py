@@ -0,0 +1,83 @@
+import events
+import memory
+import metrics
+import time
+import tracing
+from concurrent.futures import Future
+from contextlib import contextmanager
+from threading import local, Lock
+from typing import Any, Callable, Hashable, Iterator, TypeVar
+
+T = TypeVar('T')
+__stages__: local = local()
+
+
+class PipelineError(Exception):
+    def __init__(self, cause: Exception, errors: list[str]):
+        super().__init__(str(cause))
+        self.cause: Exception = cause
+        self.errors: list[str] = errors
+
+
+class SingleFlight:
+    def __init__(self):
+        self.__flights__: dict[Hashable, Future] = {}
+        self.__mutex__: Lock = Lock()
+
+    def run(self, key: Hashable, function: Callable[[], T]) -> T:
+        with self.__mutex__:
+            flight: Future | None = self.__flights__.get(key)
+            leader: bool = flight is None
+            if leader:
+                flight = self.__flights__[key] = Future()
+        if not leader:
+            return flight.result()
+        try:
+            result: T = function()
+            flight.set_result(result)
+            return result
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self.__mutex__:
+                del self.__flights__[key]
+
+    def in_flight(self) -> list[Hashable]:
+        with self.__mutex__:
+            return list(self.__flights__.keys())
+
+
+def current_stages() -> list[str]:
+    if not hasattr(__stages__, 'stack'):
+        __stages__.stack = []
+    return __stages__.stack
+
+
+@contextmanager
+def stage(name: str, **details: Any) -> Iterator[None]:
+    stack: list[str] = current_stages()
+    parent: str | None = stack[-1] if stack else None
+    stack.append(name)
+    events.publish('stage-start', stage=name, parent=parent, **details)
+    allocations: list[int] | None = memory.stage_started()
+    start: float = time.perf_counter()
+    success: bool = False
+    try:
+        yield
+        success = True
+    finally:
+        duration: float = time.perf_counter() - start
+        memory.stage_finished(name, allocations)
+        stack.pop()
+        metrics.stage_duration.observe(duration, name, 'true' if success else 'false')
+        tracing.record(name, start, duration, {'parent': parent, 'success': success, **details})
+        events.publish('stage-end', stage=name, parent=parent, duration_s=duration, success=success, **details)
+
+
+def replay(spans: list[tracing.Span]) -> None:
+    for span in spans:
+        success: bool = bool(span.details.get('success'))
+        metrics.stage_duration.observe(span.duration, span.name, 'true' if success else 'false')
+        tracing.add(span)
+        events.publish('stage-end', stage=span.name, duration_s=span.duration, **span.details)
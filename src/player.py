@@ -3,6 +3,7 @@ import util
 from data import __read_collection__
 from data import *
 from functools import cmp_to_key
+from pipeline import stage
 from typing import Iterable, Literal
 
 
@@ -96,6 +97,9 @@ class ChronoLoader:
         self.current_day_count: int = 0
         self.error_generator: Callable[[list[str]], str] = error_generator
 
+    def accepts(self, date_string: str) -> bool:
+        return DateAndOrder(date_string=date_string) >= self.current_day
+
     def next(self, row: list[str]) -> DateAndOrder:
         if DateAndOrder(date_string=row[1]) > self.current_day:
             self.current_day = DateAndOrder(date_string=row[1])
@@ -119,6 +123,15 @@ class Player(JsonSerializable):
         self.__terminals_file__: str = f'{ref.playerdata_path}/{nickname_lowercase}/{ref.playerdata_file_terminals}'
         self.__lines_file__: str = f'{ref.playerdata_path}/{nickname_lowercase}/{ref.playerdata_file_lines}'
         self.__vehicles_file__: str = f'{ref.playerdata_path}/{nickname_lowercase}/{ref.playerdata_file_vehicles}'
+        self.__stops_loader__: ChronoLoader = ChronoLoader(
+            lambda r: f'{self.nickname}\'s stop visits are not in chronological order, '
+                      f'change position of the ({r[0]},{r[1]}) entry in her stops file')
+        self.__lines_loader__: ChronoLoader = ChronoLoader(
+            lambda r: f'{self.nickname}\'s line discoveries are not in chronological order, '
+                      f'change position of the ({r[0]},{r[1]}) entry in her lines file')
+        self.__vehicles_loader__: ChronoLoader = ChronoLoader(
+            lambda r: f'{self.nickname}\'s vehicle discoveries are not in chronological order, '
+                      f'change position of the ({r[0]},{r[1]}) entry in her vehicles file')
 
     def __eq__(self, other):
         return self.nickname == other.nickname if isinstance(other, type(self)) else False
@@ -139,18 +152,25 @@ class Player(JsonSerializable):
         prepare_file(self.__lines_file__, 'line_number,date_discovered\n')
         prepare_file(self.__vehicles_file__, 'vehicle_id,date_discovered\n')
 
+    @staticmethod
+    def __find_stop_change__(db: Database, stop_id: str) -> StopChange | None:
+        return find_first(lambda c: stop_id == c.old_stop.short_name, db.get_effective_changes())
+
+    @staticmethod
+    def __find_combined_vehicle__(db: Database, vehicle_id: str) -> str | None:
+        return next((v for v in db.vehicles.keys() if v.startswith(f'{vehicle_id}+') or v.endswith(f'+{vehicle_id}') or
+                     v == f'{"+".join(vehicle_id.split("+")[::-1])}'), None)
+
     def __load_stops__(self, db: Database) -> None:
-        loader: ChronoLoader = ChronoLoader(lambda r: f'{self.nickname}\'s stop visits are not in chronological order, '
-                                                      f'change position of the ({r[0]},{r[1]}) entry in her stops file')
         stop_rows, stop_comments = get_csv_rows(self.__stops_file__)
         for row in stop_rows:
             stop: Stop | None = db.stops.get(row[0])
-            date: DateAndOrder = loader.next(row)
+            date: DateAndOrder = self.__stops_loader__.next(row)
             if stop:
                 stop.add_visit(self, date)
                 self.logbook.add_stop(stop, date)
             else:
-                change: StopChange | None = find_first(lambda c: row[0] == c.old_stop.short_name, db.get_effective_changes())
+                change: StopChange | None = Player.__find_stop_change__(db, row[0])
                 if change:
                     error(f'{self.nickname} has visited stop {row[0]}, which is now {change.new_stop.short_name}, '
                           f'change the {row[1]} entry in her stops file')
@@ -170,7 +190,7 @@ class Player(JsonSerializable):
                 stop.add_visit(self)
                 self.logbook.add_stop(stop)
             else:
-                change = find_first(lambda c: row[0] == c.old_stop.short_name, db.get_effective_changes())
+                change = Player.__find_stop_change__(db, row[0])
                 if change:
                     error(f'{self.nickname} has visited stop {row[0]}, which is now {change.new_stop.short_name}, '
                           f'change the entry in her EV stops file')
@@ -203,12 +223,10 @@ class Player(JsonSerializable):
                       f'restore the entry in her terminals file')
 
     def __load_lines__(self, db: Database) -> None:
-        loader: ChronoLoader = ChronoLoader(lambda r: f'{self.nickname}\'s line discoveries are not in chronological order, '
-                                                      f'change position of the ({r[0]},{r[1]}) entry in her lines file')
         line_rows, line_comments = get_csv_rows(self.__lines_file__)
         for row in line_rows:
             line = db.lines.get(row[0])
-            date: DateAndOrder = loader.next(row)
+            date: DateAndOrder = self.__lines_loader__.next(row)
             if line:
                 line.add_discovery(self, date)
                 self.logbook.add_line(line, date)
@@ -221,19 +239,15 @@ class Player(JsonSerializable):
                       f'restore the {row[1]} entry in her lines file')
 
     def __load_vehicles__(self, db: Database) -> None:
-        loader: ChronoLoader = ChronoLoader(lambda r: f'{self.nickname}\'s vehicle discoveries are not in chronological order, '
-                                                      f'change position of the ({r[0]},{r[1]}) entry in her vehicles file')
         vehicle_rows, vehicle_comments = get_csv_rows(self.__vehicles_file__)
         for row in vehicle_rows:
             vehicle = db.vehicles.get(row[0])
-            date: DateAndOrder = loader.next(row)
+            date: DateAndOrder = self.__vehicles_loader__.next(row)
             if vehicle:
                 vehicle.add_discovery(self, date)
                 self.logbook.add_vehicle(vehicle, date)
             else:
-                combined: str | None = next((v for v in db.vehicles.keys() if
-                                             v.startswith(f'{row[0]}+') or v.endswith(f'+{row[0]}') or
-                                             v == f'{"+".join(row[0].split("+")[::-1])}'), None)
+                combined: str | None = Player.__find_combined_vehicle__(db, row[0])
                 if combined:
                     error(f'{self.nickname} has discovered vehicle #{row[0]}, which is part of a combined vehicle #{combined}, '
                           f'change the {row[1]} entry in her vehicles file')
@@ -246,12 +260,105 @@ class Player(JsonSerializable):
                       f'restore the {row[1]} entry in her vehicles file')
 
     def load_data(self, db: Database) -> None:
+        with stage('load_player_data', player=self.nickname):
+            self.__init_files__()
+            with stage('load_stops'):
+                self.__load_stops__(db)
+            with stage('load_ev_stops'):
+                self.__load_ev_stops__(db)
+            with stage('load_terminals'):
+                self.__load_terminals__(db)
+            with stage('load_lines'):
+                self.__load_lines__(db)
+            with stage('load_vehicles'):
+                self.__load_vehicles__(db)
+
+    @staticmethod
+    def __append_row__(file_path: str, row: list[str]) -> None:
+        needs_newline: bool = False
+        with open(file_path, 'rb') as file:
+            if file.seek(0, os.SEEK_END) > 0:
+                file.seek(-1, os.SEEK_END)
+                needs_newline = file.read(1) != b'\n'
+        with open(file_path, 'a', newline='') as file:
+            if needs_newline:
+                file.write('\n')
+            csv.writer(file, lineterminator='\n').writerow(row)
+            file.flush()
+            os.fsync(file.fileno())
+
+    @staticmethod
+    def __parse_date__(date_string: str) -> str:
+        date: DateAndOrder = DateAndOrder(date_string=date_string, string_format='y-m-d')
+        date.to_date()
+        return date.format('y-m-d')
+
+    def __check_chronology__(self, loader: ChronoLoader, date_string: str, kind: str) -> None:
+        if not loader.accepts(date_string):
+            raise ValueError(f'{self.nickname}\'s {kind} cannot be dated {date_string}, '
+                             f'the latest entry is dated {loader.current_day.format('y-m-d')}')
+
+    def record_stop(self, db: Database, stop_id: str, date_string: str) -> Discovery[Stop]:
+        date_string = Player.__parse_date__(date_string)
+        stop: Stop | None = db.stops.get(stop_id)
+        if not stop:
+            change: StopChange | None = Player.__find_stop_change__(db, stop_id)
+            raise ValueError(f'Stop {stop_id} is now {change.new_stop.short_name}' if change
+                             else f'Stop {stop_id} is currently not in the database')
+        if stop.is_visited_by(self, include_ev=False):
+            raise ValueError(f'{self.nickname} has already visited stop {stop_id}')
+        self.__check_chronology__(self.__stops_loader__, date_string, 'stop visit')
+        self.__init_files__()
+        if stop.is_visited_by(self):  # a dated visit replaces the EV entry, which the loader would report otherwise
+            self.__remove_ev_stop__(stop)
+        Player.__append_row__(self.__stops_file__, [stop_id, date_string])
+        date: DateAndOrder = self.__stops_loader__.next([stop_id, date_string])
+        stop.add_visit(self, date)
+        self.logbook.add_stop(stop, date)
+        return self.logbook.stops[-1]
+
+    def __remove_ev_stop__(self, stop: Stop) -> None:
+        with open(self.__ev_file__, 'r', newline='') as file:
+            rows: list[str] = file.readlines()
+        with open(self.__ev_file__, 'w', newline='') as file:
+            file.writelines(row for row in rows if row.split(',')[0].strip() != stop.short_name)
+        stop.visits = [visit for visit in stop.visits if visit.item.nickname != self.nickname or visit.date.is_known()]
+        self.logbook.stops = [discovery for discovery in self.logbook.stops
+                              if discovery.item is not stop or discovery.date.is_known()]
+
+    def record_line(self, db: Database, line_number: str, date_string: str) -> Discovery[Line]:
+        date_string = Player.__parse_date__(date_string)
+        line: Line | None = db.lines.get(line_number)
+        if not line:
+            raise ValueError(f'Line {line_number} is currently not in the database')
+        if line.discovered_by(self):
+            raise ValueError(f'{self.nickname} has already discovered line {line_number}')
+        self.__check_chronology__(self.__lines_loader__, date_string, 'line discovery')
+        self.__init_files__()
+        Player.__append_row__(self.__lines_file__, [line_number, date_string])
+        date: DateAndOrder = self.__lines_loader__.next([line_number, date_string])
+        line.add_discovery(self, date)
+        self.logbook.add_line(line, date)
+        return self.logbook.lines[-1]
+
+    def record_vehicle(self, db: Database, vehicle_id: str, date_string: str) -> Discovery[Vehicle]:
+        date_string = Player.__parse_date__(date_string)
+        vehicle: Vehicle | None = db.vehicles.get(vehicle_id)
+        if not vehicle:
+            combined: str | None = Player.__find_combined_vehicle__(db, vehicle_id)
+            raise ValueError(f'Vehicle #{vehicle_id} is part of a combined vehicle #{combined}' if combined
+                             else f'Vehicle #{vehicle_id} is currently not in the database')
+        if vehicle.discovered_by(self):
+            raise ValueError(f'{self.nickname} has already discovered vehicle #{vehicle_id}')
+        if vehicle.model is None:
+            raise ValueError(f'Vehicle #{vehicle_id} has no specified model')
+        self.__check_chronology__(self.__vehicles_loader__, date_string, 'vehicle discovery')
         self.__init_files__()
-        self.__load_stops__(db)
-        self.__load_ev_stops__(db)
-        self.__load_terminals__(db)
-        self.__load_lines__(db)
-        self.__load_vehicles__(db)
+        Player.__append_row__(self.__vehicles_file__, [vehicle_id, date_string])
+        date: DateAndOrder = self.__vehicles_loader__.next([vehicle_id, date_string])
+        vehicle.add_discovery(self, date)
+        self.logbook.add_vehicle(vehicle, date)
+        return self.logbook.vehicles[-1]
 
     @staticmethod
     def guest(nickname: str) -> Player:
@@ -264,11 +371,8 @@ class Player(JsonSerializable):
         # noinspection PyTypeChecker
         return __read_collection__(source, [], Player, list.append)
 
-    def __json_entry__(self) -> str:
-        return (f'"{self.nickname}":{{\n'
-                f's:[{','.join(sorted(f'"{d.item.short_name}"' for d in self.logbook.get_stops()))}],\n'
-                f'l:[{','.join(sorted(f'"{d.item.number}"' for d in self.logbook.get_lines()))}],\n'
-                f'v:[{','.join(sorted(f'"{d.item.vehicle_id}"' for d in self.logbook.get_vehicles()))}],\n'
-                f'pc:"{self.primary_color}",\n'
-                f'tc:"{self.tint_color}",\n'
-                f'}},')
+    def __json_entry__(self) -> tuple[str, dict[str, Any]]:
+        return self.nickname, {'s': sorted(d.item.short_name for d in self.logbook.get_stops()),
+                               'l': sorted(d.item.number for d in self.logbook.get_lines()),
+                               'v': sorted(d.item.vehicle_id for d in self.logbook.get_vehicles()),
+                               'pc': self.primary_color, 'tc': self.tint_color}
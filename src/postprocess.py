@@ -1,10 +1,12 @@
 import re
 import rjsmin
+from pipeline import stage
 from typing import Callable, Match
 
 map_name: str = 'm'
 
 
+@stage('clean_html')
 def clean_html(html: str) -> str:
     def fold_tag(match: Match) -> str:
         tag_open: str = match.group(1)
@@ -37,6 +39,7 @@ def clean_html(html: str) -> str:
     return html
 
 
+@stage('clean_js')
 def clean_js(js: str) -> str:
     def inline_function(function: str) -> Callable[[Match], str]:
         def inline(match: Match) -> str:
@@ -0,0 +1,52 @@
+import cProfile
+import pstats
+import ref
+import util
+from contextvars import ContextVar, Token
+from datetime import datetime
+from typing import Any, Callable, Literal
+
+ProfileOrder = Literal['cumulative', 'self']
+
+# cProfile only sees the thread it was enabled in, so profiled runs keep their work in that thread and process
+__profiled__: ContextVar[bool] = ContextVar('profiled', default=False)
+
+
+def profiled() -> bool:
+    return __profiled__.get()
+
+
+def run_profiled(function: Callable[[], Any]) -> tuple[cProfile.Profile, Any, BaseException | None]:
+    profiler: cProfile.Profile = cProfile.Profile()
+    result: Any = None
+    exception: BaseException | None = None
+    token: Token = __profiled__.set(True)
+    profiler.enable()
+    try:
+        result = function()
+    except Exception as e:
+        exception = e
+    finally:
+        profiler.disable()
+        __profiled__.reset(token)
+    return profiler, result, exception
+
+
+def top_functions(stats: pstats.Stats, order: ProfileOrder, limit: int) -> list[dict[str, Any]]:
+    entries: list[tuple[tuple[str, int, str], tuple[int, int, float, float, Any]]] = list(stats.stats.items())
+    entries.sort(key=lambda entry: entry[1][3] if order == 'cumulative' else entry[1][2], reverse=True)
+    return [{'function': function, 'file': file, 'line': line, 'calls': calls, 'primitive_calls': primitive_calls,
+             'self_s': self_time, 'cumulative_s': cumulative_time}
+            for (file, line, function), (primitive_calls, calls, self_time, cumulative_time, _) in entries[:limit]]
+
+
+def summarize(profiler: cProfile.Profile, limit: int = 25) -> dict[str, Any]:
+    stats: pstats.Stats = pstats.Stats(profiler)
+    return {'total_s': stats.total_tt, 'total_calls': stats.total_calls,
+            'cumulative': top_functions(stats, 'cumulative', limit), 'self': top_functions(stats, 'self', limit)}
+
+
+def save(profiler: cProfile.Profile, name: str) -> str:
+    file_name: str = f'{datetime.now().strftime("%Y%m%d-%H%M%S")}-{name}.pstats'
+    profiler.dump_stats(util.prepare_path(f'{ref.report_profiles}/{file_name}'))
+    return file_name
@@ -11,6 +11,11 @@ asset_path_brands: str = 'assets/brands'
 asset_path_markers: str = 'assets/markers'
 asset_path_vehicles: str = 'assets/vehicles'
 
+build_state: str = 'data/build_state.json'
+
+cache_templates_bytecode: str = 'data/cache/templates/bytecode'
+cache_templates_precompiled: str = 'data/cache/templates/precompiled.bin'
+
 codegen_template_kml_gtfs: str = 'codegen/kml/gtfs.jinja'
 codegen_template_kml_raid: str = 'codegen/kml/raid.jinja'
 
@@ -37,6 +42,7 @@ lexmap_polish: str = 'assets/lang/alphabet/pl_pl.txt'
 
 mapdata_paths_lines: str = 'data/map/lines'
 mapdata_paths_raids: str = 'data/map/raids'
+mapdata_tiles: str = 'data/map/tiles'
 
 playerdata_file_ev_stops: str = 'ev_stops.csv'
 playerdata_file_lines: str = 'lines.csv'
@@ -47,7 +53,11 @@ playerdata_path: str = 'playerdata'
 
 raiddata_path: str = 'raiddata'
 
+report_benchmarks: str = 'reports/benchmarks'
 report_gtfs: str = 'reports/gtfs_update.txt'
+report_memory: str = 'reports/memory'
+report_profiles: str = 'reports/profiles'
+report_traces: str = 'reports/traces'
 
 stylesheet_announcements: str = 'assets/stylesheets/announcements.css'
 stylesheet_archive: str = 'assets/stylesheets/archive.css'
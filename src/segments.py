@@ -0,0 +1,98 @@
+from data import Line, Route
+from geo import geopoint
+from player import Player
+from typing import Iterable, Iterator, Sequence
+
+SegmentKey = tuple[float, float, float, float]
+
+
+class SegmentClassifier:
+    def __init__(self, players: Sequence[Player]):
+        self.players: Sequence[Player] = players
+        self.__bits__: dict[str, int] = {player.nickname: 1 << index for index, player in enumerate(players)}
+        self.__class_names__: dict[tuple[str, int], str] = {}
+        self.__segments__: dict[str, list[SegmentKey]] = {}
+
+    def discoverers(self, line: Line) -> int:
+        mask: int = 0
+        for visit in line.discoveries:
+            mask |= self.__bits__.get(visit.item.nickname, 0)
+        return mask
+
+    def class_name(self, kind: str, mask: int) -> str:
+        class_name: str | None = self.__class_names__.get((kind, mask))
+        if class_name is None:
+            names: list[str] = [kind] + [f'{kind[0]}-{player.nickname.lower()}'
+                                         for index, player in enumerate(self.players) if mask >> index & 1]
+            class_name = self.__class_names__[(kind, mask)] = ' '.join(sorted(names))
+        return class_name
+
+    def route_segments(self, route: Route) -> list[SegmentKey]:
+        segments: list[SegmentKey] | None = self.__segments__.get(route.route_id)
+        if segments is None:
+            # segments are keyed by plain coordinates in the same orientation as geo.LineSegment
+            coordinates: list[tuple[float, float]] = [(point.latitude, point.longitude) for point in route.points]
+            segments = self.__segments__[route.route_id] = [(*a, *b) if a <= b else (*b, *a)
+                                                            for a, b in zip(coordinates, coordinates[1:])]
+        return segments
+
+    def classify(self, lines: Iterable[Line], routes: dict[str, Route], merge: bool = True) \
+            -> Iterator[tuple[Sequence[Sequence[float]], str]]:
+        everyone: int = (1 << len(self.players)) - 1
+        discovered: dict[SegmentKey, int] = {}
+        completed: dict[SegmentKey, int] = {}
+        for line in lines:
+            mask: int = self.discoverers(line)
+            line_discovered: bool = line.is_discovered()
+            for route_id in line.routes:
+                route: Route = routes[route_id]
+                if not line_discovered:
+                    yield route.points, 'undiscovered'
+                for segment in self.route_segments(route):
+                    if line_discovered:
+                        discovered[segment] = discovered.get(segment, 0) | mask
+                    completed[segment] = completed.get(segment, everyone) & mask
+        for kind, masks in (('disc', discovered), ('compl', completed)):
+            classes: dict[str, list[SegmentKey]] = {}
+            for segment, mask in masks.items():
+                if mask or kind == 'disc':
+                    classes.setdefault(self.class_name(kind, mask), []).append(segment)
+            for class_name, segments in classes.items():
+                for chain in (assemble_chains(segments) if merge else map(__points__, segments)):
+                    yield [geopoint(*point) for point in chain], class_name
+
+
+def __points__(segment: SegmentKey) -> tuple[tuple[float, float], tuple[float, float]]:
+    return (segment[0], segment[1]), (segment[2], segment[3])
+
+
+def assemble_chains(segments: list[SegmentKey]) -> Iterator[list[tuple[float, float]]]:
+    incident: dict[tuple[float, float], list[int]] = {}
+    for index, (lat1, lon1, lat2, lon2) in enumerate(segments):
+        incident.setdefault((lat1, lon1), []).append(index)
+        incident.setdefault((lat2, lon2), []).append(index)
+    used: list[bool] = [False] * len(segments)
+
+    def walk(point: tuple[float, float], index: int) -> list[tuple[float, float]]:
+        chain: list[tuple[float, float]] = [point]
+        while True:
+            used[index] = True
+            a, b = __points__(segments[index])
+            point = b if a == point else a
+            chain.append(point)
+            # chains end at junctions and dead ends, so that each emitted polyline is an unbranched path
+            if len(incident[point]) != 2:
+                return chain
+            following: list[int] = [i for i in incident[point] if not used[i]]
+            if not following:
+                return chain
+            index = following[0]
+
+    for start, indices in incident.items():
+        if len(indices) != 2:
+            for index in indices:
+                if not used[index]:
+                    yield walk(start, index)
+    for index, segment in enumerate(segments):  # what remains are closed loops
+        if not used[index]:
+            yield walk((segment[0], segment[1]), index)
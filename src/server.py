@@ -1,50 +1,268 @@
 from announcements import fetch_announcements
+from api import CachedResponse, Collection, EntryIndex, EntryIndexes, Page, ResponseCache
+from build import BuildGraph, Node
+from changes import ChangeFeed
 from database import *
-from flask import Flask, request
+from flask import Flask, request, send_from_directory
 from flask.wrappers import Response
 from folium import Map
 from gtfs import update_gtfs_data
-from log import flush_errors, log
+from concurrent.futures import Future, ProcessPoolExecutor
+from pipeline import PipelineError, SingleFlight, stage
+from queue import Queue
+from threading import Lock
+from time import perf_counter
+from log import enable_logging, error, error_log, flush_errors, log, logging_enabled
 from typing import Any, Callable, Iterable, MutableMapping
 from uibuilder import UIBuilder
 from waitress import serve
+import api
+import build
+import events
+import jsdata
+import memory
+import metrics
+import multiprocessing
+import pipeline
 import postprocess
+import profiling
 import ref
+import tracing
 import util
 
 
 class Server:
-    def __init__(self, host: str = '127.0.0.1', port: int = 39610):
+    artifacts: list[str] = [ref.compileddata_map, ref.compileddata_players, ref.compileddata_lines, ref.compileddata_stops,
+                            ref.compileddata_vehicles, ref.document_map, ref.document_archive, ref.document_announcements,
+                            ref.document_raids]
+    sharded_data: list[str] = [ref.compileddata_stops, ref.compileddata_vehicles, ref.compileddata_lines]
+    pipelines: dict[str, tuple[tuple[str, ...], tuple[str, ...]]] = {
+        'update_gtfs': (('update_gtfs',), ('record_changes', 'make_update_report')),
+        'update_announcements': (('fetch_announcements',), ('record_changes', 'make_update_report')),
+        'update_all': (('update_gtfs', 'fetch_announcements'), ('record_changes', 'make_update_report')),
+        'compile_map': (('compile_data', 'compile_map', 'precompress_artifacts'), ()),
+        'compile_archive': (('compile_data', 'compile_archive', 'precompress_artifacts'), ()),
+        'compile_announcements': (('compile_data', 'compile_announcements', 'precompress_artifacts'), ()),
+        'compile_raids': (('compile_raids', 'precompress_artifacts'), ()),
+        'compile_all': (('compile_data', 'precompile_templates', 'compile_documents', 'precompress_artifacts'), ()),
+        'reload': (('reload_database',), ()),
+    }
+    database_files: list[str] = ['data/raw/*', f'{ref.playerdata_path}/*/*.csv', f'{ref.raiddata_path}/*']
+    joinable_stages: set[str] = {'compile_data', 'compile_map', 'compile_archive', 'compile_announcements',
+                                 'compile_raids', 'precompile_templates', 'compile_documents', 'precompress_artifacts'}
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 39610, precompress: bool = False, threads: int = 16,
+                 debug: bool = False, memory_report: bool = False, compile_processes: int | None = None,
+                 precompiled_templates: bool = False, direct_map: bool = False, lazy_stop_popups: bool = False,
+                 map_tiles: bool = False, shard_data: bool = False, columnar_data: bool = False, traces: bool = False):
         self.app: Flask = Flask(__name__)
         self.host: str = host
         self.port: int = port
-        self.database: Database = load_database()
-        self.ui_builder: UIBuilder = UIBuilder(database=self.database, lexmap_file=ref.lexmap_polish)
+        self.threads: int = threads
+        # every event stream holds a worker thread for as long as it is open, so only a quarter of them may be taken
+        self.max_event_subscribers: int = max(1, threads // 4)
+        self.precompress: bool = precompress
+        self.debug: bool = debug
+        self.memory_report: bool = memory_report
+        self.compile_processes: int = compile_processes or os.cpu_count() or 1
+        # lazy stop popups and map tiles are features of the direct map emitter, so either of them turns it on
+        self.direct_map: bool = direct_map or lazy_stop_popups or map_tiles
+        self.lazy_stop_popups: bool = lazy_stop_popups
+        self.map_tiles: bool = map_tiles
+        self.shard_data: bool = shard_data
+        self.columnar_data: bool = columnar_data
+        self.trace_directory: str | None = ref.report_traces if traces else None
+        # everything a compile worker needs to set up the same compile actions in a fresh process
+        self.compile_options: dict[str, bool] = {
+            'precompiled_templates': precompiled_templates, 'direct_map': self.direct_map,
+            'lazy_stop_popups': lazy_stop_popups, 'map_tiles': map_tiles, 'shard_data': shard_data,
+            'columnar_data': columnar_data}
+        if memory_report:
+            memory.enable()
+        with tracing.trace('startup', self.trace_directory):
+            self.loaded_data: str = build.fingerprint(Server.database_files)
+            self.database: Database = load_database()
+        self.ui_builder: UIBuilder = UIBuilder(database=self.database, lexmap_file=ref.lexmap_polish,
+                                               precompiled_templates=ref.cache_templates_precompiled
+                                               if precompiled_templates else None, shard_data=shard_data,
+                                               columnar_data=columnar_data)
+        self.response_cache: ResponseCache = ResponseCache()
+        self.entry_indexes: EntryIndexes = EntryIndexes()
+        self.change_feed: ChangeFeed = ChangeFeed(self.collections(), self.database.version)
+        self.__write_mutex__: Lock = Lock()
+        self.__profile_mutex__: Lock = Lock()
+        self.pipeline_flights: SingleFlight = SingleFlight()
+        # idempotent stages are joined by name and database version, overlapping compile stages (e.g. compile_map during
+        # compile_documents) are serialized by the build graph instead, which then skips what the first one has built
+        self.stage_flights: SingleFlight = SingleFlight()
+        self.stages: dict[str, Callable[[], None]] = {
+            'update_gtfs': self.update_gtfs_and_draw_lines,
+            'fetch_announcements': lambda: fetch_announcements(self.database),
+            'record_changes': self.record_changes,
+            'make_update_report': lambda: self.database.make_update_report(),
+            'reload_database': self.reload_database,
+            'compile_data': lambda: self.build_graph.build('stops_data', 'vehicles_data', 'lines_data', 'players_data'),
+            'compile_map': lambda: self.build_graph.build('map'),
+            'compile_archive': lambda: self.build_graph.build('archive'),
+            'compile_announcements': lambda: self.build_graph.build('announcements'),
+            'compile_raids': lambda: self.build_graph.build('raid_maps', 'raids'),
+            'precompile_templates': self.precompile_templates,
+            'compile_documents': lambda: self.build_graph.build('map', 'archive', 'announcements', 'raid_maps', 'raids',
+                                                                runner=self.build_in_processes),
+            'precompress_artifacts': self.precompress_artifacts,
+        }
+        self.build_graph: BuildGraph = self.__create_build_graph__()
         self._setup_routes()
 
+    def __create_build_graph__(self) -> BuildGraph:
+        common: list[str] = ['src/*.py', ref.rawdata_players, ref.lexmap_polish]
+        playerdata: Callable[[str], str] = lambda file: f'{ref.playerdata_path}/*/{file}'
+        everything: list[str] = [*common, *Server.database_files]
+        # the shard scripts and the manifest (globbed, as it only exists for sharded data), not their compressed copies
+        shards: Callable[[str], list[str]] = lambda file: [f'{jsdata.shard_directory(file)}/*.min.js',
+                                                           f'{jsdata.shard_directory(file)}/*.json']
+        sharding: dict[str, str] = {'shard_data': str(self.shard_data)}
+        data_format: dict[str, str] = {**sharding, 'columnar_data': str(self.columnar_data)}
+        # nodes are built from the loaded database, so files edited on disk but not reloaded yet must not look current
+        loaded: Callable[[], str] = lambda: self.loaded_data
+        data_nodes: list[str] = ['stops_data', 'vehicles_data', 'lines_data', 'players_data']
+        return BuildGraph(ref.build_state, [
+            Node('stops_data', [*common, ref.rawdata_stops, ref.rawdata_lines, ref.rawdata_terminals,
+                                playerdata(ref.playerdata_file_stops), playerdata(ref.playerdata_file_ev_stops),
+                                playerdata(ref.playerdata_file_terminals)],
+                 [ref.compileddata_stops, *shards(ref.compileddata_stops)],
+                 lambda: self.ui_builder.compile_stops_data(), parameters=data_format, state=loaded),
+            Node('vehicles_data', [*common, ref.rawdata_vehicles, ref.rawdata_vehicle_models, ref.rawdata_carriers,
+                                   playerdata(ref.playerdata_file_vehicles)],
+                 [ref.compileddata_vehicles, *shards(ref.compileddata_vehicles)],
+                 lambda: self.ui_builder.compile_vehicles_data(), parameters=data_format, state=loaded),
+            Node('lines_data', [*common, ref.rawdata_lines, playerdata(ref.playerdata_file_lines)],
+                 [ref.compileddata_lines, *shards(ref.compileddata_lines)],
+                 lambda: self.ui_builder.compile_lines_data(), parameters=data_format, state=loaded),
+            Node('players_data', [*common, ref.rawdata_stops, ref.rawdata_lines, ref.rawdata_vehicles,
+                                  playerdata(ref.playerdata_file_stops), playerdata(ref.playerdata_file_ev_stops),
+                                  playerdata(ref.playerdata_file_lines), playerdata(ref.playerdata_file_vehicles)],
+                 [ref.compileddata_players], lambda: self.ui_builder.compile_players_data(), parameters=data_format,
+                 state=loaded),
+            # the map and the archive documents embed the shard manifests of the data files, which they are built after
+            Node('map', [*everything, 'templates/map/**'],
+                 [ref.compileddata_map, ref.document_map, f'{ref.mapdata_tiles}/*.json'], self.compile_map,
+                 dependencies=data_nodes,
+                 parameters={'direct_map': str(self.direct_map), 'lazy_stop_popups': str(self.lazy_stop_popups),
+                             'map_tiles': str(self.map_tiles), **sharding}, state=loaded),
+            Node('archive', [*everything, 'templates/archive/**'], [ref.document_archive], self.compile_archive,
+                 dependencies=data_nodes, parameters=sharding, state=loaded),
+            Node('announcements', [*everything, 'templates/announcements/**'], [ref.document_announcements],
+                 self.compile_announcements, state=loaded),
+            Node('raids', [*everything, 'templates/raids/**'], [ref.document_raids], self.compile_raids,
+                 state=loaded),
+            Node('templates', ['templates/**/*.jinja'], [ref.cache_templates_precompiled],
+                 lambda: self.ui_builder.loader.precompile(self.ui_builder)),
+            Node('raid_maps', [*common, ref.rawdata_raids, f'{ref.raiddata_path}/*'],
+                 [f'{ref.mapdata_paths_raids}/*.svg'], self.draw_raid_maps, state=loaded),
+            Node('line_maps', [*common, ref.rawdata_stops, ref.rawdata_lines],
+                 [f'{ref.mapdata_paths_lines}/**/*.svg'], self.draw_line_maps, state=loaded),
+        ])
+
     @staticmethod
-    def as_json(data: Any, mapper: Callable[[Any], dict[str, Any]] | None = None) -> Response:
+    def map_json(data: Any, mapper: Callable[[Any], dict[str, Any]] | None = None) -> Any:
         if mapper is not None:
             if isinstance(data, MutableMapping):
-                return Server.as_json({key: mapper(value) for key, value in data.items()})
+                return {key: mapper(value) for key, value in data.items()}
             elif isinstance(data, Iterable):
-                return Server.as_json(list(map(mapper, data)))
+                return list(map(mapper, data))
             else:
-                return Server.as_json(mapper(data))
-        return Response(status=200, mimetype='application/json', response=json.dumps(data))
+                return mapper(data)
+        return data
+
+    @staticmethod
+    def as_json(data: Any, mapper: Callable[[Any], dict[str, Any]] | None = None) -> Response:
+        return Response(status=200, mimetype='application/json', response=api.encode_json(Server.map_json(data, mapper)))
+
+    def as_cached_json(self, data: Callable[[], Any], mapper: Callable[[Any], dict[str, Any]] | None = None) -> Response:
+        return self.__as_cached_bytes__(lambda: api.encode_json(Server.map_json(data(), mapper)))
+
+    def as_collection_json(self, name: str, collection: Collection) -> Response:
+        data: Callable[[], Any] = collection.data
+        key: Callable[[Any], str] | None = collection.key
+        mapper: Callable[[Any], dict[str, Any]] = api.select_fields(collection.mapper, request.args.get('fields'))
+        stream: str | None = request.args.get('stream')
+        limit: int | None = request.args.get('limit', type=int)
+        if stream is not None:
+            items: Any = data()
+            keyed: bool = isinstance(items, MutableMapping)
+            if stream == 'ndjson':
+                return Response(status=200, mimetype='application/x-ndjson',
+                                response=api.stream_ndjson(api.entries_of(items, key), mapper))
+            elif stream == 'json':
+                return Response(status=200, mimetype='application/json',
+                                response=api.stream_json(api.entries_of(items, key), keyed, mapper))
+            return Response(status=400, response=f'Invalid stream format: {stream}')
+        elif 'limit' in request.args:
+            if limit is None or limit < 1:
+                return Response(status=400, response=f'Invalid limit: {request.args.get('limit')}')
+            try:
+                if request.args.get('cursor'):
+                    api.decode_cursor(request.args['cursor'])
+            except ValueError:
+                return Response(status=400, response=f'Invalid cursor: {request.args.get('cursor')}')
+
+            def _page() -> bytes:
+                items: Any = data()
+                keyed: bool = isinstance(items, MutableMapping)
+                index: EntryIndex = self.entry_indexes.get(name, self.database.version,
+                                                           lambda: EntryIndex(api.entries_of(items, key), keyed))
+                page: Page = api.paginate(index, request.args.get('cursor'), limit)
+                return api.encode_json(page.to_json(keyed, mapper))
+
+            return self.__as_cached_bytes__(_page)
+        return self.as_cached_json(data, mapper)
+
+    def __as_cached_bytes__(self, producer: Callable[[], bytes]) -> Response:
+        key: tuple[str, tuple[tuple[str, str], ...]] = (request.path, tuple(sorted(request.args.items(multi=True))))
+        cached: CachedResponse = self.response_cache.get(key, self.database.version, producer)
+        encoding: str | None = api.negotiate_encoding(request.headers.get('Accept-Encoding'), len(cached.body))
+        etag: str = cached.etag_for(encoding)
+        if request.if_none_match.contains(etag):
+            response: Response = Response(status=304)
+        else:
+            response: Response = Response(status=200, mimetype='application/json', response=cached.encoded(encoding))
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.set_etag(etag)
+        return response
 
     def _setup_routes(self) -> None:
 
+        @self.app.before_request
+        def _start_request() -> None:
+            request.environ['pokestops.start'] = perf_counter()
+            metrics.requests_in_flight.inc()
+
+        @self.app.after_request
+        def _finish_request(response: Response) -> Response:
+            route: str = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            metrics.requests_total.inc(request.method, route, str(response.status_code))
+            metrics.request_duration.observe(perf_counter() - request.environ['pokestops.start'], request.method, route)
+            return response
+
+        @self.app.teardown_request
+        def _teardown_request(_: BaseException | None) -> None:
+            if 'pokestops.start' in request.environ:
+                metrics.requests_in_flight.dec()
+
         def _post_command(*commands: Callable[[], None]) -> Response:
             success: bool = True
             error_message: str = ''
-            try:
-                for command in commands:
-                    command()
-            except Exception as e:
-                success = False
-                error_message = str(e)
-            return Server.as_json({'success': success, 'error_message': error_message, 'errors': flush_errors()})
+            with error_log() as errors:
+                try:
+                    for command in commands:
+                        command()
+                except Exception as e:
+                    success = False
+                    error_message = str(e)
+            return Server.as_json({'success': success, 'error_message': error_message, 'errors': errors})
 
         @self.app.route('/info/status', methods=['GET'])
         def get_info_status() -> str:
@@ -52,8 +270,7 @@ class Server:
 
         @self.app.route('/info/players', methods=['GET'])
         def get_info_players() -> Response:
-            json_mapper: Callable[[Player], dict[str, Any]] = lambda p: {'nickname': p.nickname, 'color': p.primary_color}
-            return Server.as_json(self.database.players, mapper=json_mapper)
+            return self.as_cached_json(self.collections()['players'].data, mapper=self.collections()['players'].mapper)
 
         @self.app.route('/info/last_update/gtfs', methods=['GET'])
         def get_info_last_update_gtfs() -> str:
@@ -71,154 +288,437 @@ class Server:
                 return 'never'
             return announcements_last_update.replace(microsecond=0).isoformat()
 
+        def _post_pipeline(name: str) -> Response:
+            success: bool = True
+            error_message: str = ''
+            with build.collect() as build_report:
+                try:
+                    errors: list[str] = self.run_named_pipeline(name)
+                except PipelineError as e:
+                    success = False
+                    error_message = str(e)
+                    errors = e.errors
+            return Server.as_json({'success': success, 'error_message': error_message, 'errors': errors, **build_report})
+
         @self.app.route('/update/gtfs', methods=['POST'])
         def post_update_gtfs() -> Response:
-            response: Response = _post_command(self.update_gtfs_and_draw_lines)
-            self.database.make_update_report()
-            return response
+            return _post_pipeline('update_gtfs')
 
         @self.app.route('/update/announcements', methods=['POST'])
         def post_update_announcements() -> Response:
-            response: Response = _post_command(lambda: fetch_announcements(self.database))
-            self.database.make_update_report()
-            return response
+            return _post_pipeline('update_announcements')
 
         @self.app.route('/update/all', methods=['POST'])
         def post_update_all() -> Response:
-            response: Response = _post_command(self.update_gtfs_and_draw_lines, lambda: fetch_announcements(self.database))
-            self.database.make_update_report()
-            return response
+            return _post_pipeline('update_all')
 
         @self.app.route('/compile/map', methods=['POST'])
         def post_compile_map() -> Response:
-            return _post_command(self.ui_builder.compile_data, self.compile_map)
+            return _post_pipeline('compile_map')
 
         @self.app.route('/compile/archive', methods=['POST'])
         def post_compile_archive() -> Response:
-            return _post_command(self.ui_builder.compile_data, self.compile_archive)
+            return _post_pipeline('compile_archive')
 
         @self.app.route('/compile/announcements', methods=['POST'])
         def post_compile_announcements() -> Response:
-            return _post_command(self.ui_builder.compile_data, self.compile_announcements)
+            return _post_pipeline('compile_announcements')
 
         @self.app.route('/compile/raids', methods=['POST'])
         def post_compile_raids() -> Response:
-            return _post_command(self.compile_raids)
+            return _post_pipeline('compile_raids')
 
         @self.app.route('/compile/all', methods=['POST'])
         def post_compile_all() -> Response:
-            return _post_command(self.ui_builder.compile_data, self.compile_map, self.compile_archive,
-                                 self.compile_announcements, self.compile_raids)
-
-        def _reload_database() -> None:
-            self.database = load_database()
+            return _post_pipeline('compile_all')
 
         @self.app.route('/reload', methods=['POST'])
         def post_reload() -> Response:
-            return _post_command(_reload_database)
+            return _post_pipeline('reload')
 
         @self.app.route('/domain/stops', methods=['GET'])
         def get_domain_stops() -> Response:
-            json_mapper: Callable[[Stop], dict[str, Any]] = lambda s: \
-                {'short_name': s.short_name, 'full_name': s.full_name, 'zone': s.zone}
-            return Server.as_json(self.database.stops, mapper=json_mapper)
+            return self.as_collection_json('stops', self.collections()['stops'])
 
         @self.app.route('/domain/carriers', methods=['GET'])
         def get_domain_carriers() -> Response:
-            json_mapper: Callable[[Carrier], dict[str, Any]] = lambda c: \
-                {'symbol': c.symbol, 'name': c.short_name, 'colors': c.colors}
-            return Server.as_json(self.database.carriers, mapper=json_mapper)
+            return self.as_collection_json('carriers', self.collections()['carriers'])
 
         @self.app.route('/domain/vehicles', methods=['GET'])
         def get_domain_vehicles() -> Response:
-            json_mapper: Callable[[Vehicle], dict[str, Any]] = \
-                lambda v: {'vehicle_id': v.vehicle_id, 'carrier': v.carrier.symbol, 'type': v.model.kind,
-                           'brand': v.model.brand, 'model': v.model.model
-                           } if v.model else {'vehicle_id': v.vehicle_id, 'carrier': v.carrier.symbol}
-            return Server.as_json(self.database.vehicles, mapper=json_mapper)
+            return self.as_collection_json('vehicles', self.collections()['vehicles'])
 
         @self.app.route('/domain/lines', methods=['GET'])
         def get_domain_lines() -> Response:
-            json_mapper: Callable[[Stop], dict[str, Any]] = lambda l: \
-                {'number': l.number, 'terminals': l.terminals, 'description': l.description,
-                 'zones': l.get_zones(self.database.stops)}
-            return Server.as_json(self.database.lines, mapper=json_mapper)
+            return self.as_collection_json('lines', self.collections()['lines'])
 
-        def _get_playerdata(nickname: str, collection: Callable[[Player], dict[str, Any]],
-                            mapper: Callable[[Discovery[Any]], dict[str, Any]]) -> Response:
-            player: Player = find_first(lambda p: p.nickname == nickname, self.database.players)
-            return Server.as_json(collection(player), mapper=mapper)
-
-        def _get_playerdata_stops(nickname: str, ev: Literal['exclude', 'only']) -> Response:
-            json_mapper: Callable[[Discovery[Stop]], dict[str, Any]] = lambda d: \
-                {'date': d.date.format('y-m-d'), 'item': d.item.short_name}
-            return _get_playerdata(nickname, lambda p: p.logbook.get_stops(ev=ev), json_mapper)
+        def _get_playerdata(kind: str) -> Response:
+            name: str = f'playerdata/{request.args.get('player')}/{kind}'
+            collection: Collection | None = self.collections().get(name)
+            if collection is None:
+                return Response(status=404, response=f'Unknown player: {request.args.get('player')}')
+            return self.as_collection_json(name, collection)
 
         @self.app.route('/playerdata/stops', methods=['GET'])
         def get_playerdata_stops() -> Response:
-            return _get_playerdata_stops(request.args.get('player'), ev='exclude')
+            return _get_playerdata('stops')
 
         @self.app.route('/playerdata/ev_stops', methods=['GET'])
         def get_playerdata_ev_stops() -> Response:
-            return _get_playerdata_stops(request.args.get('player'), ev='only')
+            return _get_playerdata('ev_stops')
 
         @self.app.route('/playerdata/vehicles', methods=['GET'])
         def get_playerdata_vehicles() -> Response:
-            json_mapper: Callable[[Discovery[Vehicle]], dict[str, Any]] = lambda d: \
-                {'date': d.date.format('y-m-d'), 'item': d.item.vehicle_id}
-            return _get_playerdata(request.args.get('player'), lambda p: p.logbook.get_vehicles(), json_mapper)
+            return _get_playerdata('vehicles')
 
         @self.app.route('/playerdata/lines', methods=['GET'])
         def get_playerdata_lines() -> Response:
-            json_mapper: Callable[[Discovery[Line]], dict[str, Any]] = lambda d: \
-                {'date': d.date.format('y-m-d'), 'item': d.item.number}
-            return _get_playerdata(request.args.get('player'), lambda p: p.logbook.get_lines(), json_mapper)
+            return _get_playerdata('lines')
+
+        @self.app.route('/playerdata/stops', methods=['POST'])
+        def post_playerdata_stops() -> Response:
+            return _post_command(lambda: self.record_discovery('stops', request.get_json(silent=True) or {}))
+
+        @self.app.route('/playerdata/vehicles', methods=['POST'])
+        def post_playerdata_vehicles() -> Response:
+            return _post_command(lambda: self.record_discovery('vehicles', request.get_json(silent=True) or {}))
+
+        @self.app.route('/playerdata/lines', methods=['POST'])
+        def post_playerdata_lines() -> Response:
+            return _post_command(lambda: self.record_discovery('lines', request.get_json(silent=True) or {}))
+
+        @self.app.route('/events', methods=['GET'])
+        def get_events() -> Response:
+            subscription: Queue | None = events.subscribe(self.max_event_subscribers)
+            if subscription is None:
+                return Response(status=503, response='Too many event subscribers', headers={'Retry-After': '30'})
+            response: Response = Response(events.stream(subscription), mimetype='text/event-stream',
+                                          headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+            # the stream only unsubscribes once it is iterated, a client that disconnects before would keep its slot
+            response.call_on_close(lambda: events.unsubscribe(subscription))
+            return response
+
+        @self.app.route('/metrics', methods=['GET'])
+        def get_metrics() -> Response:
+            return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+        @self.app.route('/sync', methods=['GET'])
+        def get_sync() -> Response:
+            since: int | None = request.args.get('since', type=int)
+            names: set[str] | None = set(request.args['collections'].split(',')) if 'collections' in request.args else None
+            return Server.as_json(self.change_feed.since(since, names))
+
+        if self.debug:
+            self._setup_debug_routes()
+        if self.memory_report:
+            self._setup_memory_routes()
+
+    def _setup_debug_routes(self) -> None:
+
+        @self.app.route('/debug/profile', methods=['POST'])
+        def post_debug_profile() -> Response:
+            target: str | None = request.args.get('target')
+            if target not in Server.pipelines:
+                return Response(status=400, response=f'Unknown target: {target}, '
+                                                     f'available targets: {', '.join(Server.pipelines)}')
+            if request.remote_addr not in ('127.0.0.1', '::1'):
+                return Response(status=403, response='Profiling is only available from localhost')
+            if request.args.get('confirm') != target:
+                return Response(status=400, response=f'Confirm profiling by passing confirm={target}')
+            if not self.__profile_mutex__.acquire(blocking=False):
+                return Response(status=409, response='Another profiling session is in progress')
+            if self.pipeline_flights.in_flight():
+                # a profiled run joining a running pipeline would only profile the wait for it
+                self.__profile_mutex__.release()
+                return Response(status=409, response='Pipelines are running, profile once they finish')
+            try:
+                profiler, errors, exception = profiling.run_profiled(lambda: self.run_named_pipeline(target))
+            finally:
+                self.__profile_mutex__.release()
+            if isinstance(exception, PipelineError):
+                errors = exception.errors
+            file_name: str = profiling.save(profiler, target)
+            return Server.as_json({'target': target, 'success': exception is None,
+                                   'error_message': str(exception) if exception else '', 'errors': errors,
+                                   **profiling.summarize(profiler, request.args.get('limit', 25, type=int)),
+                                   'download': f'/debug/profiles/{file_name}'})
+
+        @self.app.route('/debug/profiles/<file_name>', methods=['GET'])
+        def get_debug_profile(file_name: str) -> Response:
+            return send_from_directory(os.path.abspath(ref.report_profiles), file_name,
+                                       mimetype='application/octet-stream', as_attachment=True)
+
+    def _setup_memory_routes(self) -> None:
+
+        @self.app.route('/debug/memory', methods=['GET'])
+        def get_debug_memory() -> Response:
+            return Server.as_json({'stages': memory.stage_statistics(), 'last_pipeline': memory.last_report(),
+                                   'database_collections': memory.collection_sizes(self.database)})
+
+    def collections(self) -> dict[str, Collection]:
+        stop_mapper: Callable[[Stop], dict[str, Any]] = lambda s: \
+            {'short_name': s.short_name, 'full_name': s.full_name, 'zone': s.zone}
+        carrier_mapper: Callable[[Carrier], dict[str, Any]] = lambda c: \
+            {'symbol': c.symbol, 'name': c.short_name, 'colors': c.colors}
+        vehicle_mapper: Callable[[Vehicle], dict[str, Any]] = \
+            lambda v: {'vehicle_id': v.vehicle_id, 'carrier': v.carrier.symbol, 'type': v.model.kind,
+                       'brand': v.model.brand, 'model': v.model.model
+                       } if v.model else {'vehicle_id': v.vehicle_id, 'carrier': v.carrier.symbol}
+        line_mapper: Callable[[Line], dict[str, Any]] = lambda l: \
+            {'number': l.number, 'terminals': l.terminals, 'description': l.description,
+             'zones': l.get_zones(self.database.stops)}
+        player_mapper: Callable[[Player], dict[str, Any]] = lambda p: {'nickname': p.nickname, 'color': p.primary_color}
+        stop_discovery_mapper: Callable[[Discovery[Stop]], dict[str, Any]] = lambda d: \
+            {'date': d.date.format('y-m-d'), 'item': d.item.short_name}
+        vehicle_discovery_mapper: Callable[[Discovery[Vehicle]], dict[str, Any]] = lambda d: \
+            {'date': d.date.format('y-m-d'), 'item': d.item.vehicle_id}
+        line_discovery_mapper: Callable[[Discovery[Line]], dict[str, Any]] = lambda d: \
+            {'date': d.date.format('y-m-d'), 'item': d.item.number}
+
+        def _playerdata(player: Player) -> dict[str, Collection]:
+            prefix: str = f'playerdata/{player.nickname}'
+            return {
+                f'{prefix}/stops': Collection(lambda: player.logbook.get_stops(ev='exclude'), stop_discovery_mapper,
+                                              lambda d: d.item.short_name),
+                f'{prefix}/ev_stops': Collection(lambda: player.logbook.get_stops(ev='only'), stop_discovery_mapper,
+                                                 lambda d: d.item.short_name),
+                f'{prefix}/vehicles': Collection(player.logbook.get_vehicles, vehicle_discovery_mapper,
+                                                 lambda d: d.item.vehicle_id),
+                f'{prefix}/lines': Collection(player.logbook.get_lines, line_discovery_mapper, lambda d: d.item.number),
+            }
+
+        return {
+            'stops': Collection(lambda: self.database.stops, stop_mapper),
+            'carriers': Collection(lambda: self.database.carriers, carrier_mapper),
+            'vehicles': Collection(lambda: self.database.vehicles, vehicle_mapper),
+            'lines': Collection(lambda: self.database.lines, line_mapper),
+            'players': Collection(lambda: self.database.players, player_mapper, lambda p: p.nickname),
+            **{name: collection for player in self.database.players for name, collection in _playerdata(player).items()},
+        }
+
+    def run_pipeline(self, *stages: str, cleanup: tuple[str, ...] = ()) -> list[str]:
+        def _run() -> list[str]:
+            errors: list[str] = []
+            failure: PipelineError | None = None
+            try:
+                for name in stages:
+                    errors += self.run_shared_stage(name)
+            except PipelineError as e:
+                errors += e.errors
+                failure = e
+            for name in cleanup:
+                try:
+                    errors += self.run_shared_stage(name)
+                except PipelineError as e:
+                    errors += e.errors
+                    failure = failure or e
+            if failure is not None:
+                raise PipelineError(failure.cause, errors) from failure.cause
+            return errors
+
+        def _traced_run() -> list[str]:
+            with (tracing.trace('+'.join(stages), self.trace_directory),
+                  memory.report('+'.join(stages), lambda: self.database)):
+                return _run()
+
+        return self.pipeline_flights.run((stages, cleanup), _traced_run)
+
+    def run_named_pipeline(self, name: str) -> list[str]:
+        stages, cleanup = Server.pipelines[name]
+        return self.run_pipeline(*stages, cleanup=cleanup)
+
+    def run_shared_stage(self, name: str) -> list[str]:
+        # stages that change or record data always run, another run of them may have started before the latest change
+        if name not in Server.joinable_stages:
+            return self.run_stage(name)()
+        return self.stage_flights.run((name, self.database.version), self.run_stage(name))
+
+    def run_stage(self, name: str) -> Callable[[], list[str]]:
+        # a run joining a stage that is already running gets the errors logged by that stage as well
+        def _run() -> list[str]:
+            with error_log() as errors:
+                try:
+                    with stage(name):
+                        self.stages[name]()
+                except Exception as e:
+                    raise PipelineError(e, errors) from e
+            return errors
+
+        return _run
+
+    def build_in_processes(self, nodes: list[Node]) -> dict[str, Exception | None]:
+        if len(nodes) < 2 or self.compile_processes < 2 or profiling.profiled():
+            return BuildGraph.run_sequentially(nodes)
+        # forking this process could copy locks held by request threads, so workers start clean and load the data
+        method: str = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        results: dict[str, Exception | None] = {}
+        with ProcessPoolExecutor(max_workers=min(len(nodes), self.compile_processes),
+                                 mp_context=multiprocessing.get_context(method), initializer=__init_worker__,
+                                 initargs=(self.compile_options, logging_enabled())) as executor:
+            futures: dict[str, Future] = {node.name: executor.submit(__build_in_worker__, node.name) for node in nodes}
+            for name, future in futures.items():
+                try:
+                    spans, errors = future.result()
+                    pipeline.replay(spans)
+                    [error(message) for message in errors]
+                    results[name] = None
+                except Exception as e:
+                    results[name] = e
+        return results
+
+    def reload_database(self) -> None:
+        # taken before loading, so files edited while loading make the next compile rebuild rather than look current
+        loaded_data: str = build.fingerprint(Server.database_files)
+        self.database = load_database()
+        self.loaded_data = loaded_data
+        self.ui_builder.use_database(self.database)
+        self.response_cache.invalidate()
+        self.entry_indexes.invalidate()
+        self.record_changes()
+
+    def record_changes(self, *names: str) -> None:
+        collections: dict[str, Collection] = self.collections()
+        if names:
+            self.change_feed.record({name: collections[name] for name in names}, self.database.bump_version,
+                                    complete=False)
+        else:
+            self.change_feed.record(collections, self.database.bump_version)
+
+    def record_discovery(self, kind: Literal['stops', 'lines', 'vehicles'], entry: dict[str, str]) -> None:
+        for field in ('player', 'item', 'date'):
+            if not isinstance(entry.get(field), str):
+                raise ValueError(f'Missing or invalid field: {field}')
+        player: Player | None = find_first(lambda p: p.nickname == entry['player'], self.database.players)
+        if player is None:
+            raise ValueError(f'Unknown player: {entry['player']}')
+        with self.__write_mutex__:
+            if kind == 'stops':
+                stop: Stop = player.record_stop(self.database, entry['item'], entry['date']).item
+                self.database.update_progress(player, [r for r in self.database.regions.values() if stop in r],
+                                              lines=False, terminals=False)
+            elif kind == 'lines':
+                player.record_line(self.database, entry['item'], entry['date'])
+                self.database.update_progress(player, [], terminals=False)
+            elif kind == 'vehicles':
+                player.record_vehicle(self.database, entry['item'], entry['date'])
+            else:
+                raise ValueError(f'Invalid discovery kind: {kind}')
+            self.record_changes(f'playerdata/{player.nickname}/{kind}')
 
     def compile_map(self) -> None:
         log('  Building Folium map...')
-        fmap: Map = self.ui_builder.build_fmap()
+        # with --direct-map only the map and its tile layer come from Folium, map.js creates the features
+        fmap: Map = self.ui_builder.create_fmap() if self.direct_map else self.ui_builder.build_fmap()
         log('    Compiling... ', end='')
-        folium_html = fmap.get_root().render()
+        with stage('render_fmap'):
+            folium_html = fmap.get_root().render()
         map_script: str = folium_html[folium_html.rfind('<script>') + 8:folium_html.rfind('</script>')]
         with open(util.prepare_path(ref.compileddata_map), 'w') as script_file:
-            script_file.write(postprocess.clean_js(map_script))
+            if self.direct_map:
+                script_file.write(map_script.replace(fmap.get_name(), postprocess.map_name).strip() + '\n')
+                compile_features = self.ui_builder.compile_map_tiles if self.map_tiles else self.ui_builder.compile_map_data
+                script_file.write(compile_features(postprocess.map_name, self.lazy_stop_popups))
+            else:
+                script_file.write(postprocess.clean_js(map_script))
         log('Done!')
 
         log('  Building map HTML document... ', end='')
-        map_html: str = postprocess.clean_html(self.ui_builder.create_map(folium_html).render())
+        with stage('render_map_document'):
+            map_html: str = postprocess.clean_html(self.ui_builder.create_map(folium_html).render())
         with open(util.prepare_path(ref.document_map), 'w') as file:
             file.write(map_html)
         log('Done!')
 
     def compile_archive(self) -> None:
         log('  Building archive HTML document... ', end='')
-        archive_html: str = postprocess.clean_html(self.ui_builder.create_archive().render())
+        with stage('render_archive_document'):
+            archive_html: str = postprocess.clean_html(self.ui_builder.create_archive().render())
         with open(util.prepare_path(ref.document_archive), 'w') as file:
             file.write(archive_html)
         log('Done!')
 
     def compile_announcements(self) -> None:
         log('  Building announcements HTML document... ', end='')
-        announcements_html: str = postprocess.clean_html(self.ui_builder.create_announcements().render())
+        with stage('render_announcements_document'):
+            announcements_html: str = postprocess.clean_html(self.ui_builder.create_announcements().render())
         with open(util.prepare_path(ref.document_announcements), 'w') as file:
             file.write(announcements_html)
         log('Done!')
 
     def compile_raids(self) -> None:
         log('  Building raids HTML document... ', end='')
-        self.ui_builder.create_raid_maps()
-        raids_html: str = postprocess.clean_html(self.ui_builder.create_raids().render())
+        with stage('render_raids_document'):
+            raids_html: str = postprocess.clean_html(self.ui_builder.create_raids().render())
         with open(util.prepare_path(ref.document_raids), 'w') as file:
             file.write(raids_html)
         log('Done!')
 
-    def update_gtfs_and_draw_lines(self) -> None:
-        update_gtfs_data(self.database)
+    def precompile_templates(self) -> None:
+        if self.ui_builder.loader.precompiled is not None:
+            self.build_graph.build('templates')
+
+    def precompress_artifacts(self) -> None:
+        data_shards: list[str] = build.expand([f'{jsdata.shard_directory(data)}/*.js' for data in Server.sharded_data])
+        artifacts: list[str] = [artifact for artifact in [*Server.artifacts, *data_shards] if os.path.exists(artifact)]
+        if not self.precompress:
+            # copies left by an earlier run with precompression would otherwise be served instead of newer artifacts
+            for artifact in artifacts:
+                api.remove_compressed(artifact)
+            return
+        log('  Precompressing compiled artifacts... ', end='')
+        for artifact in artifacts:
+            if api.compression_outdated(artifact):
+                api.compress_file(artifact)
+        log('Done!')
+
+    def draw_raid_maps(self) -> None:
+        log('  Drawing raid route maps... ', end='')
+        self.ui_builder.create_raid_maps()
+        log('Done!')
+
+    def draw_line_maps(self) -> None:
         log('Drawing line route diagrams... ', end='')
         util.clear_directory(util.prepare_path(ref.mapdata_paths_lines, path_is_directory=True))
         self.ui_builder.create_line_maps(False)
         log('Done!')
 
+    def update_gtfs_and_draw_lines(self) -> None:
+        update_gtfs_data(self.database)
+        self.build_graph.build('line_maps')
+
     def run(self) -> None:
         print(f'Server started at {self.host}:{self.port}/')
-        serve(self.app, host=self.host, port=self.port)
+        serve(self.app, host=self.host, port=self.port, threads=self.threads)
+
+
+__worker_server__: Server | None = None
+
+
+def __init_worker__(compile_options: dict[str, bool], logging: bool) -> None:
+    global __worker_server__
+    enable_logging(False)  # the parent has already logged loading the data, and reported the errors found in it
+    __worker_server__ = Server(compile_processes=1, **compile_options)
+    flush_errors()
+    enable_logging(logging)
+
+
+def __build_in_worker__(name: str) -> tuple[list[tracing.Span], list[str]]:
+    with tracing.trace(name) as worker_trace:
+        __worker_server__.build_graph.nodes[name].action()
+    spans: list[tracing.Span] = worker_trace.spans()[:-1]  # the last span is the root added by trace() itself
+    for span in spans:
+        span.thread_id, span.thread_name = os.getpid(), f'{name} worker'
+    return spans, flush_errors()
+
+
+def __artifact_sizes__() -> dict[tuple[str, ...], float]:
+    sizes: dict[tuple[str, ...], float] = {}
+    for artifact in Server.artifacts:
+        for coding, extension in (('identity', ''), ('gzip', '.gz'), ('br', '.br'), ('zstd', '.zst')):
+            if os.path.exists(artifact + extension):
+                sizes[(artifact, coding)] = os.path.getsize(artifact + extension)
+    return sizes
+
+
+artifact_size: metrics.Gauge = metrics.Gauge('pokestops_artifact_size_bytes', 'Size of compiled artifacts on disk.',
+                                             ('artifact', 'encoding'), __artifact_sizes__)
@@ -0,0 +1,204 @@
+import csv
+import ref
+import util
+from datetime import date, timedelta
+from random import Random
+from typing import Iterator, Sequence
+
+__letters__: str = 'ABCDEFGHIJKLMNOPRSTUWZ'
+__center__: tuple[float, float] = (52.4064, 16.9252)
+__radius__: tuple[float, float] = (0.11, 0.18)
+
+
+class GtfsScale:
+    def __init__(self, stop_groups: int = 1200, lines: int = 180, trips_per_line: int = 80,
+                 stops_per_trip: int = 24, shape_density: int = 8):
+        self.stop_groups: int = stop_groups
+        self.lines: int = lines
+        self.trips_per_line: int = trips_per_line
+        self.stops_per_trip: int = stops_per_trip
+        self.shape_density: int = shape_density
+
+    def scaled(self, factor: float) -> 'GtfsScale':
+        return GtfsScale(max(1, round(self.stop_groups * factor)), max(1, round(self.lines * factor)),
+                         self.trips_per_line, self.stops_per_trip, self.shape_density)
+
+    def to_json(self) -> dict[str, int]:
+        return {'stop_groups': self.stop_groups, 'lines': self.lines, 'trips_per_line': self.trips_per_line,
+                'stops_per_trip': self.stops_per_trip, 'shape_density': self.shape_density}
+
+
+poznan_network: GtfsScale = GtfsScale()
+
+
+def stop_group_code(index: int) -> str:
+    code: str = ''
+    for _ in range(4):
+        index, letter = divmod(index, len(__letters__))
+        code = __letters__[letter] + code
+    return code
+
+
+def line_number(index: int) -> str:
+    if index < 20:
+        return str(index + 1)
+    elif index < 70:
+        return str(index + 121)
+    elif index < 90:
+        return str(index + 131)
+    return str(index + 231)
+
+
+def has_regular_trips(index: int) -> bool:
+    # every tenth line has no trips marked as regular ('+'), which exercises the fallback queries
+    return index % 10 != 9
+
+
+class SyntheticNetwork:
+    def __init__(self, scale: GtfsScale, seed: int):
+        self.random: Random = Random(seed)
+        self.stops: list[tuple[str, str, str, float, float, str]] = []
+        for group in range(scale.stop_groups):
+            latitude: float = __center__[0] + self.random.uniform(-__radius__[0], __radius__[0])
+            longitude: float = __center__[1] + self.random.uniform(-__radius__[1], __radius__[1])
+            zone: str = 'A' if abs(latitude - __center__[0]) < 0.05 and abs(longitude - __center__[1]) < 0.08 else 'B'
+            for platform in range(1, self.random.choice((2, 2, 2, 3, 4)) + 1):
+                self.stops.append((str(len(self.stops) + 1), f'{stop_group_code(group)}{platform:02d}',
+                                   f'Stop {stop_group_code(group).capitalize()}',
+                                   latitude + self.random.uniform(-0.0005, 0.0005),
+                                   longitude + self.random.uniform(-0.0005, 0.0005), zone))
+        self.variants: list[list[list[int]]] = []
+        served: list[int] = []
+        for index in range(scale.lines):
+            # stops are only listed in stops.csv if a regular trip calls at them, so lines without regular trips
+            # run through stops that regular lines already serve
+            pool: Sequence[int] = range(len(self.stops))
+            if not has_regular_trips(index) and served:
+                pool = sorted(set(served))
+            start: int = self.random.choice(pool)
+            stops: list[int] = [start]
+            while len(stops) < min(scale.stops_per_trip, len(pool)):
+                candidates: set[int] = {self.random.choice(pool) for _ in range(8)} - set(stops)
+                if candidates:
+                    stops.append(min(sorted(candidates), key=lambda s: (self.stops[s][3] - self.stops[stops[-1]][3]) ** 2
+                                                                       + (self.stops[s][4] - self.stops[stops[-1]][4]) ** 2))
+            self.variants.append([stops, stops[::-1]])
+            if has_regular_trips(index):
+                served.extend(stops)
+
+
+def __interpolate__(stops: list[tuple[str, str, str, float, float, str]], density: int) -> Iterator[tuple[float, float]]:
+    for (*_, lat1, lon1, _), (*_, lat2, lon2, _) in zip(stops, stops[1:]):
+        for step in range(density):
+            yield lat1 + (lat2 - lat1) * step / density, lon1 + (lon2 - lon1) * step / density
+    yield stops[-1][3], stops[-1][4]
+
+
+def generate_gtfs(scale: GtfsScale = poznan_network, seed: int = 0) -> dict[str, int]:
+    network: SyntheticNetwork = SyntheticNetwork(scale, seed)
+    counts: dict[str, int] = {'stops': len(network.stops), 'lines': scale.lines, 'shapes': 0, 'shape_points': 0,
+                              'trips': 0, 'stop_times': 0}
+    with open(util.prepare_path(ref.rawdata_stops), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(('stop_id', 'stop_code', 'stop_name', 'stop_lat', 'stop_lon', 'zone_id'))
+        writer.writerows((stop_id, code, name, f'{lat:.7f}', f'{lon:.7f}', zone)
+                         for stop_id, code, name, lat, lon, zone in network.stops)
+    with open(util.prepare_path(ref.rawdata_lines), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(('route_id', 'agency_id', 'route_short_name', 'route_long_name', 'route_desc', 'route_type',
+                         'route_color', 'route_text_color'))
+        for index, (outbound, _) in enumerate(network.variants):
+            first, last = network.stops[outbound[0]][2], network.stops[outbound[-1]][2]
+            writer.writerow((line_number(index), '2', line_number(index), f'{first} - {last}|{last} - {first}',
+                             f'{first} - {last}^synthetic', '0' if index < 20 else '3',
+                             f'{network.random.randrange(0x1000000):06X}', 'FFFFFF'))
+    with (open(util.prepare_path(ref.rawdata_routes), 'w', newline='') as shapes_file,
+          open(util.prepare_path(ref.rawdata_trips), 'w', newline='') as trips_file,
+          open(util.prepare_path(ref.rawdata_stop_times), 'w', newline='') as stop_times_file):
+        shapes, trips, stop_times = csv.writer(shapes_file), csv.writer(trips_file), csv.writer(stop_times_file)
+        shapes.writerow(('shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence'))
+        trips.writerow(('route_id', 'service_id', 'trip_id', 'trip_headsign', 'direction_id', 'shape_id',
+                        'wheelchair_accessible', 'brigade'))
+        stop_times.writerow(('trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence', 'stop_headsign',
+                             'pickup_type', 'drop_off_type'))
+        for index, variants in enumerate(network.variants):
+            number: str = line_number(index)
+            marker: str = '+' if has_regular_trips(index) else ''
+            for direction, variant in enumerate(variants):
+                shape_id: str = str(counts['shapes'] + 1)
+                counts['shapes'] += 1
+                variant_stops: list[tuple[str, str, str, float, float, str]] = [network.stops[s] for s in variant]
+                for sequence, (lat, lon) in enumerate(__interpolate__(variant_stops, scale.shape_density)):
+                    shapes.writerow((shape_id, f'{lat:.7f}', f'{lon:.7f}', sequence))
+                    counts['shape_points'] += 1
+                for trip in range(scale.trips_per_line // 2):
+                    counts['trips'] += 1
+                    trip_id: str = f'{trip % 3 + 1}_{counts["trips"]}^N{marker}'
+                    trips.writerow((number, str(trip % 3 + 1), trip_id, variant_stops[-1][2], direction, shape_id,
+                                    '1', f'{number}/{trip % 9 + 1}'))
+                    minutes: int = 300 + trip * 15
+                    for sequence, stop in enumerate(variant_stops):
+                        time: str = f'{(minutes + 2 * sequence) // 60:02d}:{(minutes + 2 * sequence) % 60:02d}:00'
+                        stop_times.writerow((trip_id, time, time, stop[0], sequence + 1, '', '0', '0'))
+                    counts['stop_times'] += len(variant_stops)
+    return counts
+
+
+def read_column(source: str, column: int, predicate: int | None = None) -> list[str]:
+    return [row[column] for row in util.get_csv_rows(source)[0] if predicate is None or row[predicate]]
+
+
+def read_line_variants(source: str = ref.rawdata_lines) -> dict[str, list[list[str]]]:
+    return {row[2]: [variant.split('&') for variant in row[9].split('|') if variant]
+            for row in util.get_csv_rows(source)[0] if row[9]}
+
+
+def generate_players(count: int, lines: dict[str, list[list[str]]], vehicles: list[str], seed: int = 0,
+                     start: date = date(2022, 1, 1), days: int = 1000) -> dict[str, int]:
+    random: Random = Random(seed)
+    counts: dict[str, int] = {'players': count, 'stop_visits': 0, 'ev_stops': 0, 'lines': 0, 'vehicles': 0}
+    line_numbers: list[str] = sorted(lines.keys())
+    with open(util.prepare_path(ref.rawdata_players), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(('nickname', 'primary_color', 'tint_color'))
+        nicknames: list[str] = [f'Player{index:04d}' for index in range(count)]
+        writer.writerows((nickname, f'#{random.randrange(0x1000000):06x}', f'#{random.randrange(0x1000000):06x}')
+                         for nickname in nicknames)
+    for nickname in nicknames:
+        directory: str = f'{ref.playerdata_path}/{nickname.lower()}'
+        # activity is heavy-tailed, as in real data: most players ride a little, a few ride a lot
+        sessions: int = min(days, max(1, int(random.paretovariate(1.2) * 10)))
+        day: date = start + timedelta(days=random.randrange(days // 2))
+        visited: dict[str, date] = {}
+        discovered_lines: dict[str, date] = {}
+        discovered_vehicles: dict[str, date] = {}
+        for _ in range(sessions):
+            day += timedelta(days=random.randint(0, 3))
+            for _ in range(random.randint(1, 3)):
+                number: str = random.choice(line_numbers)
+                variant: list[str] = random.choice(lines[number])
+                begin: int = random.randrange(len(variant))
+                for stop in variant[begin:begin + random.randint(2, 15)]:
+                    visited.setdefault(stop, day)
+                discovered_lines.setdefault(number, day)
+                if vehicles and random.random() < 0.7:
+                    discovered_vehicles.setdefault(random.choice(vehicles), day)
+        ev_stops: set[str] = {random.choice(variant) for variants in lines.values() for variant in variants
+                              if random.random() < 0.01} - visited.keys()
+        with open(util.prepare_path(f'{directory}/{ref.playerdata_file_stops}'), 'w', newline='') as file:
+            csv.writer(file).writerows([('stop_id', 'date_visited'), *((s, d.isoformat()) for s, d in visited.items())])
+        with open(f'{directory}/{ref.playerdata_file_ev_stops}', 'w', newline='') as file:
+            csv.writer(file).writerows([('stop_id',), *((stop,) for stop in sorted(ev_stops))])
+        with open(f'{directory}/{ref.playerdata_file_terminals}', 'w', newline='') as file:
+            csv.writer(file).writerow(('terminal_id', 'closest_arrival', 'closest_departure'))
+        with open(f'{directory}/{ref.playerdata_file_lines}', 'w', newline='') as file:
+            csv.writer(file).writerows([('line_number', 'date_discovered'),
+                                        *((n, d.isoformat()) for n, d in discovered_lines.items())])
+        with open(f'{directory}/{ref.playerdata_file_vehicles}', 'w', newline='') as file:
+            csv.writer(file).writerows([('vehicle_id', 'date_discovered'),
+                                        *((v, d.isoformat()) for v, d in discovered_vehicles.items())])
+        counts['stop_visits'] += len(visited)
+        counts['ev_stops'] += len(ev_stops)
+        counts['lines'] += len(discovered_lines)
+        counts['vehicles'] += len(discovered_vehicles)
+    return counts
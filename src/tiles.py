@@ -0,0 +1,65 @@
+import json
+import util
+from typing import Any, Iterable
+
+Bounds = tuple[float, float, float, float]  # south, west, north, east
+Feature = tuple[str, list[Any], Bounds]  # layer ('stops', 'markers' or 'paths'), record, bounds
+
+
+def point_bounds(latitude: float, longitude: float) -> Bounds:
+    return latitude, longitude, latitude, longitude
+
+
+def path_bounds(points: Iterable[Any]) -> Bounds:
+    latitudes, longitudes = zip(*((point[0], point[1]) for point in points))
+    return min(latitudes), min(longitudes), max(latitudes), max(longitudes)
+
+
+def __contains__(outer: Bounds, inner: Bounds) -> bool:
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+
+def __quadrants__(bounds: Bounds) -> list[Bounds]:
+    south, west, north, east = bounds
+    latitude, longitude = (south + north) / 2, (west + east) / 2
+    return [(latitude, west, north, longitude), (latitude, longitude, north, east),
+            (south, west, latitude, longitude), (south, longitude, latitude, east)]
+
+
+def build_quadtree(features: list[Feature], capacity: int = 1000, max_depth: int = 8) \
+        -> dict[str, tuple[Bounds, list[Feature]]]:
+    tiles: dict[str, tuple[Bounds, list[Feature]]] = {}
+    if not features:
+        return tiles
+    root: Bounds = (min(f[2][0] for f in features), min(f[2][1] for f in features),
+                    max(f[2][2] for f in features), max(f[2][3] for f in features))
+    pending: list[tuple[str, Bounds, list[Feature]]] = [('r', root, features)]
+    while pending:
+        tile_id, bounds, contained = pending.pop()
+        # a feature stays in the deepest tile that contains it whole, so no feature is ever loaded twice
+        kept: list[Feature] = contained
+        if len(contained) > capacity and len(tile_id) <= max_depth:
+            kept = []
+            children: list[tuple[str, Bounds, list[Feature]]] = [(f'{tile_id}{index}', quadrant, [])
+                                                                 for index, quadrant in enumerate(__quadrants__(bounds))]
+            for feature in contained:
+                child: tuple[str, Bounds, list[Feature]] | None = next(
+                    (c for c in children if __contains__(c[1], feature[2])), None)
+                (child[2] if child is not None else kept).append(feature)
+            pending.extend(child for child in children if child[2])
+        if kept:
+            tiles[tile_id] = (bounds, kept)
+    return tiles
+
+
+def write_tiles(features: list[Feature], directory: str, capacity: int = 1000, max_depth: int = 8) -> dict[str, Any]:
+    util.clear_directory(util.prepare_path(directory, path_is_directory=True))
+    index: dict[str, Any] = {'path': directory, 'tiles': []}
+    for tile_id, (bounds, contained) in sorted(build_quadtree(features, capacity, max_depth).items()):
+        data: dict[str, list[list[Any]]] = {'stops': [], 'markers': [], 'paths': []}
+        for layer, record, _ in contained:
+            data[layer].append(record)
+        with open(f'{directory}/{tile_id}.json', 'w') as file:
+            json.dump(data, file, ensure_ascii=False, separators=(',', ':'))
+        index['tiles'].append([tile_id, *bounds, len(contained)])
+    return index
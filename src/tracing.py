@@ -0,0 +1,100 @@
+import json
+import os
+import ref
+import threading
+import time
+import util
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from datetime import datetime
+from threading import Lock
+from typing import Any, Iterator
+
+# spans go to the traces opened in the same thread or context, so concurrent pipelines do not collect each other's
+__traces__: ContextVar[tuple['Trace', ...]] = ContextVar('traces', default=())
+__retained_traces__: int = 50
+
+
+class Span:
+    def __init__(self, name: str, start: float, duration: float, details: dict[str, Any]):
+        self.name: str = name
+        self.start: float = start
+        self.duration: float = duration
+        self.details: dict[str, Any] = details
+        self.thread_id: int = threading.get_ident()
+        self.thread_name: str = threading.current_thread().name
+
+    def chrome_event(self) -> dict[str, Any]:
+        return {'name': self.name, 'cat': 'stage', 'ph': 'X', 'pid': os.getpid(), 'tid': self.thread_id,
+                'ts': self.start * 1_000_000, 'dur': self.duration * 1_000_000, 'args': self.details}
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.name: str = name
+        self.started: datetime = datetime.now()
+        self.__spans__: list[Span] = []
+        self.__mutex__: Lock = Lock()
+
+    def add(self, span: Span) -> None:
+        with self.__mutex__:
+            self.__spans__.append(span)
+
+    def spans(self) -> list[Span]:
+        with self.__mutex__:
+            return list(self.__spans__)
+
+    def to_chrome(self) -> dict[str, Any]:
+        spans: list[Span] = self.spans()
+        threads: dict[int, str] = {span.thread_id: span.thread_name for span in spans}
+        return {
+            'traceEvents': [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread_id,
+                             'args': {'name': thread_name}} for thread_id, thread_name in threads.items()]
+                           + [span.chrome_event() for span in sorted(spans, key=lambda s: s.start)],
+            'displayTimeUnit': 'ms',
+            'otherData': {'trace': self.name, 'started': self.started.isoformat(timespec='seconds')},
+        }
+
+    def save(self, directory: str = ref.report_traces) -> str:
+        file_name: str = ''.join(c if c.isalnum() or c in '-_' else '_' for c in self.name)
+        output_path: str = f'{directory}/{self.started.strftime("%Y%m%d-%H%M%S")}-{file_name}.json'
+        with open(util.prepare_path(output_path), 'w') as file:
+            json.dump(self.to_chrome(), file)
+        traces: list[str] = sorted(f for f in os.listdir(directory) if f.endswith('.json'))
+        for old_trace in traces[:-__retained_traces__]:
+            os.remove(f'{directory}/{old_trace}')
+        return output_path
+
+
+def add(span: Span) -> None:
+    for active_trace in __traces__.get():
+        active_trace.add(span)
+
+
+def record(name: str, start: float, duration: float, details: dict[str, Any]) -> None:
+    if __traces__.get():
+        add(Span(name, start, duration, details))
+
+
+def __reset_after_fork__() -> None:
+    # traces active in the parent are saved by the parent, a forked worker starts with none
+    __traces__.set(())
+
+
+os.register_at_fork(after_in_child=__reset_after_fork__)
+
+
+@contextmanager
+def trace(name: str, directory: str | None = None) -> Iterator[Trace]:
+    current: Trace = Trace(name)
+    token: Token[tuple[Trace, ...]] = __traces__.set((*__traces__.get(), current))
+    start: float = time.perf_counter()
+    success: bool = False
+    try:
+        yield current
+        success = True
+    finally:
+        current.add(Span(name, start, time.perf_counter() - start, {'success': success}))
+        __traces__.reset(token)
+        if directory is not None:
+            current.save(directory)
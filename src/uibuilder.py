@@ -1,38 +1,99 @@
+import build
 import geo
+import jsdata
+import marshal
 import os.path
 import quantity
+import sys
+import tiles
 import util
 from branca.element import MacroElement
 from data import *
 from database import Database
 from folium import DivIcon, Map, Marker, PolyLine, Popup
-from geo import LineSegment
 from markupsafe import Markup
-from jinja2 import Environment, FileSystemLoader, Template
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+from pipeline import stage
 from player import Player
-from typing import Sequence
+from segments import SegmentClassifier
+from types import CodeType
+from typing import Iterator, MutableMapping, Sequence
+
+MarkerData = tuple[Sequence[float], str, str, int]
+PathData = tuple[Sequence[Sequence[float]], str, int]
 
 
 class JinjaLoader(FileSystemLoader):
-    def __init__(self):
+    def __init__(self, precompiled: str | None = None):
         super().__init__('templates')
+        self.precompiled: str | None = precompiled
+        self.__paths__: dict[str, str] = {}
+        self.__bundle__: dict[str, tuple[str, str, CodeType]] = {}
+        if precompiled is not None and os.path.exists(precompiled):
+            with open(precompiled, 'rb') as file:
+                cache_tag, bundle = marshal.load(file)
+            if cache_tag == sys.implementation.cache_tag:
+                self.__bundle__ = bundle
+
+    def template_path(self, template_id: str) -> str:
+        template_path: str | None = self.__paths__.get(template_id)
+        if template_path is None:
+            template_path = template_id.replace('.', '/')
+            template_path += '/_root.jinja' if os.path.isdir(f'templates/{template_path}') else '.jinja'
+            self.__paths__[template_id] = template_path
+        return template_path
+
+    def template_ids(self) -> list[str]:
+        return [path.removesuffix('.jinja').removesuffix('/_root').replace('/', '.')
+                for path in self.list_templates() if path.endswith('.jinja')]
 
     def get_source(self, environment: Environment, template_id: str) -> tuple[str, str, Callable]:
-        template_path: str = template_id.replace('.', '/')
-        template_path += '/_root.jinja' if os.path.isdir(f'templates/{template_path}') else '.jinja'
-        return super().get_source(environment, template_path)
+        return super().get_source(environment, self.template_path(template_id))
+
+    def load(self, environment: Environment, name: str, globals: MutableMapping[str, Any] | None = None) -> Template:
+        file_name: str = os.path.normpath(f'templates/{self.template_path(name)}')
+        entry: tuple[str, str, CodeType] | None = self.__bundle__.get(name)
+
+        def uptodate() -> bool:
+            return os.path.exists(file_name) and build.file_digest(file_name) == entry[1]
+
+        # precompiled code is used only while the template source it was compiled from is unchanged
+        if entry is None or entry[0] != file_name or not uptodate():
+            return super().load(environment, name, globals)
+        return environment.template_class.from_code(environment, entry[2], globals, uptodate)
+
+    def precompile(self, environment: Environment) -> int:
+        bundle: dict[str, tuple[str, str, CodeType]] = {}
+        for template_id in self.template_ids():
+            source, file_name, _ = self.get_source(environment, template_id)
+            file_name = os.path.normpath(file_name)
+            bundle[template_id] = (file_name, build.file_digest(file_name),
+                                   environment.compile(source, template_id, file_name))
+        with open(util.prepare_path(self.precompiled), 'wb') as file:
+            marshal.dump((sys.implementation.cache_tag, bundle), file)
+        self.__bundle__ = bundle
+        return len(bundle)
 
 
 class UIBuilder(Environment):
-    def __init__(self, database: Database, lexmap_file: str):
-        super().__init__(loader=JinjaLoader())
+    def __init__(self, database: Database, lexmap_file: str, precompiled_templates: str | None = None,
+                 shard_data: bool = False, columnar_data: bool = False):
+        super().__init__(loader=JinjaLoader(precompiled_templates), bytecode_cache=FileSystemBytecodeCache(
+            util.prepare_path(ref.cache_templates_bytecode, path_is_directory=True)))
         self.__lexmap__: dict[str, float] = util.create_lexicographic_mapping(util.file_to_string(lexmap_file))
         self.__database__: Database = database
+        self.shard_data: bool = shard_data
+        self.columnar_data: bool = columnar_data
         self.filters['lexicographic_sort'] = self.__lexicographic_sort__
         self.globals.update(db=database)
         self.globals.update(ref=ref)
         self.globals.update(util=util)
         self.globals.update(include_file=self.__include_file__)
+        self.globals.update(data_shards=jsdata.manifest)
+
+    def use_database(self, database: Database) -> None:
+        self.__database__ = database
+        self.globals.update(db=database)
 
     def __lexicographic_sort__[T](self, sequence: list[T], attribute: str | int | None = None) -> list[T]:
         return sorted(sequence, key=lambda item: util.lexicographic_sequence(self.getitem(item, attribute), self.__lexmap__))
@@ -40,105 +101,115 @@ class UIBuilder(Environment):
     def __include_file__(self, file: str) -> Markup:
         return Markup(self.loader.get_source(self, file)[0])
 
-    def build_fmap(self) -> Map:
+    def create_fmap(self) -> Map:
         documented_visited_stops: list[Stop] = [s for s in self.__database__.stops.values() if s.is_visited(include_ev=False)]
         visible_stops: Iterable[Stop] = documented_visited_stops or self.__database__.stops.values()
         lat = (min(s.location.latitude for s in visible_stops) + max(s.location.latitude for s in visible_stops)) / 2
         lon = (min(s.location.longitude for s in visible_stops) + max(s.location.longitude for s in visible_stops)) / 2
-        fmap: Map = Map(location=[lat, lon], zoom_start=12, prefer_canvas=False, zoom_control='bottomleft')
+        return Map(location=[lat, lon], zoom_start=12, prefer_canvas=False, zoom_control='bottomleft')
+
+    @stage('build_fmap')
+    def build_fmap(self) -> Map:
+        fmap: Map = self.create_fmap()
         log('    Drawing features... ', end='')
-        [marker.add_to(fmap) for marker in self.make_stop_markers()]
-        [line.add_to(fmap) for line in self.make_line_paths()]
-        [marker.add_to(fmap) for marker in self.make_terminal_markers()]
-        [element.add_to(fmap) for element in self.place_raid_markers()]
+        with stage('make_stop_markers'):
+            [marker.add_to(fmap) for marker in self.make_stop_markers()]
+        with stage('make_line_paths'):
+            [line.add_to(fmap) for line in self.make_line_paths()]
+        with stage('make_terminal_markers'):
+            [marker.add_to(fmap) for marker in self.make_terminal_markers()]
+        with stage('place_raid_markers'):
+            [element.add_to(fmap) for element in self.place_raid_markers()]
         log('Done!')
         return fmap
 
-    def make_stop_markers(self) -> Iterable[Marker]:
+    @staticmethod
+    def __folium_marker__(marker: MarkerData) -> Marker:
+        location, icon, popup, anchor = marker
+        return Marker(location=location, popup=Popup(popup), icon=DivIcon(html=icon, icon_anchor=(anchor, 16)))
+
+    @staticmethod
+    def __folium_path__(path: PathData) -> PolyLine:
+        points, class_name, weight = path
+        return PolyLine(locations=[points], class_name=class_name, fill_opacity=0, weight=weight,
+                        bubbling_mouse_events=False)
+
+    def stop_markers(self) -> Iterator[MarkerData]:
         icon_template: Template = self.get_template('map.features.icons.stop')
         popup_template: Template = self.get_template('map.features.popups.stop')
         for stop in self.__database__.stops.values():
-            yield Marker(
-                location=stop.location,
-                popup=Popup(popup_template.render(stop=stop).replace('\n', '')),
-                icon=DivIcon(html=icon_template.render(stop=stop).replace('\n', ''), icon_anchor=(12, 16))
-            )
+            yield (stop.location, icon_template.render(stop=stop).replace('\n', ''),
+                   popup_template.render(stop=stop).replace('\n', ''), 12)
 
-    def make_line_paths(self) -> Iterable[PolyLine]:
-        paths: list[PolyLine] = []
-        already_drawn: set[tuple[LineSegment[geopoint], HashableSet[str]]] = set()
-
-        def draw_line(pts: Sequence[geopoint], cls: HashableSet[str]) -> None:
-            if isinstance(pts, LineSegment) and (pts, cls) in already_drawn:
-                return
-            already_drawn.add((pts, cls)) if isinstance(pts, LineSegment) else None
-            paths.append(PolyLine(locations=[pts], class_name=' '.join(cls),
-                                  fill_opacity=0, bubbling_mouse_events=False))
-
-        for line in [line for line in self.__database__.lines.values() if not line.is_discovered()]:
-            for route in line.routes:
-                draw_line(self.__database__.routes[route].points, HashableSet(('undiscovered',)))
-
-        segments_and_players: dict[LineSegment[geopoint], set[Player]] = defaultdict(set)
-        for line in [line for line in self.__database__.lines.values() if line.is_discovered()]:
-            for route in line.routes:
-                points: list[geopoint] = self.__database__.routes[route].points
-                for i in range(len(points) - 1):
-                    segments_and_players[LineSegment(points[i], points[i + 1])] |= {p for p in self.__database__.players
-                                                                                    if line.discovered_by(p)}
-        for segment, players in segments_and_players.items():
-            draw_line(segment, HashableSet(['disc'] + [f'd-{player.nickname.lower()}' for player in players]))
-
-        segments_and_lines: dict[LineSegment[geopoint], set[Line]] = defaultdict(set)
-        for line in self.__database__.lines.values():
-            for route in line.routes:
-                points: list[geopoint] = self.__database__.routes[route].points
-                for i in range(len(points) - 1):
-                    segments_and_lines[LineSegment(points[i], points[i + 1])].add(line)
-        for segment, lines in segments_and_lines.items():
-            players_who_completed: list[Player] = [p for p in self.__database__.players
-                                                   if all(ln.discovered_by(p) for ln in lines)]
-            if len(players_who_completed) > 0:
-                draw_line(segment, HashableSet(['compl'] + [f'c-{player.nickname.lower()}'
-                                                            for player in players_who_completed]))
-
-        return paths
+    def line_paths(self) -> Iterator[PathData]:
+        classifier: SegmentClassifier = SegmentClassifier(self.__database__.players)
+        for points, class_name in classifier.classify(self.__database__.lines.values(), self.__database__.routes):
+            yield points, class_name, 3
 
-    def make_terminal_markers(self) -> Iterable[Marker]:
+    def terminal_markers(self) -> Iterator[MarkerData]:
         icon_template: Template = self.get_template('map.features.icons.terminal')
         popup_template: Template = self.get_template('map.features.popups.terminal')
         for terminal in self.__database__.terminals:
-            yield Marker(
-                location=(terminal.latitude, terminal.longitude),
-                popup=Popup(popup_template.render(terminal=terminal).replace('\n', '')),
-                icon=DivIcon(html=icon_template.render(terminal=terminal).replace('\n', ''), icon_anchor=(12, 16))
-            )
+            yield ((terminal.latitude, terminal.longitude), icon_template.render(terminal=terminal).replace('\n', ''),
+                   popup_template.render(terminal=terminal).replace('\n', ''), 12)
 
-    def place_raid_markers(self) -> Iterable[MacroElement]:
+    def raid_features(self) -> Iterator[MarkerData | PathData]:
         icon_template: Template = self.get_template('map.features.icons.raid_point')
         popup_template: Template = self.get_template('map.features.popups.raid_point')
-
-        def draw_point(point: RepeatedPointRaidElement, raid_id: str) -> Marker:
-            return Marker(
-                location=point.location,
-                popup=Popup(popup_template.render(point=point, raid_id=raid_id).replace('\n', '')),
-                icon=DivIcon(html=icon_template.render(point=point, raid_id=raid_id).replace('\n', ''),
-                             icon_anchor=(12 * len(point.marker()), 16))
-            )
-
-        def draw_route(route: RouteRaidElement, raid: Raid) -> PolyLine:
-            return PolyLine(locations=[route.shape], class_name=f'raid rtm-{route.transport_method} r-{raid.raid_id}',
-                            fill_opacity=0, weight=3, bubbling_mouse_events=False)
-
         for r in self.__database__.raids:
             for element in r.map_elements:
                 if isinstance(element, RepeatedPointRaidElement):
-                    yield draw_point(element, r.raid_id)
+                    yield (element.location, icon_template.render(point=element, raid_id=r.raid_id).replace('\n', ''),
+                           popup_template.render(point=element, raid_id=r.raid_id).replace('\n', ''),
+                           12 * len(element.marker()))
                 elif isinstance(element, RouteRaidElement):
-                    yield draw_route(element, r)
+                    yield element.shape, f'raid rtm-{element.transport_method} r-{r.raid_id}', 3
                 else:
                     raise ValueError(f'Unsupported raid element type: {element}')
 
+    def make_stop_markers(self) -> Iterable[Marker]:
+        return map(UIBuilder.__folium_marker__, self.stop_markers())
+
+    def make_line_paths(self) -> Iterable[PolyLine]:
+        return list(map(UIBuilder.__folium_path__, self.line_paths()))
+
+    def make_terminal_markers(self) -> Iterable[Marker]:
+        return map(UIBuilder.__folium_marker__, self.terminal_markers())
+
+    def place_raid_markers(self) -> Iterable[MacroElement]:
+        return (UIBuilder.__folium_marker__(feature) if len(feature) == 4 else UIBuilder.__folium_path__(feature)
+                for feature in self.raid_features())
+
+    def map_features(self, lazy_stop_popups: bool = False) -> Iterator[tiles.Feature]:
+        if lazy_stop_popups:  # icons and popups are built in map.js from the stops object of stops_data.min.js
+            for stop in self.__database__.stops.values():
+                yield ('stops', [stop.short_name, stop.marker(), ' '.join(region.short_name for region in stop.regions)],
+                       tiles.point_bounds(*stop.location))
+        for feature in (*(() if lazy_stop_popups else self.stop_markers()), *self.line_paths(),
+                        *self.terminal_markers(), *self.raid_features()):
+            if len(feature) == 4:
+                location, icon, popup, anchor = feature
+                yield 'markers', [*location, icon, popup, anchor], tiles.point_bounds(*location)
+            elif feature[0]:  # raid routes without a shape have nothing to draw
+                points, class_name, weight = feature
+                yield 'paths', [class_name, weight, geo.encode_polyline(points), geo.simplification_ranks(points)], \
+                    tiles.path_bounds(points)
+
+    @stage('compile_map_data')
+    def compile_map_data(self, map_name: str, lazy_stop_popups: bool = False) -> str:
+        data: dict[str, list[Any]] = {'stops': [], 'markers': [], 'paths': [],
+                                      'detail': [zoom for zoom, _ in geo.simplification_bands]}
+        for layer, record, _ in self.map_features(lazy_stop_popups):
+            data[layer].append(record)
+        return f'loadMapData({map_name}, {json.dumps(data, ensure_ascii=False, separators=(',', ':'))});\n'
+
+    @stage('compile_map_tiles')
+    def compile_map_tiles(self, map_name: str, lazy_stop_popups: bool = False) -> str:
+        index: dict[str, Any] = tiles.write_tiles(list(self.map_features(lazy_stop_popups)), ref.mapdata_tiles)
+        index['detail'] = [zoom for zoom, _ in geo.simplification_bands]
+        return f'loadMapTiles({map_name}, {json.dumps(index, separators=(',', ':'))});\n'
+
+    @stage('create_line_maps')
     def create_line_maps(self, all_variants: bool) -> None:
         for line in self.__database__.lines.values():
             variant: int = 0
@@ -153,6 +224,7 @@ class UIBuilder(Environment):
                 geo.create_route_diagram(stops_locations, line.background_color,
                                          f'{ref.mapdata_paths_lines}/{line.number}/{variant}.svg')
 
+    @stage('create_raid_maps')
     def create_raid_maps(self) -> None:
         for raid in self.__database__.raids:
             stops_locations: list[list[geopoint]] = [r.shape for r in raid.routes if r.shape_defined()]
@@ -160,20 +232,41 @@ class UIBuilder(Environment):
 
     def compile_data(self) -> None:
         log('  Compiling data to JavaScript... ', end='')
-        db: Database = self.__database__
-        with open(prepare_path(ref.compileddata_stops), 'w') as file:
-            file.write(f'const stops = {{\n{'\n'.join(map(Stop.json_entry, sorted(db.stops.values())))}\n}};')
-            file.write(f'const terminals = {{\n{'\n'.join(map(Terminal.json_entry, db.terminals))}\n}};')
-        with open(prepare_path(ref.compileddata_vehicles), 'w') as file:
-            file.write(f'const vehicle_models = {{\n{'\n'.join(map(VehicleModel.json_entry, db.models.values()))}\n}};\n')
-            file.write(f'const carriers = {{\n{'\n'.join(map(Carrier.json_entry, db.carriers.values()))}\n}};\n')
-            file.write(f'const vehicles = {{\n{'\n'.join(map(Vehicle.json_entry, db.vehicles.values()))}\n}};')
-        with open(prepare_path(ref.compileddata_lines), 'w') as file:
-            file.write(f'const lines = {{\n{'\n'.join(map(Line.json_entry, db.lines.values()))}\n}};')
-        with open(prepare_path(ref.compileddata_players), 'w') as file:
-            file.write(f'const players = {{\n{'\n'.join(map(Player.json_entry, db.players))}\n}};')
+        self.compile_stops_data()
+        self.compile_vehicles_data()
+        self.compile_lines_data()
+        self.compile_players_data()
         log('Done!')
 
+    @stage('compile_stops_data')
+    def compile_stops_data(self) -> None:
+        db: Database = self.__database__
+        with jsdata.DataWriter(ref.compileddata_stops, self.columnar_data) as writer:
+            writer.write('stops', sorted(db.stops.values()),
+                         shard=(lambda stop: stop.regions[0].short_name if stop.regions else 'other')
+                         if self.shard_data else None)
+            writer.write('terminals', db.terminals)
+
+    @stage('compile_vehicles_data')
+    def compile_vehicles_data(self) -> None:
+        db: Database = self.__database__
+        with jsdata.DataWriter(ref.compileddata_vehicles, self.columnar_data) as writer:
+            writer.write('vehicle_models', db.models.values())
+            writer.write('carriers', db.carriers.values())
+            writer.write('vehicles', db.vehicles.values(),
+                         shard=(lambda vehicle: vehicle.carrier.symbol) if self.shard_data else None)
+
+    @stage('compile_lines_data')
+    def compile_lines_data(self) -> None:
+        with jsdata.DataWriter(ref.compileddata_lines, self.columnar_data) as writer:
+            writer.write('lines', self.__database__.lines.values(),
+                         shard=(lambda line: line.kind()) if self.shard_data else None)
+
+    @stage('compile_players_data')
+    def compile_players_data(self) -> None:
+        with jsdata.DataWriter(ref.compileddata_players, self.columnar_data) as writer:
+            writer.write('players', self.__database__.players)
+
     def create_map(self, initial_html: str) -> Template:
         folium_head: str = re.search(r'<head>(.*)</head>', initial_html, re.DOTALL).group(1).strip()
         folium_body: str = re.search(r'<body>(.*)</body>', initial_html, re.DOTALL).group(1).strip()
@@ -0,0 +1,127 @@
+import api
+import gzip
+from api import CachedResponse, EntryIndex, Page, ResponseCache
+from pathlib import Path
+
+
+def test_cached_response_etag_depends_on_body_and_encoding() -> None:
+    response: CachedResponse = CachedResponse(1, b'{"a":1}')
+    assert response.etag == CachedResponse(2, b'{"a":1}').etag
+    assert response.etag != CachedResponse(1, b'{"a":2}').etag
+    assert response.etag_for(None) == response.etag
+    assert response.etag_for('gzip') == f'{response.etag}-gzip'
+
+
+def test_cached_response_encodes_once() -> None:
+    response: CachedResponse = CachedResponse(1, b'x' * 4096)
+    assert response.encoded(None) is response.body
+    encoded: bytes = response.encoded('gzip')
+    assert encoded is response.encoded('gzip')
+    assert len(encoded) < len(response.body)
+
+
+def test_response_cache_reuses_current_version() -> None:
+    cache: ResponseCache = ResponseCache()
+    calls: list[int] = []
+
+    def producer() -> bytes:
+        calls.append(1)
+        return api.encode_json({'calls': len(calls)})
+
+    first: CachedResponse = cache.get('stops', 1, producer)
+    assert cache.get('stops', 1, producer) is first
+    assert len(calls) == 1
+    assert cache.get('stops', 2, producer).body == b'{"calls":2}'
+    cache.invalidate()
+    assert len(cache) == 0
+    cache.get('stops', 2, producer)
+    assert len(calls) == 3
+
+
+def test_response_cache_evicts_least_recently_used() -> None:
+    cache: ResponseCache = ResponseCache(max_entries=2)
+    cache.get('a', 1, lambda: b'a')
+    cache.get('b', 1, lambda: b'b')
+    cache.get('a', 1, lambda: b'stale')
+    cache.get('c', 1, lambda: b'c')
+    assert len(cache) == 2
+    assert cache.get('a', 1, lambda: b'new').body == b'a'
+    assert cache.get('b', 1, lambda: b'new').body == b'new'
+
+
+def test_response_cache_is_bounded_by_size() -> None:
+    cache: ResponseCache = ResponseCache(max_bytes=10)
+    cache.get('a', 1, lambda: b'x' * 6)
+    cache.get('b', 1, lambda: b'x' * 6)
+    assert len(cache) == 1 and cache.size == 6
+    cache.get('b', 2, lambda: b'x' * 2)
+    assert cache.size == 2
+
+
+def page_keys(index: EntryIndex, limit: int) -> list[list[str]]:
+    pages: list[list[str]] = []
+    cursor: str | None = None
+    while True:
+        page: Page = api.paginate(index, cursor, limit)
+        pages.append([key for key, _ in page.entries])
+        if page.next_cursor is None:
+            return pages
+        cursor = page.next_cursor
+
+
+def test_paginate_mappings_in_key_order() -> None:
+    index: EntryIndex = EntryIndex(api.entries_of({'c': 3, 'a': 1, 'b': 2, 'd': 4, 'e': 5}), True)
+    assert page_keys(index, 2) == [['a', 'b'], ['c', 'd'], ['e']]
+    assert page_keys(index, 5) == [['a', 'b', 'c', 'd', 'e']]
+
+
+def test_paginate_lists_in_their_own_order() -> None:
+    items: list[str] = [f'item{i}' for i in range(12)]
+    index: EntryIndex = EntryIndex(api.entries_of(items), False)
+    pages: list[list[str]] = page_keys(index, 5)
+    assert [index.entries[int(key)][1] for page in pages for key in page] == items
+    assert [len(page) for page in pages] == [5, 5, 2]
+
+
+def test_paginate_resumes_after_removed_entries() -> None:
+    keyed: EntryIndex = EntryIndex(api.entries_of({'a': 1, 'b': 2, 'c': 3, 'd': 4}), True)
+    cursor: str | None = api.paginate(keyed, None, 2).next_cursor
+    keyed = EntryIndex(api.entries_of({'a': 1, 'c': 3, 'd': 4}), True)
+    assert [key for key, _ in api.paginate(keyed, cursor, 2).entries] == ['c', 'd']
+    listed: EntryIndex = EntryIndex([('a', 1), ('b', 2), ('c', 3), ('d', 4)], False)
+    cursor = api.paginate(listed, None, 2).next_cursor
+    listed = EntryIndex([('a', 1), ('c', 3), ('d', 4)], False)
+    assert [key for key, _ in api.paginate(listed, cursor, 2).entries] == ['c', 'd']
+
+
+def test_cursor_round_trip() -> None:
+    assert api.decode_cursor(api.encode_cursor('key:with:colons', 12)) == ('key:with:colons', 12)
+
+
+def test_negotiate_encoding_skips_small_or_unaccepted_bodies() -> None:
+    assert api.negotiate_encoding(None, 4096) is None
+    assert api.negotiate_encoding('gzip', api.compression_threshold - 1) is None
+    assert api.negotiate_encoding('identity', 4096) is None
+    assert api.negotiate_encoding('gzip;q=0', 4096) is None
+
+
+def test_negotiate_encoding_follows_quality() -> None:
+    assert api.negotiate_encoding('gzip', 4096) == 'gzip'
+    assert api.negotiate_encoding('deflate, GZIP;q=0.5', 4096) == 'gzip'
+    assert api.negotiate_encoding('gzip;q=invalid', 4096) is None
+    assert api.negotiate_encoding('*', 4096) in api.compressors
+    assert api.negotiate_encoding('*, gzip;q=0', 4096) != 'gzip'
+
+
+def test_compressed_files_follow_their_source(tmp_path: Path) -> None:
+    path: str = str(tmp_path / 'data.js')
+    with open(path, 'w') as file:
+        file.write('const data = {};\n' * 100)
+    assert api.compression_outdated(path)
+    written: list[str] = api.compress_file(path)
+    assert len(written) == len(api.compressors)
+    assert not api.compression_outdated(path)
+    with open(f'{path}.gz', 'rb') as file:
+        assert gzip.decompress(file.read()) == b'const data = {};\n' * 100
+    assert sorted(api.remove_compressed(path)) == sorted(written)
+    assert api.compression_outdated(path)
@@ -0,0 +1,108 @@
+import build
+import os
+import pytest
+from build import BuildGraph, Node
+from pathlib import Path
+from typing import Any
+
+
+@pytest.fixture(autouse=True)
+def workspace(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def write(path: str, content: str) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(content)
+
+
+def read(path: str) -> str:
+    with open(path, 'r') as file:
+        return file.read()
+
+
+def test_fingerprint_follows_contents_and_parameters() -> None:
+    write('raw/a.csv', 'a')
+    write('raw/b.csv', 'b')
+    first: str = build.fingerprint(['raw/*.csv'])
+    assert build.fingerprint(['raw/b.csv', 'raw/a.csv']) == first
+    assert build.fingerprint(['raw/*.csv'], {'flag': 'True'}) != first
+    write('raw/a.csv', 'changed')
+    assert build.fingerprint(['raw/*.csv']) != first
+    write('raw/a.csv', 'a')
+    assert build.fingerprint(['raw/*.csv']) == first
+    write('raw/c.csv', 'c')
+    assert build.fingerprint(['raw/*.csv']) != first
+
+
+def copy_node(name: str, source: str, target: str, runs: list[str], **options: Any) -> Node:
+    def action() -> None:
+        runs.append(name)
+        write(target, read(source).strip().upper())
+
+    return Node(name, [source], [target], action, **options)
+
+
+def test_build_skips_current_outputs() -> None:
+    runs: list[str] = []
+    write('raw/data.txt', 'stops')
+    graph: BuildGraph = BuildGraph('state.json', [copy_node('data', 'raw/data.txt', 'out/data.txt', runs)])
+    assert graph.build('data') == {'rebuilt': ['data'], 'skipped': []}
+    assert graph.build('data') == {'rebuilt': [], 'skipped': ['data']}
+    assert BuildGraph('state.json', list(graph.nodes.values())).build('data')['skipped'] == ['data']
+    write('raw/data.txt', 'stops and lines')
+    assert graph.build('data')['rebuilt'] == ['data']
+    os.remove('out/data.txt')
+    assert graph.build('data')['rebuilt'] == ['data']
+    write('out/data.txt', 'edited')
+    assert graph.build('data')['rebuilt'] == ['data']
+    assert runs == ['data'] * 4 and read('out/data.txt') == 'STOPS AND LINES'
+
+
+def test_build_follows_parameters_and_state() -> None:
+    runs: list[str] = []
+    write('raw/data.txt', 'stops')
+    options: dict[str, str] = {'columnar': 'False'}
+    state: list[str] = ['1']
+    graph: BuildGraph = BuildGraph('state.json', [copy_node('data', 'raw/data.txt', 'out/data.txt', runs,
+                                                            parameters=options, state=lambda: state[0])])
+    graph.build('data')
+    options['columnar'] = 'True'
+    assert graph.build('data')['rebuilt'] == ['data']
+    state[0] = '2'
+    assert graph.build('data')['rebuilt'] == ['data']
+    assert graph.build('data')['skipped'] == ['data']
+
+
+def test_build_rebuilds_dependents_of_changed_outputs() -> None:
+    runs: list[str] = []
+    write('raw/data.txt', 'stops')
+    graph: BuildGraph = BuildGraph('state.json', [
+        copy_node('document', 'out/data.txt', 'out/document.txt', runs, dependencies=['data']),
+        copy_node('data', 'raw/data.txt', 'out/data.txt', runs),
+    ])
+    assert graph.build('document')['rebuilt'] == ['data', 'document']
+    write('raw/data.txt', 'stops\n')
+    # the data is rebuilt to the same output, so the document is still current
+    assert graph.build('document') == {'rebuilt': ['data'], 'skipped': ['document']}
+    write('raw/data.txt', 'stops and lines')
+    assert graph.build('document')['rebuilt'] == ['data', 'document']
+    assert runs == ['data', 'document', 'data', 'data', 'document']
+
+
+def test_build_reports_failures_and_cycles() -> None:
+    write('raw/data.txt', 'stops')
+
+    def fail() -> None:
+        raise RuntimeError('broken')
+
+    graph: BuildGraph = BuildGraph('state.json', [Node('data', ['raw/data.txt'], ['out/data.txt'], fail)])
+    with build.collect() as report, pytest.raises(RuntimeError):
+        graph.build('data')
+    assert report == {'rebuilt': [], 'skipped': []}
+    cyclic: BuildGraph = BuildGraph('cycle.json', [Node('a', [], [], lambda: None, dependencies=['b']),
+                                                  Node('b', [], [], lambda: None, dependencies=['a'])])
+    with pytest.raises(ValueError, match='a -> b -> a'):
+        cyclic.build('a')
@@ -0,0 +1,97 @@
+from api import Collection
+from changes import ChangeFeed
+from log import error_log
+from typing import Any, Callable
+
+
+def collection(data: dict[str, int]) -> Collection:
+    return Collection(lambda: data, lambda value: {'value': value})
+
+
+def counter(start: int) -> Callable[[], int]:
+    versions: list[int] = [start]
+
+    def next_version() -> int:
+        versions[0] += 1
+        return versions[0]
+
+    return next_version
+
+
+def test_since_returns_added_changed_and_removed_entities() -> None:
+    stops: dict[str, int] = {'a': 1, 'b': 2}
+    collections: dict[str, Collection] = {'stops': collection(stops)}
+    feed: ChangeFeed = ChangeFeed(collections, 1)
+    next_version: Callable[[], int] = counter(1)
+    stops.update(b=3, c=4)
+    del stops['a']
+    feed.record(collections, next_version)
+    delta: dict[str, Any] = feed.since(1)
+    assert delta['version'] == 2 and not delta['full']
+    assert delta['collections'] == {'stops': {'version': 2, 'added': {'c': {'value': 4}},
+                                              'changed': {'b': {'value': 3}}, 'removed': ['a']}}
+    assert feed.since(2) == {'version': 2, 'full': False, 'collections': {}}
+
+
+def test_since_collapses_changes_of_an_entity() -> None:
+    stops: dict[str, int] = {'a': 1}
+    collections: dict[str, Collection] = {'stops': collection(stops)}
+    feed: ChangeFeed = ChangeFeed(collections, 1)
+    next_version: Callable[[], int] = counter(1)
+    stops['b'] = 2
+    feed.record(collections, next_version)
+    del stops['b']
+    del stops['a']
+    feed.record(collections, next_version)
+    stops['a'] = 5
+    feed.record(collections, next_version)
+    assert feed.since(1)['collections'] == {'stops': {'version': 4, 'added': {}, 'changed': {'a': {'value': 5}},
+                                                      'removed': []}}
+
+
+def test_since_falls_back_to_a_snapshot() -> None:
+    stops: dict[str, int] = {'a': 1}
+    collections: dict[str, Collection] = {'stops': collection(stops), 'lines': collection({'1': 1})}
+    feed: ChangeFeed = ChangeFeed(collections, 1, capacity=2)
+    next_version: Callable[[], int] = counter(1)
+    for value in range(3):
+        stops['a'] = value + 10
+        feed.record(collections, next_version)
+    assert feed.since(None)['full']
+    assert feed.since(99)['full']
+    assert feed.since(1)['full']
+    assert not feed.since(feed.origin)['full']
+    snapshot: dict[str, Any] = feed.since(None, {'lines'})
+    assert snapshot['collections'] == {'lines': {'version': 1, 'entities': {'1': {'value': 1}}}}
+
+
+def test_since_filters_collections() -> None:
+    stops: dict[str, int] = {}
+    lines: dict[str, int] = {}
+    collections: dict[str, Collection] = {'stops': collection(stops), 'lines': collection(lines)}
+    feed: ChangeFeed = ChangeFeed(collections, 1)
+    stops['a'] = 1
+    lines['1'] = 1
+    feed.record(collections, counter(1))
+    assert set(feed.since(1, {'lines'})['collections']) == {'lines'}
+
+
+def test_failing_collection_keeps_its_last_snapshot() -> None:
+    stops: dict[str, int] = {'a': 1}
+    collections: dict[str, Collection] = {'stops': collection(stops)}
+    feed: ChangeFeed = ChangeFeed(collections, 1)
+    with error_log() as errors:
+        feed.record({'stops': Collection(lambda: 1 / 0, lambda value: value)}, counter(1))
+    assert len(errors) == 1 and 'ZeroDivisionError' in errors[0]
+    assert feed.since(1)['collections'] == {}
+    assert feed.snapshot()['collections']['stops']['entities'] == {'a': {'value': 1}}
+
+
+def test_partial_record_keeps_other_collections() -> None:
+    stops: dict[str, int] = {'a': 1}
+    lines: dict[str, int] = {'1': 1}
+    feed: ChangeFeed = ChangeFeed({'stops': collection(stops), 'lines': collection(lines)}, 1)
+    stops['a'] = 2
+    feed.record({'stops': collection(stops)}, counter(1), complete=False)
+    assert set(feed.snapshot()['collections']) == {'stops', 'lines'}
+    assert feed.versions == {'stops': 2, 'lines': 1}
@@ -0,0 +1,50 @@
+import geo
+import random
+from math import cos, radians
+
+
+def offset(meters: float) -> float:
+    return meters / 110_574
+
+
+def test_simplification_ranks_follow_the_bands() -> None:
+    assert geo.simplification_ranks([(0, 0), (0, 0.001)]) == '00'
+    for meters, rank in ((100, '0'), (20, '1'), (5, '2'), (1, '3')):
+        assert geo.simplification_ranks([(0, 0), (offset(meters), 0.001), (0, 0.002)]) == f'0{rank}0'
+
+
+def douglas_peucker(xy: list[tuple[float, float]], first: int, last: int, tolerance: float) -> set[int]:
+    if last - first < 2:
+        return set()
+    distance, index = max((geo.__segment_distance__(xy[i], xy[first], xy[last]), i) for i in range(first + 1, last))
+    if distance <= tolerance:
+        return set()
+    return {index} | douglas_peucker(xy, first, index, tolerance) | douglas_peucker(xy, index, last, tolerance)
+
+
+def test_simplification_ranks_match_douglas_peucker_at_every_band() -> None:
+    generator: random.Random = random.Random(0)
+    for _ in range(20):
+        points: list[tuple[float, float]] = [(52.4 + generator.uniform(-0.0005, 0.0005), 16.9 + i * 0.0003)
+                                             for i in range(60)]
+        scale: float = 111_320 * cos(radians(sum(point[0] for point in points) / len(points)))
+        xy: list[tuple[float, float]] = [(point[1] * scale, point[0] * 110_574) for point in points]
+        ranks: str = geo.simplification_ranks(points)
+        for band, (_, tolerance) in enumerate(geo.simplification_bands):
+            kept: set[int] = {0, len(points) - 1} | douglas_peucker(xy, 0, len(points) - 1, tolerance)
+            assert {i for i, rank in enumerate(ranks) if int(rank) <= band} == kept
+
+
+def test_encode_polyline_matches_the_reference_example() -> None:
+    points: list[tuple[float, float]] = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    assert geo.encode_polyline(points, precision=5) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+    assert [tuple(point) for point in geo.decode_polyline('_p~iF~ps|U_ulLnnqC_mqNvxq`@', precision=5)] == points
+
+
+def test_polyline_round_trip() -> None:
+    generator: random.Random = random.Random(0)
+    points: list[tuple[float, float]] = [(round(generator.uniform(-90, 90), 6), round(generator.uniform(-180, 180), 6))
+                                         for _ in range(200)]
+    decoded: list[geo.geopoint] = geo.decode_polyline(geo.encode_polyline(points))
+    assert [(round(point.latitude, 6), round(point.longitude, 6)) for point in decoded] == points
+    assert geo.encode_polyline([]) == '' and geo.decode_polyline('') == []
@@ -0,0 +1,110 @@
+import json
+import jsdata
+import os
+import pytest
+import shutil
+import subprocess
+from data import JsonSerializable
+from jsdata import ColumnarTable, DataWriter
+from pathlib import Path
+from typing import Any
+
+node: str | None = shutil.which('node')
+
+
+class Entry(JsonSerializable):
+    def __init__(self, key: str, **record: Any):
+        self.key: str = key
+        self.record: dict[str, Any] = record
+
+    def __json_entry__(self) -> tuple[str, dict[str, Any]]:
+        return self.key, self.record
+
+
+def evaluate(paths: list[str], *names: str, run: str = '') -> dict[str, Any]:
+    scripts: list[str] = []
+    for path in paths:
+        with open(path, 'r') as file:
+            scripts.append(file.read())
+    script: str = '\n'.join([*scripts, run, f'console.log(JSON.stringify({{{', '.join(names)}}}));'])
+    return json.loads(subprocess.run([node, '-e', script], capture_output=True, text=True, check=True).stdout)
+
+
+entries: list[Entry] = [
+    Entry('plain', n='Rondo Kaponiera', l=[['1', 'Os. Sobieskiego']], v=None),
+    Entry('quote"s', n="it's \"quoted\" \\ and\nbroken", l=[]),
+    Entry('separators', n='line\u2028paragraph\u2029end', z='ż</script>'),
+]
+
+
+def test_data_writer_escapes_entries(tmp_path: Path) -> None:
+    path: str = str(tmp_path / 'stops_data.min.js')
+    with DataWriter(path) as writer:
+        writer.write('stops', entries)
+    with open(path, 'r') as file:
+        text: str = file.read()
+    assert '\u2028' not in text and '\u2029' not in text
+    if node is None:
+        pytest.skip('node is not available')
+    assert evaluate([path], 'stops') == {'stops': {entry.key: entry.record for entry in entries}}
+
+
+def test_data_writer_shards_entries(tmp_path: Path) -> None:
+    path: str = str(tmp_path / 'stops_data.min.js')
+    with DataWriter(path) as writer:
+        writer.write('stops', entries, shard=lambda entry: 'odd/one' if entry.key == 'plain' else 'rest')
+        writer.write('lines', [Entry('1', k='tram')])
+    manifest: dict[str, dict[str, str]] = jsdata.manifest(path)
+    assert manifest == {'stops': {'odd_one': f'{tmp_path}/stops_data/stops-odd_one.min.js',
+                                  'rest': f'{tmp_path}/stops_data/stops-rest.min.js'}}
+    if node is not None:
+        assert evaluate([path, *manifest['stops'].values()], 'stops', 'lines') == {
+            'stops': {entry.key: entry.record for entry in entries}, 'lines': {'1': {'k': 'tram'}}}
+    with DataWriter(path) as writer:
+        writer.write('stops', entries)
+    assert jsdata.manifest(path) == {}
+    assert os.listdir(jsdata.shard_directory(path)) == []
+
+
+def test_manifest_merges_data_files(tmp_path: Path) -> None:
+    stops, lines = str(tmp_path / 'stops_data.min.js'), str(tmp_path / 'lines_data.min.js')
+    assert jsdata.manifest(stops, lines) == {}
+    with DataWriter(stops) as writer:
+        writer.write('stops', entries, shard=lambda entry: 'all')
+    with DataWriter(lines) as writer:
+        writer.write('lines', [Entry('1', k='tram')], shard=lambda entry: entry.record['k'])
+    assert set(jsdata.manifest(stops, lines)) == {'stops', 'lines'}
+
+
+common_script: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'scripts',
+                                  'common.js')
+
+
+def present(record: dict[str, Any]) -> dict[str, Any]:
+    return {field: value for field, value in record.items() if value is not None}
+
+
+def test_columnar_table_interns_repeated_strings() -> None:
+    table: ColumnarTable = ColumnarTable()
+    for index in range(20):
+        table.add('vehicles', str(index), {'c': 'MPK Poznań', 'm': f'model {index}', 'p': None})
+    script: str = table.script()
+    assert script.count('MPK Poznań') == 1
+    assert table.strings == ['MPK Poznań']
+    assert table.intern(['MPK Poznań', 'new', ['new']]) == [0, 1, [1]]
+
+
+def test_columnar_data_decodes_to_the_records(tmp_path: Path) -> None:
+    if node is None:
+        pytest.skip('node is not available')
+    path: str = str(tmp_path / 'stops_data.min.js')
+    stops: list[Entry] = [*entries, *(Entry(f'{index}', n=f'Stop {index % 3}', l=[['1', 'Dębiec'], ['2', 'Górczyn']],
+                                             v=[['Zorie', '2024-01-01']] if index % 2 else None)
+                                       for index in range(40))]
+    with DataWriter(path, columnar=True) as writer:
+        writer.write('stops', stops, shard=lambda entry: 'even' if entry.key[-1] in '02468' else 'other')
+        writer.write('lines', [Entry('1', k='tram', t=None), Entry('2', k='tram', t='Junikowo')])
+    shards: list[str] = list(jsdata.manifest(path)['stops'].values())
+    assert evaluate([path, *shards, common_script], 'stops', 'lines', run='decodeColumnarData();') == {
+        'stops': {entry.key: present(entry.record) for entry in stops},
+        'lines': {'1': {'k': 'tram'}, '2': {'k': 'tram', 't': 'Junikowo'}}}
@@ -0,0 +1,65 @@
+from data import Route
+from geo import geopoint
+from segments import SegmentClassifier, assemble_chains
+from types import SimpleNamespace
+from typing import Any, Sequence
+
+
+def player(nickname: str) -> Any:
+    return SimpleNamespace(nickname=nickname)
+
+
+def line(routes: list[str], *discoverers: Any) -> Any:
+    discoveries: list[Any] = [SimpleNamespace(item=discoverer) for discoverer in discoverers]
+    return SimpleNamespace(routes=routes, discoveries=discoveries, is_discovered=lambda: bool(discoveries))
+
+
+def route(route_id: str, *points: tuple[float, float]) -> Route:
+    return Route(route_id, [geopoint(*point) for point in points])
+
+
+def paths(classified: Sequence[tuple[Sequence[geopoint], str]]) -> dict[str, list[list[tuple[float, float]]]]:
+    by_class: dict[str, list[list[tuple[float, float]]]] = {}
+    for points, class_name in classified:
+        by_class.setdefault(class_name, []).append([(point.latitude, point.longitude) for point in points])
+    return {class_name: sorted(chains) for class_name, chains in by_class.items()}
+
+
+def test_classify_combines_discoverers_per_segment() -> None:
+    ann, bob = player('Ann'), player('Bob')
+    routes: dict[str, Route] = {'r1': route('r1', (0, 0), (0, 1), (0, 2)),
+                                'r2': route('r2', (0, 1), (0, 2), (0, 3)),
+                                'r3': route('r3', (5, 5), (5, 6))}
+    lines: list[Any] = [line(['r1'], ann, bob), line(['r2'], ann), line(['r3'])]
+    assert paths(list(SegmentClassifier([ann, bob]).classify(lines, routes))) == {
+        'undiscovered': [[(5, 5), (5, 6)]],
+        'd-ann d-bob disc': [[(0, 0), (0, 1), (0, 2)]],
+        'd-ann disc': [[(0, 2), (0, 3)]],
+        'c-ann c-bob compl': [[(0, 0), (0, 1)]],
+        'c-ann compl': [[(0, 1), (0, 2), (0, 3)]],
+    }
+
+
+def test_classify_without_merging_yields_segments() -> None:
+    ann = player('Ann')
+    routes: dict[str, Route] = {'r1': route('r1', (0, 0), (0, 1), (0, 2))}
+    classified: dict[str, list[list[tuple[float, float]]]] = paths(list(
+        SegmentClassifier([ann]).classify([line(['r1'], ann)], routes, merge=False)))
+    assert classified == {'d-ann disc': [[(0, 0), (0, 1)], [(0, 1), (0, 2)]],
+                          'c-ann compl': [[(0, 0), (0, 1)], [(0, 1), (0, 2)]]}
+
+
+def test_discoverers_ignore_unknown_players() -> None:
+    ann, bob = player('Ann'), player('Bob')
+    classifier: SegmentClassifier = SegmentClassifier([ann, bob])
+    assert classifier.discoverers(line([], bob, player('Eve'))) == 0b10
+    assert classifier.class_name('disc', 0b11) == 'd-ann d-bob disc'
+    assert classifier.class_name('disc', 0) == 'disc'
+
+
+def test_assemble_chains_splits_at_junctions_and_closes_loops() -> None:
+    branches: list[tuple[float, float, float, float]] = [(0, 0, 0, 1), (0, 1, 0, 2), (0, 1, 1, 1), (1, 1, 2, 1)]
+    assert sorted(sorted(chain) for chain in assemble_chains(branches)) == [
+        [(0, 0), (0, 1)], [(0, 1), (0, 2)], [(0, 1), (1, 1), (2, 1)]]
+    loop: list[list[tuple[float, float]]] = list(assemble_chains([(0, 0, 0, 1), (0, 1, 1, 1), (0, 0, 1, 1)]))
+    assert len(loop) == 1 and len(loop[0]) == 4 and loop[0][0] == loop[0][-1]
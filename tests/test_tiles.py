@@ -0,0 +1,57 @@
+import json
+import os
+import random
+import tiles
+from pathlib import Path
+from tiles import Bounds, Feature
+from typing import Any
+
+
+def point(latitude: float, longitude: float, name: str = '') -> Feature:
+    return 'markers', [latitude, longitude, name], tiles.point_bounds(latitude, longitude)
+
+
+def contains(outer: Bounds, inner: Bounds) -> bool:
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+
+def test_build_quadtree_keeps_small_sets_in_the_root() -> None:
+    assert tiles.build_quadtree([]) == {}
+    features: list[Feature] = [point(0, 0), point(1, 1)]
+    assert tiles.build_quadtree(features, capacity=2) == {'r': ((0, 0, 1, 1), features)}
+
+
+def test_build_quadtree_places_every_feature_once() -> None:
+    generator: random.Random = random.Random(0)
+    features: list[Feature] = [point(generator.uniform(52, 53), generator.uniform(16, 17), str(i)) for i in range(500)]
+    path: list[tuple[float, float]] = [(52.1, 16.1), (52.9, 16.9)]
+    features.append(('paths', ['across'], tiles.path_bounds(path)))
+    quadtree: dict[str, tuple[Bounds, list[Feature]]] = tiles.build_quadtree(features, capacity=50)
+    placed: list[Feature] = [feature for _, contained in quadtree.values() for feature in contained]
+    assert sorted(map(str, placed)) == sorted(map(str, features))
+    for tile_id, (bounds, contained) in quadtree.items():
+        assert all(contains(bounds, feature[2]) for feature in contained)
+        assert len(contained) <= 50 or tile_id == 'r'
+    # a path crossing the middle of the root fits in none of its quadrants
+    assert ('paths', ['across'], tiles.path_bounds(path)) in quadtree['r'][1]
+
+
+def test_build_quadtree_stops_at_the_maximum_depth() -> None:
+    features: list[Feature] = [point(0, 0), point(1, 1), *(point(0.1, 0.1) for _ in range(10))]
+    quadtree: dict[str, tuple[Bounds, list[Feature]]] = tiles.build_quadtree(features, capacity=4, max_depth=3)
+    assert max(map(len, quadtree)) == 4
+    assert sum(len(contained) for _, contained in quadtree.values()) == len(features)
+
+
+def test_write_tiles_writes_one_file_per_tile(tmp_path: Path) -> None:
+    directory: str = str(tmp_path / 'tiles')
+    os.makedirs(directory)
+    with open(f'{directory}/stale.json', 'w') as file:
+        file.write('{}')
+    features: list[Feature] = [point(0, 0), point(1, 1), ('stops', ['s'], tiles.point_bounds(0.9, 0.9))]
+    index: dict[str, Any] = tiles.write_tiles(features, directory, capacity=2)
+    assert index['path'] == directory
+    assert sorted(os.listdir(directory)) == sorted(f'{tile[0]}.json' for tile in index['tiles'])
+    assert sum(tile[-1] for tile in index['tiles']) == len(features)
+    with open(f'{directory}/{index["tiles"][0][0]}.json') as file:
+        assert set(json.load(file)) == {'stops', 'markers', 'paths'}